@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Subject, Deck, Card
+from .models import Subject, Deck, Card, CardImage, CardSchedule
+from .search import filter_cards
 
 
 class CardInline(admin.TabularInline):
@@ -38,8 +39,33 @@ class CardAdmin(admin.ModelAdmin):
     list_filter = ('deck', 'created_at')
     search_fields = ('question', 'answer', 'deck__name')
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Searches cards through the full-text index instead of scanning
+        the question, answer and deck name of every card.
+        """
+        return filter_cards(queryset, search_term), False
+
+
+class CardScheduleAdmin(admin.ModelAdmin):
+    """
+    Customizes the admin interface for CardSchedule objects.
+    """
+    list_display = ('card', 'user', 'due_at', 'interval', 'ease')
+    list_filter = ('user', 'due_at')
+
+
+class CardImageAdmin(admin.ModelAdmin):
+    """
+    Customizes the admin interface for CardImage objects.
+    """
+    list_display = ('name', 'ref_count', 'created_at')
+    search_fields = ('digest', 'name')
+
 
 # Register models with their respective admin class.
 admin.site.register(Subject, SubjectAdmin)
 admin.site.register(Deck, DeckAdmin)
 admin.site.register(Card, CardAdmin)
+admin.site.register(CardSchedule, CardScheduleAdmin)
+admin.site.register(CardImage, CardImageAdmin)
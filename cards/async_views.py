@@ -0,0 +1,91 @@
+"""
+Async variants of the read-heavy views, served by flashcards/asgi.py.
+
+Under an ASGI server these views wait for the database and the cache
+without holding a worker: the ORM and cache calls run in a thread of
+their own per request while the event loop serves other requests. Pages
+are rendered in a thread as well, since templates read the user's profile
+lazily. The views answer exactly like their sync counterparts in
+cards/views.py, which keep serving the WSGI deployment.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from .conditional import conditional_page, deck_updated_at
+from .models import Deck
+from .views import (
+    quiz_cache_entry,
+    quiz_cache_key,
+    quiz_cursor,
+    quiz_page_cards,
+    quiz_page_data,
+    quiz_response,
+)
+
+
+def login_required(view):
+    """
+    Async counterpart of django.contrib.auth.decorators.login_required.
+
+    The user is loaded from the session in a thread, later uses of
+    `request.user` then read the loaded user.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(
+            lambda: request.user.is_authenticated
+        )()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def get_deck(request, deck_id):
+    """
+    Returns a deck of the current user, or raises Http404.
+    """
+    try:
+        return await Deck.objects.for_user(request.user).aget(pk=deck_id)
+    except Deck.DoesNotExist:
+        raise Http404('No Deck matches the given query.')
+
+
+# Deck Details
+@login_required
+@conditional_page(deck_updated_at)
+async def deck_detail(request, deck_id):
+    """
+    Display the details of a specific deck, see views.deck_detail.
+    """
+    deck = await get_deck(request, deck_id)
+    return await sync_to_async(render)(
+        request,
+        'cards/deck_detail.html',
+        {'deck': deck, 'num_cards': deck.card_count}
+    )
+
+
+# Quiz card stream
+@login_required
+async def quiz_cards(request, deck_id):
+    """
+    Returns a page of the deck's cards as JSON for the quiz client, see
+    views.quiz_cards.
+    """
+    deck = await get_deck(request, deck_id)
+    try:
+        after, limit = quiz_cursor(request)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    key = quiz_cache_key(request, deck, after, limit)
+    entry = await cache.aget(key)
+    if entry is None:
+        cards = [card async for card in quiz_page_cards(deck, after, limit)]
+        entry = quiz_cache_entry(quiz_page_data(request, deck, cards, limit))
+        await cache.aset(key, entry, settings.QUIZ_CACHE_TIMEOUT)
+    return quiz_response(request, entry)
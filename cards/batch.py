@@ -0,0 +1,122 @@
+"""
+Batch operations on a selection of cards.
+
+Each operation runs a fixed number of set-based queries in one transaction,
+however many cards are selected, and keeps the deck counters, the deck
+revisions and the image reference counts up to date.
+"""
+from django.db import transaction
+from django.utils import timezone
+from .models import (
+    Card, CardImage, CardSchedule, adjust_card_count, bump_deck_revision
+)
+
+
+def delete_cards(deck, cards):
+    """
+    Deletes cards of a deck.
+
+    Arguments:
+        deck (Deck): The deck holding the cards.
+        cards (QuerySet): The cards to delete.
+
+    Returns:
+        int: The number of deleted cards.
+    """
+    with transaction.atomic():
+        released = CardImage.objects.references(cards)
+        _, deleted = cards.delete()
+        count = deleted.get(Card._meta.label, 0)
+        adjust_card_count(deck.pk, -count)
+    CardImage.objects.release(released)
+    return count
+
+
+def move_cards(deck, cards, target):
+    """
+    Moves cards of a deck to another deck, keeping their review schedules.
+
+    Arguments:
+        deck (Deck): The deck holding the cards.
+        cards (QuerySet): The cards to move.
+        target (Deck): The deck receiving the cards.
+
+    Returns:
+        int: The number of moved cards.
+    """
+    with transaction.atomic():
+        # Before the cards, which then no longer match the selection
+        CardSchedule.objects.filter(card__in=cards).update(deck=target)
+        count = cards.update(deck=target, updated_at=timezone.now())
+        adjust_card_count(deck.pk, -count)
+        adjust_card_count(target.pk, count)
+    return count
+
+
+def copy_cards(cards, target):
+    """
+    Copies cards to a deck, sharing their stored images. The copies are
+    new cards, without review schedules.
+
+    Arguments:
+        cards (QuerySet): The cards to copy, with their images converted.
+        target (Deck): The deck receiving the copies.
+
+    Returns:
+        int: The number of copied cards.
+    """
+    fields = [
+        field.attname for field in Card._meta.concrete_fields
+        if field.attname not in (
+            'id', 'deck_id', 'created_at', 'updated_at', 'scheduled'
+        )
+    ]
+    now = timezone.now()
+    with transaction.atomic():
+        copies = [
+            Card(deck=target, created_at=now, **values)
+            for values in cards.order_by('id').values(*fields)
+        ]
+        Card.objects.bulk_create(copies)
+        CardImage.objects.retain(CardImage.objects.references(cards))
+        adjust_card_count(target.pk, len(copies))
+    return len(copies)
+
+
+def clear_card_images(deck, cards):
+    """
+    Removes the images of cards of a deck. An image is only removed from a
+    side that has text, so every card keeps a question and an answer.
+
+    Arguments:
+        deck (Deck): The deck holding the cards.
+        cards (QuerySet): The cards to clear.
+
+    Returns:
+        int: The number of removed images.
+    """
+    released = []
+    cleared = 0
+    now = timezone.now()
+    with transaction.atomic():
+        for field_name, text_field in (
+            ('question_image', 'question'),
+            ('answer_image', 'answer'),
+        ):
+            with_text = cards.exclude(**{text_field: ''}).exclude(
+                **{field_name: ''}
+            ).filter(**{field_name + '__isnull': False})
+            released.append(
+                CardImage.objects.references(with_text, (field_name,))
+            )
+            cleared += with_text.update(**{
+                field_name: '',
+                field_name + '_variants': [],
+                field_name + '_ref': None,
+                'updated_at': now,
+            })
+        if cleared:
+            bump_deck_revision(deck.pk)
+    for counts in released:
+        CardImage.objects.release(counts)
+    return cleared
@@ -0,0 +1,130 @@
+"""
+Conditional GET support for pages showing a single subject or deck.
+
+A page's validators are derived from the `updated_at` of the object it
+shows and from what else the page renders for the current user, so a
+browser revisiting an unchanged page gets a 304 without the view running.
+"""
+import hashlib
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+from .models import Subject, Deck
+
+
+def conditional_page(lookup):
+    """
+    Decorator answering conditional GETs of a page from the modification
+    time of the object it shows.
+
+    Requests with a query string and requests with pending messages always
+    get a full response, since their content does not depend on the object
+    only. Responses must be revalidated before every use.
+
+    Async views are supported, the validators are then computed in a
+    thread since they read the session and the user's profile.
+
+    Arguments:
+        lookup (callable): Called with the view's arguments, returns the
+            `updated_at` of the object the user may see, or None.
+    """
+    def updated_at(request, *args, **kwargs):
+        # The validators are computed twice, look the object up once
+        if not hasattr(request, '_page_updated_at'):
+            modified = None
+            if not request.GET and not len(messages.get_messages(request)):
+                modified = lookup(request, *args, **kwargs)
+            request._page_updated_at = modified
+        return request._page_updated_at
+
+    def etag(request, *args, **kwargs):
+        modified = updated_at(request, *args, **kwargs)
+        if modified is None:
+            return None
+        # The navbar and the forms of the page depend on the user
+        parts = (
+            modified.isoformat(),
+            str(request.user.pk),
+            request.user.profile.image.name,
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        )
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:32]
+
+    def validators(request, *args, **kwargs):
+        modified = updated_at(request, *args, **kwargs)
+        return etag(request, *args, **kwargs), modified
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return async_conditional(view, validators)
+        conditional_view = condition(
+            etag_func=etag,
+            last_modified_func=updated_at
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def async_conditional(view, validators):
+    """
+    Wraps an async view like django.views.decorators.http.condition, which
+    only supports sync views in this version of Django.
+
+    Arguments:
+        view (callable): The async view.
+        validators (callable): Called with the view's arguments, returns
+            the ETag and the modification time of the page, or None.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        res_etag, modified = await sync_to_async(validators)(
+            request, *args, **kwargs
+        )
+        if res_etag is not None:
+            res_etag = quote_etag(res_etag)
+        last_modified = None
+        if modified is not None:
+            last_modified = int(modified.timestamp())
+        response = get_conditional_response(
+            request,
+            etag=res_etag,
+            last_modified=last_modified
+        )
+        if response is None:
+            response = await view(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if res_etag:
+                response.headers.setdefault('ETag', res_etag)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
+
+
+def subject_updated_at(request, subject_id):
+    """
+    Returns when a subject of the current user last changed.
+    """
+    return Subject.objects.for_user(request.user).filter(
+        pk=subject_id
+    ).values_list('updated_at', flat=True).first()
+
+
+def deck_updated_at(request, deck_id):
+    """
+    Returns when a deck of the current user last changed.
+    """
+    return Deck.objects.for_user(request.user).filter(
+        pk=deck_id
+    ).values_list('updated_at', flat=True).first()
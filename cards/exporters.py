@@ -0,0 +1,197 @@
+"""
+Streaming export of cards to CSV, JSON Lines and zip archives.
+
+Cards are read with a server-side cursor in fixed-size chunks and written
+out as they are read, and images are copied from storage into archives in
+chunks, so the memory used by an export does not depend on the number of
+cards or the size of their images.
+"""
+import csv
+import io
+import json
+import zipfile
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
+from django.utils.text import slugify
+
+# The number of cards fetched from the database at a time
+EXPORT_CHUNK_SIZE = 2000
+# The number of archive bytes collected before they are sent
+ZIP_FLUSH_SIZE = 64 * 1024
+# The columns of an export, the question and answer come first so exports
+# can be imported again
+EXPORT_FIELDS = (
+    'question', 'answer', 'deck', 'question_image', 'answer_image'
+)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/jsonl; charset=utf-8', 'jsonl'),
+    'zip': ('application/zip', 'zip'),
+}
+
+
+def card_rows(cards, image_name):
+    """
+    Reads the exported fields of cards in chunks.
+
+    Arguments:
+        cards (QuerySet): The cards to export.
+        image_name (callable): Converts a stored image name to the value
+            written to the export.
+
+    Yields:
+        dict: The EXPORT_FIELDS of each card.
+    """
+    rows = cards.order_by('deck_id', 'id').values_list(
+        'question', 'answer', 'deck__name', 'question_image', 'answer_image'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for question, answer, deck, question_image, answer_image in rows:
+        yield {
+            'question': question,
+            'answer': answer,
+            'deck': deck,
+            'question_image': (
+                image_name(question_image) if question_image else ''
+            ),
+            'answer_image': image_name(answer_image) if answer_image else '',
+        }
+
+
+class Echo:
+    """
+    A file-like object returning what is written to it, so csv.writer can
+    produce the lines of a streamed response.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """
+    Encodes rows as CSV lines, starting with a header.
+    """
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    """
+    Encodes rows as JSON Lines.
+    """
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class StreamBuffer:
+    """
+    A write-only file collecting the bytes zipfile writes until they are
+    drained into the response.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """
+        Returns and forgets the bytes written so far.
+        """
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def zip_chunks(cards, storage=default_storage):
+    """
+    Builds a zip archive holding cards.csv and the images of the cards
+    under images/, yielding the archive as it is written.
+
+    The archive is written to a stream that cannot seek, so zipfile records
+    the size of each member after its data and no member is ever held in
+    memory. Each image is stored once, however many cards use it.
+
+    Arguments:
+        cards (QuerySet): The cards to export.
+        storage (Storage): The storage holding the images.
+
+    Yields:
+        bytes: The parts of the archive.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('cards.csv', 'w') as member:
+            text = io.TextIOWrapper(member, encoding='utf-8', newline='')
+            with text:
+                writer = csv.DictWriter(text, fieldnames=EXPORT_FIELDS)
+                writer.writeheader()
+                for row in card_rows(cards, lambda name: 'images/' + name):
+                    writer.writerow(row)
+                    if buffer.size >= ZIP_FLUSH_SIZE:
+                        yield buffer.drain()
+        yield buffer.drain()
+
+        names = cards.exclude(question_image='').order_by().values_list(
+            'question_image', flat=True
+        ).union(
+            cards.exclude(answer_image='').order_by().values_list(
+                'answer_image', flat=True
+            )
+        )
+        for name in names.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            if not name:
+                continue
+            try:
+                image = storage.open(name, 'rb')
+            except (OSError, ValueError):
+                # Leave out images missing from storage
+                continue
+            with image, archive.open('images/' + name, 'w') as member:
+                for chunk in image.chunks():
+                    member.write(chunk)
+                    if buffer.size >= ZIP_FLUSH_SIZE:
+                        yield buffer.drain()
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def export_response(request, cards, export_format, name):
+    """
+    Streams cards as a file download.
+
+    Arguments:
+        request (HttpRequest): The current request, used to build absolute
+            image URLs.
+        cards (QuerySet): The cards to export.
+        export_format (str): One of EXPORT_FORMATS.
+        name (str): The name of the exported deck or subject.
+
+    Returns:
+        StreamingHttpResponse: The download.
+    """
+    content_type, extension = EXPORT_FORMATS[export_format]
+    if export_format == 'zip':
+        content = zip_chunks(cards)
+    else:
+        def image_url(image_name):
+            return request.build_absolute_uri(
+                default_storage.url(image_name)
+            )
+        rows = card_rows(cards, image_url)
+        if export_format == 'csv':
+            content = csv_lines(rows)
+        else:
+            content = jsonl_lines(rows)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    filename = '{0}.{1}'.format(slugify(name) or 'cards', extension)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -27,3 +27,76 @@ class CardForm(forms.ModelForm):
     class Meta:
         model = Card
         fields = ['question', 'question_image', 'answer', 'answer_image']
+
+
+class CardImportForm(forms.Form):
+    """
+    A form for importing cards into a deck from a file.
+    """
+    file = forms.FileField(
+        help_text='A CSV or tab-separated file with the question in the '
+                  'first column and the answer in the second, or an Anki '
+                  '.apkg package.'
+    )
+    has_header = forms.BooleanField(
+        required=False,
+        label='The first line holds column names'
+    )
+
+
+class CardBatchForm(forms.Form):
+    """
+    A form for applying an action to several cards of a deck at once.
+
+    Only cards of the deck can be selected and only decks of the user can
+    be targeted, so validating the form checks ownership of the whole
+    selection at once.
+    """
+    DELETE = 'delete'
+    MOVE = 'move'
+    COPY = 'copy'
+    CLEAR_IMAGES = 'clear_images'
+    ACTION_CHOICES = [
+        (DELETE, 'Delete'),
+        (MOVE, 'Move to deck'),
+        (COPY, 'Copy to deck'),
+        (CLEAR_IMAGES, 'Remove images'),
+    ]
+
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+    cards = forms.ModelMultipleChoiceField(queryset=Card.objects.none())
+    target = forms.ModelChoiceField(
+        queryset=Deck.objects.none(),
+        required=False
+    )
+
+    def __init__(self, deck, user, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deck = deck
+        self.fields['cards'].queryset = Card.objects.filter(deck=deck)
+        self.fields['target'].queryset = Deck.objects.for_user(user)
+
+    def clean(self):
+        """
+        Validates the target deck of moves and copies, and rejects
+        copying or clearing cards whose images are still processing.
+        """
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        target = cleaned_data.get('target')
+        cards = cleaned_data.get('cards')
+        if action in (self.MOVE, self.COPY):
+            if target is None:
+                self.add_error('target', 'Choose the deck to use.')
+            elif action == self.MOVE and target.pk == self.deck.pk:
+                self.add_error(
+                    'target',
+                    'The cards are already in this deck.'
+                )
+        if action in (self.COPY, self.CLEAR_IMAGES) and cards is not None \
+                and cards.filter(image_status=Card.PROCESSING).exists():
+            raise forms.ValidationError(
+                'Some of the cards still have images processing, try again '
+                'in a moment.'
+            )
+        return cleaned_data
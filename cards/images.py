@@ -0,0 +1,44 @@
+from PIL import Image
+from io import BytesIO
+
+# The widths card images are stored at, the largest is the main image
+CARD_IMAGE_WIDTHS = (800, 400, 160)
+
+
+def render_variants(source, widths=CARD_IMAGE_WIDTHS):
+    """
+    Resizes an image to each of `widths` and encodes the results as WEBP,
+    decoding the source only once.
+
+    Each variant is resized from the previous, larger one. Variants that
+    would not be smaller than the previous one are skipped, so a small
+    image only produces a single variant.
+
+    This function only depends on Pillow, so it can be run in a worker
+    process without setting up Django.
+
+    Arguments:
+        source (bytes or file): The encoded image.
+        widths (tuple): The bounding box sizes of the variants.
+
+    Returns:
+        list: (width, bytes) tuples of the WEBP encoded variants, largest
+            first.
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    variants = []
+    with Image.open(source) as img:
+        current = img
+        for width in sorted(widths, reverse=True):
+            if variants and max(current.size) <= width:
+                continue
+            if variants:
+                current = current.copy()
+            # Resize the image if it's bigger than the width
+            current.thumbnail((width, width))
+
+            in_mem_file = BytesIO()
+            current.save(in_mem_file, format='WEBP')
+            variants.append((current.width, in_mem_file.getvalue()))
+    return variants
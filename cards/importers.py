@@ -0,0 +1,341 @@
+"""
+Bulk import of cards from CSV/TSV files and Anki packages.
+
+Files are parsed as streams of rows, and cards are inserted in fixed-size
+batches, so the memory used by an import does not depend on the size of
+the file. Images embedded in Anki packages are converted in a process
+pool, one batch at a time.
+"""
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from html import unescape
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.html import strip_tags
+from .images import render_variants
+from .models import Card, CardImage, adjust_card_count
+
+# The number of cards inserted per query
+IMPORT_BATCH_SIZE = 500
+# The field separator of Anki notes
+ANKI_FIELD_SEPARATOR = '\x1f'
+ANKI_IMAGE = re.compile(r'<img[^>]+src=["\']?([^"\' >]+)', re.IGNORECASE)
+ANKI_SOUND = re.compile(r'\[sound:[^\]]*\]')
+
+# One card to import: the text and the encoded image of each side
+CardRow = namedtuple(
+    'CardRow',
+    ['question', 'answer', 'question_image', 'answer_image']
+)
+
+
+def delimited_rows(file, delimiter=',', has_header=False):
+    """
+    Reads cards from a delimited text file, one card per line with the
+    question in the first column and the answer in the second.
+
+    Arguments:
+        file (file): The file, opened in binary mode.
+        delimiter (str): The column separator.
+        has_header (bool): Whether the first line holds column names.
+
+    Yields:
+        CardRow: The cards, without images.
+
+    Raises:
+        ValidationError: If the file is not delimited text, e.g. holds NUL
+            bytes or a field over csv.field_size_limit.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text, delimiter=delimiter)
+        if has_header:
+            next(reader, None)
+        for row in reader:
+            if not row:
+                continue
+            # Older Pythons raise csv.Error on NUL bytes, newer ones pass
+            # them on, and PostgreSQL text columns cannot store them
+            if any('\x00' in field for field in row):
+                raise ValidationError(
+                    f'Line {reader.line_num} contains a NUL byte, the file '
+                    'is not a text file.'
+                )
+            question = row[0].strip()
+            answer = row[1].strip() if len(row) > 1 else ''
+            yield CardRow(question, answer, None, None)
+    except csv.Error as error:
+        raise ValidationError(
+            f'Line {reader.line_num} could not be read: {error}.'
+        )
+    finally:
+        # Leave the upload open for its owner
+        text.detach()
+
+
+def anki_field(value, package, media):
+    """
+    Converts an Anki note field to card text and image.
+
+    Arguments:
+        value (str): The HTML of the field.
+        package (ZipFile): The package holding the media files.
+        media (dict): The package member holding each media file name.
+
+    Returns:
+        tuple: The text and the bytes of the first image, or None.
+    """
+    image = None
+    match = ANKI_IMAGE.search(value)
+    if match and unescape(match.group(1)) in media:
+        image = package.read(media[unescape(match.group(1))])
+    value = re.sub(r'<br\s*/?>|</div>', '\n', value, flags=re.IGNORECASE)
+    text = unescape(strip_tags(ANKI_SOUND.sub('', value)))
+    return text.strip(), image
+
+
+def apkg_rows(file):
+    """
+    Reads cards from an Anki package, taking the first field of each note
+    as the question and the second as the answer.
+
+    The collection is copied to a temporary file to be opened by SQLite
+    and the notes are read with a cursor. Media files are only read from
+    the package when a note uses them.
+
+    Arguments:
+        file (file): The .apkg file, opened in binary mode.
+
+    Yields:
+        CardRow: The cards.
+    """
+    try:
+        package = zipfile.ZipFile(file)
+    except zipfile.BadZipFile:
+        raise ValidationError('The file is not an Anki package.')
+    with package:
+        names = set(package.namelist())
+        # Packages from recent Anki versions put the notes in a compressed
+        # collection.anki21b, with a placeholder collection.anki2
+        for collection_name in ('collection.anki21', 'collection.anki2'):
+            if collection_name in names:
+                break
+        else:
+            raise ValidationError(
+                'The package has no collection. Export it from Anki with '
+                '"Support older Anki versions" checked.'
+            )
+        media = {}
+        if 'media' in names:
+            media = {
+                name: member
+                for member, name in json.loads(package.read('media')).items()
+            }
+        handle, path = tempfile.mkstemp(suffix='.anki2')
+        try:
+            with os.fdopen(handle, 'wb') as collection_file:
+                with package.open(collection_name) as source:
+                    shutil.copyfileobj(source, collection_file)
+            connection = sqlite3.connect(path)
+            try:
+                notes = connection.execute(
+                    'SELECT flds FROM notes ORDER BY id'
+                )
+                for (fields,) in notes:
+                    fields = fields.split(ANKI_FIELD_SEPARATOR)
+                    question, question_image = anki_field(
+                        fields[0], package, media
+                    )
+                    answer, answer_image = '', None
+                    if len(fields) > 1:
+                        answer, answer_image = anki_field(
+                            fields[1], package, media
+                        )
+                    yield CardRow(
+                        question, answer, question_image, answer_image
+                    )
+            except sqlite3.DatabaseError:
+                raise ValidationError('The package collection is damaged.')
+            finally:
+                connection.close()
+        finally:
+            os.remove(path)
+
+
+def upload_rows(upload, has_header=False):
+    """
+    Picks the reader of an uploaded file from its extension.
+
+    Arguments:
+        upload (UploadedFile): A .csv, .tsv, .txt or .apkg file.
+        has_header (bool): Whether the first line of a text file holds
+            column names.
+
+    Returns:
+        iterator: The CardRow of each card of the file.
+    """
+    extension = os.path.splitext(upload.name)[1].lower()
+    if extension == '.apkg':
+        return apkg_rows(upload)
+    if extension == '.csv':
+        return delimited_rows(upload, ',', has_header)
+    if extension in ('.tsv', '.txt'):
+        return delimited_rows(upload, '\t', has_header)
+    raise ValidationError('Upload a .csv, .tsv, .txt or .apkg file.')
+
+
+def batches(iterable, size):
+    """
+    Splits an iterable into lists of at most `size` items.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class CardImporter:
+    """
+    Inserts cards into a deck in batches, converting their images in a
+    process pool that is only started once an image needs converting.
+
+    Attributes:
+        deck (Deck): The deck receiving the cards.
+        batch_size (int): The number of cards inserted per query.
+        workers (int): The number of image conversion processes.
+        created (int): The number of cards inserted so far.
+        skipped (int): The number of rows without a question or answer.
+    """
+    def __init__(self, deck, batch_size=IMPORT_BATCH_SIZE, workers=None):
+        self.deck = deck
+        self.batch_size = batch_size
+        self.workers = workers
+        self.created = 0
+        self.skipped = 0
+        self._pool = None
+        # Images stored by this import, deleted again if it fails
+        self._new_images = []
+
+    def run(self, rows):
+        """
+        Imports all the rows in one transaction.
+
+        Arguments:
+            rows (iterable): The CardRow of each card.
+
+        Returns:
+            int: The number of cards created.
+        """
+        try:
+            with transaction.atomic():
+                for batch in batches(rows, self.batch_size):
+                    self.insert(batch)
+                adjust_card_count(self.deck.pk, self.created)
+        except BaseException:
+            # The rows of the new images were rolled back, not their files
+            for card_image in self._new_images:
+                for variant in card_image.variants:
+                    default_storage.delete(variant['name'])
+            raise
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+        return self.created
+
+    def insert(self, rows):
+        """
+        Converts the images of a batch of rows and inserts its cards.
+        """
+        cards = []
+        jobs = []
+        for row in rows:
+            if not ((row.question or row.question_image)
+                    and (row.answer or row.answer_image)):
+                self.skipped += 1
+                continue
+            card = Card(
+                deck=self.deck,
+                question=row.question,
+                answer=row.answer
+            )
+            for field_name, data in (
+                ('question_image', row.question_image),
+                ('answer_image', row.answer_image),
+            ):
+                if data:
+                    jobs.append((card, field_name, data))
+            cards.append(card)
+        self.attach_images(jobs)
+        # Images that could not be converted may leave a side empty
+        valid = [
+            card for card in cards
+            if (card.question or card.question_image)
+            and (card.answer or card.answer_image)
+        ]
+        self.skipped += len(cards) - len(valid)
+        Card.objects.bulk_create(valid)
+        self.created += len(valid)
+
+    def attach_images(self, jobs):
+        """
+        Points cards to their stored images, converting the images that are
+        not stored yet in the pool.
+
+        Arguments:
+            jobs (list): (card, field name, image bytes) tuples.
+        """
+        pending = []
+        futures = {}
+        for card, field_name, data in jobs:
+            digest = hashlib.sha256(data).hexdigest()
+            card_image = CardImage.objects.acquire(digest)
+            if card_image is not None:
+                card.attach_image(field_name, card_image)
+                continue
+            # The same image used twice in a batch is converted once
+            if digest not in futures:
+                futures[digest] = self.pool.submit(render_variants, data)
+            pending.append((card, field_name, digest))
+        for card, field_name, digest in pending:
+            card_image = CardImage.objects.acquire(digest)
+            if card_image is None:
+                try:
+                    variants = futures[digest].result()
+                except Exception:
+                    # Keep the card text rather than failing the import
+                    continue
+                card_image = CardImage.objects.create_from_variants(
+                    digest,
+                    variants
+                )
+                if card_image.ref_count == 1:
+                    self._new_images.append(card_image)
+            card.attach_image(field_name, card_image)
+
+    @property
+    def pool(self):
+        """
+        The process pool converting images, started on first use.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._pool
@@ -0,0 +1,186 @@
+from collections import defaultdict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from flashcards.benchmark import capture_queries, named_patterns, rolled_back
+from flashcards.query_plans import (
+    existing_indexes,
+    is_covered,
+    model_index,
+    plan_findings,
+    suggest_index,
+)
+from cards.models import (
+    Subject, Deck, Card, CardSchedule, adjust_card_count
+)
+
+# Views that change data are requested after all the others
+DESTRUCTIVE = ('delete_card', 'delete_deck', 'delete_subject', 'logout')
+# Query strings requested in addition to the bare URL of a view
+VARIANTS = {
+    'quiz_view': ['?mode=due'],
+    'quiz_cards': ['?after=1'],
+    'search': ['?q=question'],
+}
+
+
+class Command(BaseCommand):
+    """
+    Requests every named URL as the owner of a seeded dataset, explains
+    each query the views run and reports the full table scans and sorts
+    along with the indexes that would avoid them.
+
+    Views are requested with GET, with the cache disabled so every query
+    reaches the database. Everything runs in a transaction that is rolled
+    back.
+    """
+    help = 'Explains the queries of every view and suggests indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--subjects',
+            type=int,
+            default=3,
+            help='Number of subjects to seed.'
+        )
+        parser.add_argument(
+            '--decks',
+            type=int,
+            default=4,
+            help='Number of decks per subject.'
+        )
+        parser.add_argument(
+            '--cards',
+            type=int,
+            default=50,
+            help='Number of cards per deck.'
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='List every finding, including those already indexed.'
+        )
+
+    def seed(self, subjects, decks, cards):
+        """
+        Creates a user owning the dataset and returns the user and the URL
+        keyword arguments to request.
+        """
+        user = User.objects.create_user(
+            username='advise-indexes@example.com',
+            password='advise-indexes'
+        )
+        for s in range(subjects):
+            subject = Subject.objects.create(name=f'S{s}', creator=user)
+            for d in range(decks):
+                deck = Deck.objects.create(name=f'D{d}', subject=subject)
+                Card.objects.bulk_create([
+                    Card(deck=deck, question=f'Question {c}', answer=f'A{c}')
+                    for c in range(cards)
+                ])
+                adjust_card_count(deck.pk, cards)
+        first_card = Card.objects.filter(deck__subject__creator=user).first()
+        CardSchedule.objects.create(user=user, card=first_card)
+        return user, {
+            'subject_id': first_card.deck.subject_id,
+            'deck_id': deck.id,
+            'card_id': deck.card_set.first().id,
+        }
+
+    def capture(self, user, kwargs):
+        """
+        Requests every view and returns the queries of each request.
+        """
+        host = settings.ALLOWED_HOSTS[0].lstrip('.')
+        client = Client(SERVER_NAME=host)
+        client.force_login(user)
+        patterns = named_patterns()
+        names = sorted(
+            patterns, key=lambda name: (name in DESTRUCTIVE, name)
+        )
+        captured = {}
+        for name in names:
+            url = reverse(name, kwargs={
+                key: kwargs[key] for key in patterns[name]
+            })
+            for variant in [''] + VARIANTS.get(name, []):
+                with capture_queries() as queries:
+                    response = client.get(url + variant)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                if response.status_code >= 500:
+                    self.stderr.write(
+                        f'{url}{variant} failed with {response.status_code}'
+                    )
+                captured[name + variant] = queries
+        return captured
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.stderr.write(
+                f'EXPLAIN is not supported on {connection.vendor}.'
+            )
+            return
+        dummy_cache = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+            }
+        }
+        with rolled_back(), override_settings(CACHES=dummy_cache):
+            user, kwargs = self.seed(
+                options['subjects'],
+                options['decks'],
+                options['cards']
+            )
+            captured = self.capture(user, kwargs)
+            # The views that would use each suggested index
+            suggestions = defaultdict(set)
+            indexes = {}
+            explained = set()
+            for view, queries in captured.items():
+                for query in queries:
+                    if query['sql'] in explained:
+                        continue
+                    explained.add(query['sql'])
+                    for finding in plan_findings(
+                        query['sql'],
+                        query['params']
+                    ):
+                        suggestion = suggest_index(query['sql'], finding)
+                        covered = True
+                        if suggestion is not None:
+                            if suggestion.table not in indexes:
+                                indexes[suggestion.table] = existing_indexes(
+                                    suggestion.table
+                                )
+                            covered = is_covered(
+                                suggestion,
+                                indexes[suggestion.table]
+                            )
+                            if not covered:
+                                suggestions[suggestion].add(view)
+                        if covered and not options['verbose_plans']:
+                            continue
+                        self.stdout.write(
+                            f'{view}: {finding.kind} of '
+                            f'{finding.table or "rows"} ({finding.detail})'
+                        )
+                        self.stdout.write(f'  {query["sql"]}')
+                        self.stdout.write(f'  from {query["origin"]}')
+
+        self.stdout.write(
+            f'Explained {len(explained)} distinct queries from '
+            f'{len(captured)} requests on {connection.vendor}.'
+        )
+        if not suggestions:
+            self.stdout.write('No missing indexes.')
+            return
+        self.stdout.write('Suggested indexes:')
+        for suggestion, views in sorted(suggestions.items()):
+            self.stdout.write(
+                f'  {model_index(suggestion)}  '
+                f'used by {", ".join(sorted(views))}'
+            )
@@ -0,0 +1,210 @@
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from flashcards.benchmark import SERVERS, format_summary, serve, summarize
+from cards.models import Subject, Deck, Card, adjust_card_count
+
+# A gunicorn configuration delaying every query of the worker, modelling
+# the round trips to a database server on another host
+DELAY_CONFIG = '''
+import time
+
+
+def post_worker_init(worker):
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep({delay!r})
+        return execute(sql, params, many, context)
+
+    def add_delay(connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(add_delay, weak=False)
+'''
+
+
+class Command(BaseCommand):
+    """
+    Starts the WSGI deployment (gunicorn sync worker) and the ASGI
+    deployment (gunicorn with a uvicorn worker) one after the other, each
+    with a single worker process, and loads both with the same concurrent
+    requests to the deck page and the quiz card stream.
+
+    With --query-delay, every query the servers run is delayed, as if the
+    database was on another host, which shows how many requests a worker
+    keeps in progress while waiting on the database.
+
+    The servers use the configured database, which must be shared with
+    other processes. A user with one deck is created for the run and
+    deleted afterwards.
+    """
+    help = 'Benchmarks the WSGI and ASGI deployments side by side.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            nargs='+',
+            default=[1, 8, 32],
+            help='Numbers of concurrent clients to run.'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Number of requests per concurrency level.'
+        )
+        parser.add_argument(
+            '--cards',
+            type=int,
+            default=200,
+            help='Number of cards in the benchmarked deck.'
+        )
+        parser.add_argument(
+            '--query-delay',
+            type=float,
+            default=0.0,
+            help='Milliseconds added to every query of the servers.'
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8765,
+            help='Port the servers listen on.'
+        )
+
+    def seed(self, cards):
+        """
+        Creates the benchmark user and deck and returns the user, the deck
+        and a session cookie of the user.
+        """
+        user = User.objects.create_user(
+            username='bench-asgi@example.com',
+            password='bench'
+        )
+        subject = Subject.objects.create(name='Bench', creator=user)
+        deck = Deck.objects.create(name='Bench', subject=subject)
+        Card.objects.bulk_create([
+            Card(deck=deck, question=f'Question {c}', answer=f'Answer {c}')
+            for c in range(cards)
+        ])
+        adjust_card_count(deck.pk, cards)
+        client = Client()
+        client.force_login(user)
+        cookie = '{0}={1}'.format(
+            settings.SESSION_COOKIE_NAME,
+            client.cookies[settings.SESSION_COOKIE_NAME].value
+        )
+        return user, deck, cookie
+
+    def fetch(self, url, headers):
+        """
+        Requests a URL and returns the response status.
+        """
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def load(self, urls, concurrency, count):
+        """
+        Requests the URLs in turn from `concurrency` threads until `count`
+        requests are made.
+
+        Returns:
+            tuple: The duration of each request in seconds, the number of
+                failed requests and the wall time of the run.
+        """
+        samples = []
+        failures = []
+        lock = threading.Lock()
+        remaining = iter(range(count))
+
+        def client():
+            while True:
+                with lock:
+                    index = next(remaining, None)
+                if index is None:
+                    return
+                url = urls[index % len(urls)]
+                start = time.perf_counter()
+                try:
+                    status = self.fetch(url, self.headers)
+                except OSError:
+                    status = None
+                duration = time.perf_counter() - start
+                with lock:
+                    samples.append(duration)
+                    if status != 200:
+                        failures.append(status)
+
+        threads = [
+            threading.Thread(target=client) for _ in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, len(failures), time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError(
+                'The servers need a database shared between processes, '
+                'an in-memory SQLite database is not.'
+            )
+        port = options['port']
+        base = f'http://127.0.0.1:{port}'
+        user, deck, cookie = self.seed(options['cards'])
+        self.headers = {
+            'Host': settings.ALLOWED_HOSTS[0].lstrip('.'),
+            'Cookie': cookie,
+            'Accept-Encoding': 'gzip',
+        }
+        urls = [
+            f'{base}/deck/{deck.pk}/',
+            f'{base}/deck/{deck.pk}/quiz/cards/',
+        ]
+        results = []
+        config = None
+        if options['query_delay']:
+            handle, config = tempfile.mkstemp(suffix='.py')
+            with os.fdopen(handle, 'w') as config_file:
+                config_file.write(DELAY_CONFIG.format(
+                    delay=options['query_delay'] / 1000
+                ))
+        try:
+            for name in SERVERS:
+                with serve(name, port, config):
+                    # Warm up the worker and the quiz page cache
+                    self.load(urls, 1, len(urls))
+                    for concurrency in options['concurrency']:
+                        results.append((name, concurrency) + self.load(
+                            urls, concurrency, options['requests']
+                        ))
+        finally:
+            user.delete()
+            if config:
+                os.unlink(config)
+
+        for name, concurrency, samples, failures, wall in results:
+            label = f'{name} x{concurrency}'
+            self.stdout.write(format_summary(label, summarize(samples)))
+            self.stdout.write(
+                f'{"":<32} {len(samples) / wall:8.1f} requests/s '
+                f'failures={failures}'
+            )
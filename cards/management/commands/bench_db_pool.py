@@ -0,0 +1,164 @@
+import os
+import tempfile
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.utils import load_backend
+from flashcards.benchmark import format_summary, summarize, time_calls
+from flashcards.db.pool import PooledDatabaseWrapperMixin, get_pool
+
+# The backend opening one connection per request for each vendor
+DIRECT_ENGINES = {
+    'postgresql': 'django.db.backends.postgresql',
+    'sqlite': 'django.db.backends.sqlite3',
+}
+# The alias of the pool used by the benchmark
+BENCH_ALIAS = 'bench-pool'
+
+
+def with_connect_delay(wrapper_class, delay):
+    """
+    Returns a subclass of a database wrapper sleeping before each new
+    connection, modelling the network and authentication cost SQLite does
+    not have.
+    """
+    class DelayedDatabaseWrapper(wrapper_class):
+        def get_new_connection(self, conn_params):
+            time.sleep(delay)
+            return super().get_new_connection(conn_params)
+    return DelayedDatabaseWrapper
+
+
+class Command(BaseCommand):
+    """
+    Times requests that open a connection, run a query and close the
+    connection again, as Django does with CONN_MAX_AGE = 0, once with a
+    new connection per request and once with connections from a pool.
+
+    Runs against the configured PostgreSQL database, or a temporary SQLite
+    database as a stand-in. No rows are written.
+    """
+    help = 'Benchmarks per-request latency with and without pooling.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=200,
+            help='Number of requests per thread and mode.'
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=4,
+            help='Number of threads making requests concurrently.'
+        )
+        parser.add_argument(
+            '--pool-size',
+            type=int,
+            default=4,
+            help='Maximum number of pooled connections.'
+        )
+        parser.add_argument(
+            '--connect-delay',
+            type=float,
+            default=0.0,
+            help='Milliseconds added to each new connection.'
+        )
+
+    def run(self, wrapper_class, settings_dict, threads, repeat):
+        """
+        Makes `repeat` requests in each of `threads` threads, each thread
+        with its own database wrapper as in a threaded server.
+
+        Returns:
+            list: The duration of every request in seconds.
+        """
+        samples = []
+        errors = []
+        lock = threading.Lock()
+
+        def request(wrapper):
+            wrapper.ensure_connection()
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+            wrapper.close()
+
+        def worker():
+            try:
+                wrapper = wrapper_class(dict(settings_dict), BENCH_ALIAS)
+                durations = time_calls(lambda: request(wrapper), repeat)
+            except Exception as error:
+                errors.append(error)
+                return
+            with lock:
+                samples.extend(durations)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        if errors:
+            raise CommandError(f'A request failed: {errors[0]}')
+        return samples
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in DIRECT_ENGINES:
+            raise CommandError(f'Pooling is not supported on {vendor}.')
+        settings_dict = dict(connection.settings_dict)
+        settings_dict.pop('POOL', None)
+        settings_dict['CONN_MAX_AGE'] = 0
+        temporary = None
+        if vendor == 'sqlite' and connection.is_in_memory_db():
+            # Every connection to an in-memory database is a new database
+            temporary = tempfile.NamedTemporaryFile(
+                suffix='.sqlite3', delete=False
+            )
+            temporary.close()
+            settings_dict['NAME'] = temporary.name
+
+        direct_class = load_backend(DIRECT_ENGINES[vendor]).DatabaseWrapper
+        if options['connect_delay']:
+            direct_class = with_connect_delay(
+                direct_class, options['connect_delay'] / 1000
+            )
+        pooled_class = type(
+            'PooledDatabaseWrapper',
+            (PooledDatabaseWrapperMixin, direct_class),
+            {}
+        )
+        pool_options = {'MAX_SIZE': options['pool_size']}
+        pool = get_pool(BENCH_ALIAS, pool_options)
+        try:
+            direct = self.run(
+                direct_class, settings_dict,
+                options['threads'], options['repeat']
+            )
+            pooled = self.run(
+                pooled_class, {**settings_dict, 'POOL': pool_options},
+                options['threads'], options['repeat']
+            )
+            stats = pool.stats()
+        finally:
+            pool.close_idle()
+            if temporary is not None:
+                os.unlink(temporary.name)
+
+        self.stdout.write(
+            f'{vendor}, {options["threads"]} threads, '
+            f'pool of {options["pool_size"]}'
+        )
+        self.stdout.write(format_summary('connection per request',
+                                         summarize(direct)))
+        self.stdout.write(format_summary('pooled connection',
+                                         summarize(pooled)))
+        self.stdout.write(
+            f'{"":<32} hits={stats["hits"]} misses={stats["misses"]} '
+            f'waits={stats["waits"]} '
+            f'wait={stats["wait_seconds"] * 1000:.1f}ms '
+            f'timeouts={stats["timeouts"]}'
+        )
@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import InMemoryStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from PIL import Image
+from flashcards.benchmark import (
+    format_summary,
+    rolled_back,
+    summarize,
+    time_calls,
+)
+from cards.models import Card
+from users.models import Profile
+
+# The generated input classes: file name, format and size
+IMAGE_CLASSES = {
+    'jpeg': ('photo.jpg', 'JPEG', (1600, 1200)),
+    'png_alpha': ('overlay.png', 'PNG', (1024, 1024)),
+    'gif_animated': ('animation.gif', 'GIF', (480, 360)),
+    'phone_12mp': ('phone.jpg', 'JPEG', (4032, 3024)),
+    'icon': ('icon.png', 'PNG', (32, 32)),
+}
+# The code paths measured for each class
+TARGETS = ('card', 'profile')
+# The measurements compared with a baseline
+COMPARED = ('p50_ms', 'rss_growth_mb', 'output_bytes')
+
+
+def photo(size, seed):
+    """
+    Returns an RGB image with gradients and noise, compressing like a
+    photo rather than a flat graphic. The same seed gives the same image.
+    """
+    width, height = size
+    noise = np.random.default_rng(seed).normal(
+        128, 40, (height, width, 3)
+    )
+    channels = []
+    for index in range(3):
+        gradient = Image.linear_gradient('L').rotate(index * 120).resize(size)
+        channels.append(Image.blend(
+            gradient,
+            Image.fromarray(noise[..., index].clip(0, 255).astype('uint8')),
+            0.35
+        ))
+    return Image.merge('RGB', channels)
+
+
+def generate_image(image_class):
+    """
+    Generates the input of an image class, the same bytes on every run.
+
+    Arguments:
+        image_class (str): One of IMAGE_CLASSES.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    filename, image_format, size = IMAGE_CLASSES[image_class]
+    output = BytesIO()
+    if image_class == 'png_alpha':
+        image = photo(size, 1).convert('RGBA')
+        image.putalpha(Image.radial_gradient('L').resize(size))
+        image.save(output, format=image_format)
+    elif image_class == 'gif_animated':
+        frames = [
+            photo(size, frame).quantize(64) for frame in range(8)
+        ]
+        frames[0].save(
+            output,
+            format=image_format,
+            save_all=True,
+            append_images=frames[1:],
+            duration=100,
+            loop=0
+        )
+    else:
+        photo(size, 2).save(output, format=image_format, quality=90)
+    return output.getvalue()
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the process in bytes.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    """
+    Resets the peak resident set size to the current one where the system
+    allows it (Linux), so a measurement excludes the setup of the process.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def measure(target, image_class, data, repeat):
+    """
+    Runs a target over an input `repeat` times, each time in a transaction
+    that is rolled back, with images stored in memory.
+
+    Arguments:
+        target (str): "card" times Card.process_image, "profile" times
+            Profile.save with a new upload.
+        image_class (str): One of IMAGE_CLASSES.
+        data (bytes): The input from `generate_image`.
+        repeat (int): The number of runs.
+
+    Returns:
+        dict: The `summarize` of the durations, with the peak RSS and its
+            growth over the process before the runs in MB, and the input
+            and mean output sizes in bytes.
+    """
+    filename = IMAGE_CLASSES[image_class][0]
+    storage = default_storage._wrapped = InMemoryStorage()
+    output_sizes = []
+    reset_peak_rss()
+    start_rss = peak_rss()
+
+    if target == 'card':
+        def run():
+            card = Card(question='Benchmark', answer='Benchmark')
+            card.question_image = SimpleUploadedFile(filename, data)
+            with rolled_back():
+                card.process_image(card.question_image)
+            names = [
+                variant['name'] for variant in card.question_image_variants
+            ]
+            output_sizes.append(sum(storage.size(name) for name in names))
+            for name in names:
+                storage.delete(name)
+    else:
+        def run():
+            with rolled_back():
+                user = User.objects.create_user(
+                    username='bench-images@example.com'
+                )
+                profile = Profile.objects.get(user=user)
+                profile.image = SimpleUploadedFile(filename, data)
+                profile.save()
+            output_sizes.append(storage.size(profile.image.name))
+            storage.delete(profile.image.name)
+
+    samples = time_calls(run, repeat)
+    peak = peak_rss()
+    return dict(
+        summarize(samples),
+        peak_rss_mb=peak / 2 ** 20,
+        rss_growth_mb=(peak - start_rss) / 2 ** 20,
+        input_bytes=len(data),
+        output_bytes=sum(output_sizes) / len(output_sizes),
+    )
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Lists the measurements of a run exceeding a baseline by more than
+    `tolerance` percent.
+
+    Returns:
+        list: "<target> <class> <measurement>" descriptions.
+    """
+    found = []
+    limit = 1 + tolerance / 100
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        for measurement in COMPARED:
+            # Ignore changes below the resolution of the measurement
+            floor = {'p50_ms': 5.0, 'rss_growth_mb': 1.0}.get(measurement, 0)
+            if result[measurement] > max(before[measurement], floor) * limit:
+                found.append(
+                    f'{key} {measurement} {before[measurement]:.1f} -> '
+                    f'{result[measurement]:.1f}'
+                )
+    return found
+
+
+class Command(BaseCommand):
+    """
+    Measures Card.process_image and Profile.save over generated images of
+    several classes: a JPEG photo, a PNG with alpha, an animated GIF, a
+    12 megapixel phone photo and a tiny icon.
+
+    Each target and class runs in a process of its own, so the peak RSS of
+    one does not hide the next. Reports the wall time, the peak RSS and
+    its growth, and the output bytes per class, and fails when a
+    measurement exceeds a saved baseline by more than --tolerance percent.
+
+    The worker processes use the configured database, which must be shared
+    between processes. Nothing is written to it or to the media storage.
+    """
+    help = 'Benchmarks the image pipeline over a generated image corpus.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of runs per target and class.'
+        )
+        parser.add_argument(
+            '--classes',
+            nargs='+',
+            choices=list(IMAGE_CLASSES),
+            default=list(IMAGE_CLASSES),
+            help='Image classes to measure.'
+        )
+        parser.add_argument(
+            '--targets',
+            nargs='+',
+            choices=TARGETS,
+            default=list(TARGETS),
+            help='Code paths to measure.'
+        )
+        parser.add_argument(
+            '--save',
+            metavar='PATH',
+            help='Save the results as a JSON baseline.'
+        )
+        parser.add_argument(
+            '--compare',
+            metavar='PATH',
+            help='Fail if the results regress from a saved baseline.'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=15.0,
+            help='Percentage by which a measurement may exceed the '
+                 'baseline.'
+        )
+        # Runs one target over one input file and prints the results
+        parser.add_argument(
+            '--worker',
+            nargs=3,
+            metavar=('TARGET', 'CLASS', 'PATH'),
+            help=argparse.SUPPRESS
+        )
+
+    def worker(self, target, image_class, path, repeat):
+        with open(path, 'rb') as image_file:
+            data = image_file.read()
+        results = measure(target, image_class, data, repeat)
+        self.stdout.write(json.dumps(results))
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.worker(*options['worker'], options['repeat'])
+            return
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError(
+                'The workers need a database shared between processes, '
+                'an in-memory SQLite database is not.'
+            )
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        results = {}
+        with tempfile.TemporaryDirectory() as corpus:
+            for image_class in options['classes']:
+                path = os.path.join(corpus, image_class)
+                with open(path, 'wb') as image_file:
+                    image_file.write(generate_image(image_class))
+                for target in options['targets']:
+                    worker = subprocess.run(
+                        [
+                            sys.executable,
+                            os.path.join(settings.BASE_DIR, 'manage.py'),
+                            'bench_images',
+                            '--repeat', str(options['repeat']),
+                            '--worker', target, image_class, path,
+                        ],
+                        capture_output=True,
+                        text=True
+                    )
+                    if worker.returncode:
+                        raise CommandError(
+                            f'The {target} {image_class} worker failed:\n'
+                            f'{worker.stderr}'
+                        )
+                    key = f'{target} {image_class}'
+                    results[key] = json.loads(worker.stdout)
+                    result = results[key]
+                    self.stdout.write(format_summary(key, result))
+                    self.stdout.write(
+                        f'{"":<32} peak RSS={result["peak_rss_mb"]:.1f}MB '
+                        f'(+{result["rss_growth_mb"]:.1f}MB) '
+                        f'in={result["input_bytes"] / 1024:.1f}KB '
+                        f'out={result["output_bytes"] / 1024:.1f}KB'
+                    )
+
+        if options['save']:
+            with open(options['save'], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2)
+            self.stdout.write(f'Saved the baseline to {options["save"]}.')
+        if baseline is not None:
+            found = regressions(results, baseline, options['tolerance'])
+            if found:
+                raise CommandError(
+                    f'Regressed beyond {options["tolerance"]:g}%:\n'
+                    + '\n'.join(found)
+                )
+            self.stdout.write('No regression from the baseline.')
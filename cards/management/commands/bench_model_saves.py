@@ -0,0 +1,91 @@
+from io import BytesIO
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from PIL import Image
+from flashcards.benchmark import (
+    count_storage_calls,
+    format_summary,
+    rolled_back,
+    summarize,
+    time_calls,
+)
+from cards.models import Subject, Deck, Card
+from users.models import Profile
+
+
+def generated_jpeg(size=(1600, 1200)):
+    """
+    Returns an upload of a generated JPEG image.
+    """
+    in_mem_file = BytesIO()
+    Image.linear_gradient('L').resize(size).convert('RGB').save(
+        in_mem_file,
+        format='JPEG'
+    )
+    return SimpleUploadedFile('bench.jpg', in_mem_file.getvalue())
+
+
+class Command(BaseCommand):
+    """
+    Measures text-only saves of a Card with images and saves of a Profile
+    with an uploaded image, along with the storage calls they make.
+
+    Everything runs in a transaction that is rolled back, and the stored
+    images are deleted at the end.
+    """
+    help = 'Benchmarks Card and Profile saves that do not change images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Number of saves to time per case.'
+        )
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        with rolled_back():
+            user = User.objects.create_user(
+                username='bench-saves@example.com',
+                password='bench'
+            )
+            subject = Subject.objects.create(name='Bench', creator=user)
+            deck = Deck.objects.create(name='Bench', subject=subject)
+            card = Card.objects.create(
+                deck=deck,
+                question_image=generated_jpeg(),
+                answer_image=generated_jpeg((800, 600)),
+            )
+            profile = user.profile
+            profile.image = generated_jpeg()
+            profile.save()
+
+            # Each save works on a freshly loaded instance, like a request
+            def edit_card_text():
+                loaded = Card.objects.get(pk=card.pk)
+                loaded.question = loaded.question + 'x'
+                loaded.save()
+
+            def save_profile():
+                Profile.objects.get(pk=profile.pk).save()
+
+            try:
+                with count_storage_calls() as card_calls:
+                    card_samples = time_calls(edit_card_text, repeat)
+                with count_storage_calls() as profile_calls:
+                    profile_samples = time_calls(save_profile, repeat)
+            finally:
+                card.delete()
+                profile.image.delete(save=False)
+
+        for label, samples, calls in (
+            ('card text edit', card_samples, card_calls),
+            ('profile save', profile_samples, profile_calls),
+        ):
+            self.stdout.write(format_summary(label, summarize(samples)))
+            self.stdout.write(
+                f'{"":<32} storage opens={calls["open"] / repeat:.2f}/save '
+                f'writes={calls["save"] / repeat:.2f}/save'
+            )
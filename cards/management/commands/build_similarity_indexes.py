@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from cards.models import Subject
+from cards.similarity import refresh_indexes
+
+
+class Command(BaseCommand):
+    """
+    Brings the saved similarity index of every user owning subjects, or of
+    the given users, up to date, see cards/similarity.py.
+
+    The process_card_images worker already refreshes the indexes of the
+    users whose cards changed. Deleting cards changes no row it could
+    notice, so run this command periodically, e.g. daily, to drop the
+    deleted cards from the saved indexes.
+    """
+    help = 'Builds and saves the card similarity index of each user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            nargs='+',
+            type=int,
+            metavar='ID',
+            help='Ids of the users whose index to build.'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+        if user_ids is None:
+            user_ids = Subject.objects.order_by('creator_id').values_list(
+                'creator_id', flat=True
+            ).distinct()
+        count = refresh_indexes(user_ids, reconcile=True)
+        self.stdout.write(f'Saved the similarity index of {count} user(s).')
@@ -0,0 +1,516 @@
+import html
+import http.cookiejar
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve, reverse
+from django.utils import timezone
+from flashcards.benchmark import SERVERS, format_summary, serve, summarize
+from cards.models import Subject
+from .bench_model_saves import generated_jpeg
+
+# The password of the simulated students
+PASSWORD = 'Load-test-passw0rd'
+# The prefix of the usernames of the simulated students
+USERNAME_PREFIX = 'loadtest-'
+# Endpoints with fewer requests are compared but cannot regress, their
+# p95 is too close to their maximum
+MIN_COMPARED_SAMPLES = 20
+# The data embedded in a page with json_script
+JSON_SCRIPT = '<script id="{0}" type="application/json">(.*?)</script>'
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """
+    Leaves redirects to the journey, so each request is timed on its own.
+    """
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def multipart(fields, files):
+    """
+    Encodes a form with files as multipart/form-data.
+
+    Arguments:
+        fields (dict): The form fields.
+        files (dict): (filename, content type, bytes) of each file field.
+
+    Returns:
+        tuple: The body and its content type.
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'.encode()
+        )
+    for name, (filename, content_type, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"; '
+            f'filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode()
+            + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def page_data(content, element_id, default=None):
+    """
+    Reads data embedded in a page with json_script, as the page scripts
+    do, e.g. the "cards-data" and "cards-next" of cards/quiz.html.
+    """
+    match = re.search(
+        JSON_SCRIPT.format(element_id),
+        content.decode(errors='replace'),
+        re.S
+    )
+    if match is None:
+        return default
+    return json.loads(html.unescape(match.group(1)))
+
+
+class Student:
+    """
+    A simulated student with its own cookies, recording the duration of
+    each request under "<method> <URL name>".
+    """
+    def __init__(self, base_url, headers, record):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+        self.record = record
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies),
+            NoRedirect
+        )
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        return ''
+
+    def request(self, method, name, kwargs=None, query='', data=None,
+                files=None, expect=200):
+        """
+        Requests a named URL and records how long it took.
+
+        Arguments:
+            method (str): "GET" or "POST".
+            name (str): The URL name.
+            kwargs (dict): The URL keyword arguments.
+            query (str): An optional query string, without "?".
+            data (dict): The form fields of a POST.
+            files (dict): The files of a POST, see `multipart`.
+            expect (int): The status of a successful response.
+
+        Returns:
+            tuple: The status, the body and the Location header.
+        """
+        path = reverse(name, kwargs=kwargs)
+        url = self.base_url + path + (f'?{query}' if query else '')
+        headers = dict(self.headers)
+        body = None
+        if method == 'POST':
+            data = dict(data or {})
+            data['csrfmiddlewaretoken'] = self.csrf_token()
+            headers['X-CSRFToken'] = data['csrfmiddlewaretoken']
+            if files:
+                body, headers['Content-Type'] = multipart(data, files)
+            else:
+                body = urllib.parse.urlencode(data).encode()
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(
+            url, data=body, headers=headers, method=method
+        )
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=120) as response:
+                status = response.status
+                content = response.read()
+                location = response.headers.get('Location', '')
+        except urllib.error.HTTPError as error:
+            status = error.code
+            content = error.read()
+            location = error.headers.get('Location', '')
+        except OSError:
+            status, content, location = None, b'', ''
+        self.record(f'{method} {name}', time.perf_counter() - start,
+                    status == expect)
+        return status, content, location
+
+    def created_id(self, location, key):
+        """
+        Reads the id of a created object from the redirect to its page.
+        """
+        if not location:
+            raise CommandError('A form was rejected, see the server log.')
+        return resolve(urllib.parse.urlsplit(location).path).kwargs[key]
+
+
+class Command(BaseCommand):
+    """
+    Runs the journey of new students against a server: register, log in,
+    create a subject and a deck, add cards with images and take the quiz
+    of the deck a few times, reviewing the due cards.
+
+    Reports the throughput and latency percentiles of each endpoint, and
+    can save them as a JSON baseline and compare a run to a baseline.
+
+    The server is either given by --url or started locally with --start,
+    using the settings and database of this command. The students are
+    deleted from that database afterwards unless --keep-data is given.
+    """
+    help = 'Load-tests the core user journeys against a server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Base URL of the server to test.'
+        )
+        parser.add_argument(
+            '--start',
+            choices=sorted(SERVERS),
+            help='Start the wsgi or asgi deployment on the port of --url.'
+        )
+        parser.add_argument(
+            '--students',
+            type=int,
+            default=20,
+            help='Number of students running the journey.'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=5,
+            help='Number of students active at the same time.'
+        )
+        parser.add_argument(
+            '--cards',
+            type=int,
+            default=5,
+            help='Number of cards each student adds.'
+        )
+        parser.add_argument(
+            '--images',
+            type=int,
+            default=2,
+            help='Number of the added cards with a question image.'
+        )
+        parser.add_argument(
+            '--quiz-rounds',
+            type=int,
+            default=3,
+            help='Number of times each student takes the quiz.'
+        )
+        parser.add_argument(
+            '--save',
+            metavar='PATH',
+            help='Save the results as a JSON baseline.'
+        )
+        parser.add_argument(
+            '--compare',
+            metavar='PATH',
+            help='Compare the results with a saved baseline.'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=20.0,
+            help='Percentage by which p95 latency or throughput may be '
+                 'worse than the baseline.'
+        )
+        parser.add_argument(
+            '--keep-data',
+            action='store_true',
+            help='Keep the students and their cards.'
+        )
+
+    def journey(self, student, number, options, image):
+        """
+        Runs the journey of one student.
+        """
+        email = f'{USERNAME_PREFIX}{self.run_id}-{number}@example.com'
+        student.request('GET', 'register')
+        student.request('POST', 'register', data={
+            'email': email,
+            'first_name': 'Load',
+            'last_name': f'Test {number}',
+            'password1': PASSWORD,
+            'password2': PASSWORD,
+        }, expect=302)
+        student.request('GET', 'login')
+        student.request('POST', 'login', data={
+            'email': email,
+            'password': PASSWORD,
+        }, expect=302)
+        student.request('GET', 'cards-home')
+
+        student.request('GET', 'create_subject')
+        _, _, location = student.request('POST', 'create_subject', data={
+            'name': f'Subject {number}',
+        }, expect=302)
+        subject = {'subject_id': student.created_id(location, 'subject_id')}
+        student.request('GET', 'subject_detail', subject)
+        student.request('GET', 'create_deck', subject)
+        _, _, location = student.request('POST', 'create_deck', subject, data={
+            'name': f'Deck {number}',
+            'description': 'Created by the load test.',
+        }, expect=302)
+        deck = {'deck_id': student.created_id(location, 'deck_id')}
+        student.request('GET', 'deck_detail', deck)
+
+        student.request('GET', 'create_card', deck)
+        for card in range(options['cards']):
+            files = {}
+            if card < options['images']:
+                files['question_image'] = ('card.jpg', 'image/jpeg', image)
+            student.request('POST', 'create_card', deck, data={
+                'question': f'Question {card} of student {number}',
+                'answer': f'Answer {card}',
+            }, files=files)
+
+        for _ in range(options['quiz_rounds']):
+            # quiz.js streams the pages after the first one
+            _, content, _ = student.request('GET', 'quiz_view', deck)
+            next_url = page_data(content, 'cards-next')
+            while next_url:
+                _, content, _ = student.request(
+                    'GET', 'quiz_cards', deck,
+                    query=urllib.parse.urlsplit(next_url).query
+                )
+                try:
+                    next_url = json.loads(content)['next']
+                except (ValueError, KeyError):
+                    next_url = None
+            _, content, _ = student.request(
+                'GET', 'quiz_view', deck, query='mode=due'
+            )
+            for card in page_data(content, 'cards-data', []):
+                student.request(
+                    'POST', 'review_card', {'card_id': card['id']},
+                    data={'quality': random.randint(3, 5)}
+                )
+
+    def run(self, base_url, headers, options):
+        """
+        Runs the journeys of all students.
+
+        Returns:
+            tuple: The samples and failures of each endpoint and the wall
+                time of the run.
+        """
+        samples = defaultdict(list)
+        failures = defaultdict(int)
+        errors = []
+        lock = threading.Lock()
+        remaining = iter(range(options['students']))
+        image = generated_jpeg().read()
+
+        def record(endpoint, duration, ok):
+            with lock:
+                samples[endpoint].append(duration)
+                if not ok:
+                    failures[endpoint] += 1
+
+        def worker():
+            while True:
+                with lock:
+                    number = next(remaining, None)
+                if number is None:
+                    return
+                student = Student(base_url, headers, record)
+                try:
+                    self.journey(student, number, options, image)
+                except Exception as error:
+                    with lock:
+                        errors.append(f'Student {number}: {error}')
+
+        threads = [
+            threading.Thread(target=worker)
+            for _ in range(options['concurrency'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        for error in errors:
+            self.stderr.write(error)
+        return samples, failures, wall
+
+    def results(self, samples, failures, wall, options):
+        """
+        Summarizes a run as the baseline format.
+        """
+        endpoints = {}
+        for endpoint, durations in sorted(samples.items()):
+            endpoints[endpoint] = dict(
+                summarize(durations),
+                failures=failures[endpoint],
+                throughput=len(durations) / wall,
+            )
+        everything = [d for durations in samples.values() for d in durations]
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'created': timezone.now().isoformat(),
+            'commit': commit,
+            'options': {
+                key: options[key] for key in (
+                    'url', 'start', 'students', 'concurrency', 'cards',
+                    'images', 'quiz_rounds',
+                )
+            },
+            'wall_seconds': wall,
+            'total': dict(
+                summarize(everything),
+                failures=sum(failures.values()),
+                throughput=len(everything) / wall,
+            ),
+            'endpoints': endpoints,
+        }
+
+    def report(self, results):
+        for endpoint, result in results['endpoints'].items():
+            self.stdout.write(format_summary(endpoint, result))
+            self.stdout.write(
+                f'{"":<32} {result["throughput"]:8.1f} requests/s '
+                f'failures={result["failures"]}'
+            )
+        total = results['total']
+        self.stdout.write(format_summary('total', total))
+        self.stdout.write(
+            f'{"":<32} {total["throughput"]:8.1f} requests/s '
+            f'failures={total["failures"]} '
+            f'in {results["wall_seconds"]:.1f}s'
+        )
+
+    def compare(self, results, baseline, tolerance):
+        """
+        Compares a run with a baseline made with the same options.
+
+        An endpoint with at least MIN_COMPARED_SAMPLES requests regresses
+        when its p95 latency grows by more than `tolerance` percent, and
+        any endpoint regresses when it fails more often. The run regresses when
+        its total throughput drops by more than `tolerance` percent.
+
+        Returns:
+            list: The endpoints that regressed, "total" for throughput.
+        """
+        regressions = []
+        limit = 1 + tolerance / 100
+        self.stdout.write(
+            f'Compared with {baseline.get("commit") or "the baseline"} '
+            f'of {baseline.get("created", "an unknown date")}:'
+        )
+        if baseline.get('options') != results['options']:
+            self.stderr.write(
+                'The baseline was made with other options, its numbers may '
+                'not be comparable.'
+            )
+        for endpoint, result in results['endpoints'].items():
+            before = baseline['endpoints'].get(endpoint)
+            if before is None:
+                continue
+            change = result['p95_ms'] / max(before['p95_ms'], 1e-9)
+            regressed = result['failures'] > before['failures'] or (
+                change > limit and result['count'] >= MIN_COMPARED_SAMPLES
+            )
+            self.stdout.write(
+                f'{endpoint:<32} p95 {before["p95_ms"]:8.3f}ms -> '
+                f'{result["p95_ms"]:8.3f}ms ({(change - 1) * 100:+4.0f}%) '
+                f'failures {before["failures"]} -> {result["failures"]}'
+                + ('  REGRESSED' if regressed else '')
+            )
+            if regressed:
+                regressions.append(endpoint)
+        before = baseline['total']['throughput']
+        after = results['total']['throughput']
+        regressed = before / max(after, 1e-9) > limit
+        self.stdout.write(
+            f'{"total":<32} {before:8.1f} -> {after:8.1f} requests/s'
+            + ('  REGRESSED' if regressed else '')
+        )
+        if regressed:
+            regressions.append('total')
+        return regressions
+
+    def cleanup(self):
+        """
+        Deletes the students of this run and their cards.
+        """
+        prefix = f'{USERNAME_PREFIX}{self.run_id}-'
+        for subject in Subject.objects.filter(
+            creator__username__startswith=prefix
+        ):
+            subject.delete()
+        User.objects.filter(username__startswith=prefix).delete()
+
+    def handle(self, *args, **options):
+        self.run_id = uuid.uuid4().hex[:8]
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+        base_url = options['url']
+        headers = {}
+        try:
+            if options['start']:
+                port = urllib.parse.urlsplit(base_url).port or 80
+                base_url = f'http://127.0.0.1:{port}'
+                # The local deployment only answers its allowed hosts
+                headers['Host'] = '{0}:{1}'.format(
+                    settings.ALLOWED_HOSTS[0].lstrip('.'), port
+                )
+                with serve(options['start'], port):
+                    samples, failures, wall = self.run(
+                        base_url, headers, options
+                    )
+            else:
+                samples, failures, wall = self.run(base_url, headers, options)
+        finally:
+            if not options['keep_data']:
+                self.cleanup()
+
+        results = self.results(samples, failures, wall, options)
+        self.report(results)
+        if options['save']:
+            with open(options['save'], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2)
+            self.stdout.write(f'Saved the baseline to {options["save"]}.')
+        if baseline is not None:
+            regressions = self.compare(
+                results, baseline, options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    f'Regressed beyond {options["tolerance"]:g}%: '
+                    f'{", ".join(regressions)}.'
+                )
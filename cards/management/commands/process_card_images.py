@@ -0,0 +1,201 @@
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from cards.images import render_variants
+from cards.models import Card, CardImage, bump_deck_revision
+from cards.similarity import refresh_changed_indexes
+
+
+class Command(BaseCommand):
+    """
+    Converts card images uploaded with CARD_IMAGE_PROCESSING set to
+    "deferred".
+
+    The images are read from and written to storage by this process, only
+    the decoding, resizing and WEBP encoding run in the process pool.
+
+    Whenever the queue is empty, the saved similarity indexes of the users
+    whose cards changed are brought up to date, so building them stays off
+    the request path.
+    """
+    help = 'Converts the images of cards waiting for processing to WEBP.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Number of worker processes converting images.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of cards read from the queue at a time.'
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Keep polling for new uploads instead of exiting.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds between polls when the queue is empty.'
+        )
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=context
+        ) as pool:
+            since = None
+            while True:
+                processed = self.process_batch(pool, options['batch_size'])
+                if processed:
+                    self.stdout.write(f'Processed {processed} card(s).')
+                    continue
+                saved, since = refresh_changed_indexes(since)
+                if saved:
+                    self.stdout.write(
+                        f'Saved the similarity index of {saved} user(s).'
+                    )
+                if options['watch']:
+                    time.sleep(options['interval'])
+                else:
+                    break
+
+    def process_batch(self, pool, batch_size):
+        """
+        Converts the images of the next batch of processing cards.
+
+        Uploads whose content is already stored are attached straight away,
+        the others are converted in the pool. Cards whose images cannot be
+        read or converted keep their originals and leave the queue, so a
+        broken upload does not stop the worker.
+
+        Arguments:
+            pool (ProcessPoolExecutor): The pool running the conversions.
+            batch_size (int): The maximum number of cards to process.
+
+        Returns:
+            int: The number of cards taken from the queue.
+        """
+        cards = list(
+            Card.objects.filter(
+                image_status=Card.PROCESSING
+            ).order_by('id')[:batch_size]
+        )
+        originals = {
+            card.pk: {
+                field_name: getattr(card, field_name).name
+                for field_name in Card.IMAGE_FIELDS
+            }
+            for card in cards
+        }
+        attached = {card.pk: [] for card in cards}
+        jobs = []
+        for card in cards:
+            for field_name in Card.IMAGE_FIELDS:
+                image_field = getattr(card, field_name)
+                if not image_field or card.has_variants(field_name):
+                    continue
+                try:
+                    with image_field.open('rb'):
+                        data = image_field.read()
+                except OSError as error:
+                    # Storages raise OSError subclasses for missing and
+                    # unreadable files, network errors included
+                    self.stderr.write(
+                        f'Could not read {image_field.name}: {error}'
+                    )
+                    continue
+                digest = hashlib.sha256(data).hexdigest()
+                card_image = CardImage.objects.acquire(digest)
+                if card_image:
+                    card.attach_image(field_name, card_image)
+                    attached[card.pk].append(field_name)
+                else:
+                    future = pool.submit(render_variants, data)
+                    jobs.append((card, field_name, digest, future))
+
+        for card, field_name, digest, future in jobs:
+            try:
+                variants = future.result()
+            except Exception as error:
+                # Leave the original in place rather than retrying forever
+                self.stderr.write(
+                    f'Could not convert {originals[card.pk][field_name]}: '
+                    f'{error}'
+                )
+                continue
+            card_image = CardImage.objects.create_from_variants(
+                digest,
+                variants
+            )
+            card.attach_image(field_name, card_image)
+            attached[card.pk].append(field_name)
+
+        for card in cards:
+            self.swap_images(card, originals[card.pk], attached[card.pk])
+        return len(cards)
+
+    def swap_images(self, card, originals, attached):
+        """
+        Points the card to its converted images and marks it as ready.
+
+        The update only applies if the card's images did not change while
+        they were being converted, otherwise the new upload is picked up by
+        the next batch and the references taken for this one are released.
+
+        Arguments:
+            card (Card): The card holding the converted images.
+            originals (dict): The image names read from the queue.
+            attached (list): The names of the converted image fields.
+        """
+        unchanged = Q()
+        for field_name, name in originals.items():
+            if name:
+                unchanged &= Q(**{field_name: name})
+            else:
+                unchanged &= (
+                    Q(**{field_name: ''})
+                    | Q(**{f'{field_name}__isnull': True})
+                )
+        new_values = {}
+        for field_name in attached:
+            new_values[field_name] = getattr(card, field_name).name
+            new_values[field_name + '_variants'] = getattr(
+                card,
+                field_name + '_variants'
+            )
+            new_values[field_name + '_ref'] = getattr(
+                card,
+                field_name + '_ref'
+            )
+        updated = Card.objects.filter(
+            unchanged,
+            pk=card.pk,
+            image_status=Card.PROCESSING
+        ).update(
+            image_status=Card.READY,
+            updated_at=timezone.now(),
+            **new_values
+        )
+        if updated:
+            bump_deck_revision(card.deck_id)
+            storage = card.question_image.storage
+            for field_name in attached:
+                storage.delete(originals[field_name])
+        else:
+            CardImage.objects.release(
+                getattr(card, field_name + '_ref_id')
+                for field_name in attached
+            )
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from cards.models import Subject, Deck, Card, CardImage
+
+
+def count_subquery(queryset, group_by):
+    """
+    Builds a subquery counting the rows of `queryset` for the outer row.
+
+    Arguments:
+        queryset (QuerySet): The rows, already filtered on OuterRef('pk').
+        group_by (str): The field the rows are grouped on.
+    """
+    return Coalesce(Subquery(
+        queryset.order_by().values(group_by).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the denormalized counters from the rows they count.
+
+    The counters are kept up to date as cards and decks are created and
+    deleted, this command repairs them after changes that bypass the
+    models, such as queryset deletes in the admin.
+    """
+    help = 'Recomputes card and deck counts and image reference counts.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            decks = Deck.objects.update(card_count=count_subquery(
+                Card.objects.filter(deck=OuterRef('pk')),
+                'deck'
+            ))
+            subjects = Subject.objects.update(
+                deck_count=count_subquery(
+                    Deck.objects.filter(subject=OuterRef('pk')),
+                    'subject'
+                ),
+                card_count=count_subquery(
+                    Card.objects.filter(deck__subject=OuterRef('pk')),
+                    'deck__subject'
+                )
+            )
+            images = CardImage.objects.update(
+                ref_count=count_subquery(
+                    Card.objects.filter(question_image_ref=OuterRef('pk')),
+                    'question_image_ref'
+                ) + count_subquery(
+                    Card.objects.filter(answer_image_ref=OuterRef('pk')),
+                    'answer_image_ref'
+                )
+            )
+        unused = CardImage.objects.delete_unused()
+        self.stdout.write(
+            f'Recounted {decks} deck(s), {subjects} subject(s) and '
+            f'{images} image(s), removed {unused} unused image(s).'
+        )
@@ -10,8 +10,10 @@ class Migration(migrations.Migration):
         ('cards', '0003_card'),
     ]
 
+    # 0003_card creates the column already: adding it again fails on
+    # PostgreSQL, and SQLite only got away with it by rebuilding the table
     operations = [
-        migrations.AddField(
+        migrations.AlterField(
             model_name='card',
             name='deck',
             field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cards.deck'),
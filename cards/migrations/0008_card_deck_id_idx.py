@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-17 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0007_cardschedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['deck', 'id'], name='card_deck_id_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.10 on 2026-10-17 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0008_card_deck_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='image_status',
+            field=models.CharField(choices=[('ready', 'Ready'), ('processing', 'Processing')], default='ready', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(condition=models.Q(('image_status', 'processing')), fields=['id'], name='card_processing_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-17 23:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0009_card_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='answer_image_variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='question_image_variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.10 on 2026-10-17 23:26
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_cards(apps, schema_editor):
+    """
+    Fills in the counters of the existing decks and subjects.
+    """
+    Subject = apps.get_model('cards', 'Subject')
+    Deck = apps.get_model('cards', 'Deck')
+    Card = apps.get_model('cards', 'Card')
+    Deck.objects.update(card_count=Coalesce(Subquery(
+        Card.objects.filter(deck=OuterRef('pk')).order_by().values(
+            'deck'
+        ).annotate(count=Count('pk')).values('count')
+    ), 0))
+    Subject.objects.update(
+        deck_count=Coalesce(Subquery(
+            Deck.objects.filter(subject=OuterRef('pk')).order_by().values(
+                'subject'
+            ).annotate(count=Count('pk')).values('count')
+        ), 0),
+        card_count=Coalesce(Subquery(
+            Card.objects.filter(deck__subject=OuterRef('pk')).order_by(
+            ).values('deck__subject').annotate(
+                count=Count('pk')
+            ).values('count')
+        ), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0011_cardimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deck',
+            name='card_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='card_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='deck_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_cards, migrations.RunPython.noop),
+    ]
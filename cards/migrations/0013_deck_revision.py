@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-17 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0012_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deck',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
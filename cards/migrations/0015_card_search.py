@@ -0,0 +1,285 @@
+from django.db import migrations
+
+
+# SQLite: an FTS5 table whose rowid is the card id
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE cards_card_search USING fts5(
+        question, answer, deck, subject, creator_id UNINDEXED,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER cards_card_search_insert AFTER INSERT ON cards_card
+    BEGIN
+        INSERT INTO cards_card_search (
+            rowid, question, answer, deck, subject, creator_id
+        )
+        SELECT NEW.id, NEW.question, NEW.answer,
+               d.name || ' ' || d.description, s.name, s.creator_id
+        FROM cards_deck d INNER JOIN cards_subject s ON s.id = d.subject_id
+        WHERE d.id = NEW.deck_id;
+    END
+    """,
+    """
+    CREATE TRIGGER cards_card_search_update
+    AFTER UPDATE OF question, answer, deck_id ON cards_card
+    WHEN OLD.question IS NOT NEW.question
+        OR OLD.answer IS NOT NEW.answer
+        OR OLD.deck_id IS NOT NEW.deck_id
+    BEGIN
+        DELETE FROM cards_card_search WHERE rowid = OLD.id;
+        INSERT INTO cards_card_search (
+            rowid, question, answer, deck, subject, creator_id
+        )
+        SELECT NEW.id, NEW.question, NEW.answer,
+               d.name || ' ' || d.description, s.name, s.creator_id
+        FROM cards_deck d INNER JOIN cards_subject s ON s.id = d.subject_id
+        WHERE d.id = NEW.deck_id;
+    END
+    """,
+    """
+    CREATE TRIGGER cards_card_search_delete AFTER DELETE ON cards_card
+    BEGIN
+        DELETE FROM cards_card_search WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER cards_deck_search_update
+    AFTER UPDATE OF name, description, subject_id ON cards_deck
+    WHEN OLD.name IS NOT NEW.name
+        OR OLD.description IS NOT NEW.description
+        OR OLD.subject_id IS NOT NEW.subject_id
+    BEGIN
+        UPDATE cards_card_search
+        SET deck = NEW.name || ' ' || NEW.description,
+            subject = (
+                SELECT name FROM cards_subject WHERE id = NEW.subject_id
+            ),
+            creator_id = (
+                SELECT creator_id FROM cards_subject
+                WHERE id = NEW.subject_id
+            )
+        WHERE rowid IN (SELECT id FROM cards_card WHERE deck_id = NEW.id);
+    END
+    """,
+    """
+    CREATE TRIGGER cards_subject_search_update
+    AFTER UPDATE OF name, creator_id ON cards_subject
+    WHEN OLD.name IS NOT NEW.name OR OLD.creator_id IS NOT NEW.creator_id
+    BEGIN
+        UPDATE cards_card_search
+        SET subject = NEW.name, creator_id = NEW.creator_id
+        WHERE rowid IN (
+            SELECT c.id FROM cards_card c
+            INNER JOIN cards_deck d ON d.id = c.deck_id
+            WHERE d.subject_id = NEW.id
+        );
+    END
+    """,
+    """
+    INSERT INTO cards_card_search (
+        rowid, question, answer, deck, subject, creator_id
+    )
+    SELECT c.id, c.question, c.answer,
+           d.name || ' ' || d.description, s.name, s.creator_id
+    FROM cards_card c
+    INNER JOIN cards_deck d ON d.id = c.deck_id
+    INNER JOIN cards_subject s ON s.id = d.subject_id
+    """,
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS cards_subject_search_update',
+    'DROP TRIGGER IF EXISTS cards_deck_search_update',
+    'DROP TRIGGER IF EXISTS cards_card_search_delete',
+    'DROP TRIGGER IF EXISTS cards_card_search_update',
+    'DROP TRIGGER IF EXISTS cards_card_search_insert',
+    'DROP TABLE IF EXISTS cards_card_search',
+]
+
+# PostgreSQL: a tsvector per card with a GIN index, the question weighs
+# most, then the answer, then the names of the deck and subject. Card ids
+# are bigint (BigAutoField), and bigint[] does not cast to integer[].
+POSTGRESQL_FORWARD = [
+    """
+    CREATE TABLE cards_card_search (
+        card_id bigint PRIMARY KEY,
+        creator_id integer NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX cards_card_search_document_idx
+    ON cards_card_search USING GIN (document)
+    """,
+    """
+    CREATE INDEX cards_card_search_creator_idx
+    ON cards_card_search (creator_id)
+    """,
+    """
+    CREATE FUNCTION cards_card_search_index(card_ids bigint[])
+    RETURNS void LANGUAGE sql AS $$
+        INSERT INTO cards_card_search (card_id, creator_id, document)
+        SELECT c.id, s.creator_id,
+               setweight(to_tsvector('english', c.question), 'A')
+               || setweight(to_tsvector('english', c.answer), 'B')
+               || setweight(
+                   to_tsvector('english', d.name || ' ' || d.description),
+                   'C'
+               )
+               || setweight(to_tsvector('english', s.name), 'D')
+        FROM cards_card c
+        INNER JOIN cards_deck d ON d.id = c.deck_id
+        INNER JOIN cards_subject s ON s.id = d.subject_id
+        WHERE c.id = ANY(card_ids)
+        ON CONFLICT (card_id) DO UPDATE
+        SET creator_id = EXCLUDED.creator_id, document = EXCLUDED.document
+    $$
+    """,
+    """
+    CREATE FUNCTION cards_card_search_rows() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM cards_card_search
+            WHERE card_id IN (SELECT id FROM old_cards);
+        ELSE
+            PERFORM cards_card_search_index(
+                ARRAY(SELECT id FROM new_cards)
+            );
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER cards_card_search_insert AFTER INSERT ON cards_card
+    REFERENCING NEW TABLE AS new_cards
+    FOR EACH STATEMENT EXECUTE FUNCTION cards_card_search_rows()
+    """,
+    # Transition tables cannot be used with a column list, so updates are
+    # indexed per row, and only when an indexed column changed
+    """
+    CREATE FUNCTION cards_card_search_row() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM cards_card_search_index(ARRAY[NEW.id]);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER cards_card_search_update
+    AFTER UPDATE OF question, answer, deck_id ON cards_card
+    FOR EACH ROW
+    WHEN (OLD.question IS DISTINCT FROM NEW.question
+          OR OLD.answer IS DISTINCT FROM NEW.answer
+          OR OLD.deck_id IS DISTINCT FROM NEW.deck_id)
+    EXECUTE FUNCTION cards_card_search_row()
+    """,
+    """
+    CREATE TRIGGER cards_card_search_delete AFTER DELETE ON cards_card
+    REFERENCING OLD TABLE AS old_cards
+    FOR EACH STATEMENT EXECUTE FUNCTION cards_card_search_rows()
+    """,
+    """
+    CREATE FUNCTION cards_deck_search_rows() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM cards_card_search_index(
+            ARRAY(SELECT id FROM cards_card WHERE deck_id = NEW.id)
+        );
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER cards_deck_search_update
+    AFTER UPDATE OF name, description, subject_id ON cards_deck
+    FOR EACH ROW
+    WHEN (OLD.name IS DISTINCT FROM NEW.name
+          OR OLD.description IS DISTINCT FROM NEW.description
+          OR OLD.subject_id IS DISTINCT FROM NEW.subject_id)
+    EXECUTE FUNCTION cards_deck_search_rows()
+    """,
+    """
+    CREATE FUNCTION cards_subject_search_rows() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM cards_card_search_index(ARRAY(
+            SELECT c.id FROM cards_card c
+            INNER JOIN cards_deck d ON d.id = c.deck_id
+            WHERE d.subject_id = NEW.id
+        ));
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER cards_subject_search_update
+    AFTER UPDATE OF name, creator_id ON cards_subject
+    FOR EACH ROW
+    WHEN (OLD.name IS DISTINCT FROM NEW.name
+          OR OLD.creator_id IS DISTINCT FROM NEW.creator_id)
+    EXECUTE FUNCTION cards_subject_search_rows()
+    """,
+    """
+    SELECT cards_card_search_index(ARRAY(SELECT id FROM cards_card))
+    """,
+]
+POSTGRESQL_BACKWARD = [
+    'DROP TRIGGER IF EXISTS cards_subject_search_update ON cards_subject',
+    'DROP TRIGGER IF EXISTS cards_deck_search_update ON cards_deck',
+    'DROP TRIGGER IF EXISTS cards_card_search_delete ON cards_card',
+    'DROP TRIGGER IF EXISTS cards_card_search_update ON cards_card',
+    'DROP TRIGGER IF EXISTS cards_card_search_insert ON cards_card',
+    'DROP FUNCTION IF EXISTS cards_subject_search_rows()',
+    'DROP FUNCTION IF EXISTS cards_deck_search_rows()',
+    'DROP FUNCTION IF EXISTS cards_card_search_row()',
+    'DROP FUNCTION IF EXISTS cards_card_search_rows()',
+    'DROP FUNCTION IF EXISTS cards_card_search_index(bigint[])',
+    'DROP TABLE IF EXISTS cards_card_search',
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+    'postgresql': (POSTGRESQL_FORWARD, POSTGRESQL_BACKWARD),
+}
+
+
+def run_statements(schema_editor, backward):
+    """
+    Runs the statements of the database vendor, other vendors have no
+    search index and search falls back to substring matching.
+    """
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    for statement in statements[backward]:
+        schema_editor.execute(statement, params=None)
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Creates the full-text index of the cards and the triggers keeping it
+    in sync with the cards, decks and subjects.
+    """
+    run_statements(schema_editor, backward=False)
+
+
+def drop_search_index(apps, schema_editor):
+    """
+    Drops the full-text index of the cards and its triggers.
+    """
+    run_statements(schema_editor, backward=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0014_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
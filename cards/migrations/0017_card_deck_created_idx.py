@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0016_card_deck_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['deck', 'created_at'], name='card_deck_created_idx'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.10 on 2026-10-18 00:47
+
+from importlib import import_module
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery
+import django.db.models.deletion
+
+card_search = import_module('cards.migrations.0015_card_search')
+# The triggers of the SQLite search index, without the table and backfill
+SQLITE_TRIGGERS = card_search.SQLITE_FORWARD[1:-1]
+SQLITE_DROP_TRIGGERS = card_search.SQLITE_BACKWARD[:-1]
+
+
+def run_sqlite(statements):
+    """
+    Returns a RunPython function running statements on SQLite only.
+    """
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement, params=None)
+    return run
+
+
+def fill_schedule_decks(apps, schema_editor):
+    """
+    Copies the deck of each card to its schedules and flags the cards
+    having a schedule.
+    """
+    Card = apps.get_model('cards', 'Card')
+    CardSchedule = apps.get_model('cards', 'CardSchedule')
+    CardSchedule.objects.update(deck=Subquery(
+        Card.objects.filter(pk=OuterRef('card')).values('deck')[:1]
+    ))
+    Card.objects.filter(
+        Exists(CardSchedule.objects.filter(card=OuterRef('pk')))
+    ).update(scheduled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0017_card_deck_created_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cardschedule',
+            name='schedule_user_due_idx',
+        ),
+        # SQLite rebuilds cards_card to add a NOT NULL column, which the
+        # search triggers referring to it would stop
+        migrations.RunPython(
+            run_sqlite(SQLITE_DROP_TRIGGERS), run_sqlite(SQLITE_TRIGGERS)
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='scheduled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(
+            run_sqlite(SQLITE_TRIGGERS), run_sqlite(SQLITE_DROP_TRIGGERS)
+        ),
+        migrations.AddField(
+            model_name='cardschedule',
+            name='deck',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='cards.deck'),
+        ),
+        migrations.RunPython(fill_schedule_decks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cardschedule',
+            name='deck',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cards.deck'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(condition=models.Q(('scheduled', False)), fields=['deck', 'id'], name='card_deck_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cardschedule',
+            index=models.Index(fields=['user', 'deck', 'due_at'], name='schedule_user_deck_due_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+from importlib import import_module
+from django.db import migrations
+
+card_search = import_module('cards.migrations.0015_card_search')
+
+# SQLite: the FTS5 table indexes the creator too, so a search matches the
+# creator column along with the words and only reads the rows of the user.
+# FTS5 tables cannot be altered, the table is created and filled again.
+SQLITE_FORWARD = card_search.SQLITE_BACKWARD + [
+    """
+    CREATE VIRTUAL TABLE cards_card_search USING fts5(
+        question, answer, deck, subject, creator_id,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+] + card_search.SQLITE_FORWARD[1:]
+SQLITE_BACKWARD = card_search.SQLITE_BACKWARD + card_search.SQLITE_FORWARD
+
+# PostgreSQL: one GIN index on the creator and the document, btree_gin
+# providing the GIN operator class of integers, instead of a GIN index on
+# the document and a btree on the creator the planner has to combine.
+# The extension is left installed on the way back, other indexes may use it.
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS btree_gin',
+    """
+    CREATE INDEX cards_card_search_creator_document_idx
+    ON cards_card_search USING GIN (creator_id, document)
+    """,
+    'DROP INDEX IF EXISTS cards_card_search_document_idx',
+    'DROP INDEX IF EXISTS cards_card_search_creator_idx',
+]
+POSTGRESQL_BACKWARD = [
+    """
+    CREATE INDEX cards_card_search_document_idx
+    ON cards_card_search USING GIN (document)
+    """,
+    """
+    CREATE INDEX cards_card_search_creator_idx
+    ON cards_card_search (creator_id)
+    """,
+    'DROP INDEX IF EXISTS cards_card_search_creator_document_idx',
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+    'postgresql': (POSTGRESQL_FORWARD, POSTGRESQL_BACKWARD),
+}
+
+
+def run_statements(schema_editor, backward):
+    """
+    Runs the statements of the database vendor, other vendors have no
+    search index.
+    """
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    for statement in statements[backward]:
+        schema_editor.execute(statement, params=None)
+
+
+def index_creators(apps, schema_editor):
+    """
+    Indexes the search rows by creator.
+    """
+    run_statements(schema_editor, backward=False)
+
+
+def unindex_creators(apps, schema_editor):
+    """
+    Restores the search index of migration 0015.
+    """
+    run_statements(schema_editor, backward=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0018_schedule_deck'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_creators, unindex_creators),
+    ]
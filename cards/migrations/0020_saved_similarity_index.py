@@ -0,0 +1,29 @@
+# Generated by Django 4.2.10 on 2026-10-18 01:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('cards', '0019_card_search_creator'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSimilarityIndex',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('data', models.BinaryField()),
+                ('synced_at', models.DateTimeField(null=True)),
+                ('saved_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['updated_at'], name='card_updated_idx'),
+        ),
+    ]
@@ -1,11 +1,81 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.files.base import ContentFile
 from django.core.exceptions import ValidationError
-from PIL import Image
-from io import BytesIO
-import os
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest, Substr
+from collections import Counter
+from datetime import timedelta
+from flashcards.tracking import FieldTrackerMixin
+from .images import render_variants
+from .versioning import bump_listing_versions
+import hashlib
+
+
+# The number of characters of a card's text shown in card listings
+CARD_PREVIEW_LENGTH = 200
+
+
+class SubjectQuerySet(models.QuerySet):
+    """
+    Queries for subjects, bundling the projections each page needs.
+    """
+    def for_user(self, user):
+        """
+        Returns the subjects created by a user.
+        """
+        return self.filter(creator=user)
+
+    def for_listing(self):
+        """
+        Loads only the fields shown in a list of subjects.
+        """
+        return self.only(
+            'id', 'name', 'creator_id', 'deck_count', 'card_count'
+        )
+
+
+class DeckQuerySet(models.QuerySet):
+    """
+    Queries for decks, bundling the projections each page needs.
+    """
+    def for_user(self, user):
+        """
+        Returns the decks in subjects created by a user, with their subject,
+        which the ownership check joins anyway.
+        """
+        return self.filter(subject__creator=user).select_related('subject')
+
+    def for_listing(self):
+        """
+        Loads only the fields shown in a list of decks.
+        """
+        return self.only('id', 'name', 'subject_id', 'card_count')
+
+
+class CardQuerySet(models.QuerySet):
+    """
+    Queries for cards, bundling the projections each page needs.
+    """
+    def for_listing(self):
+        """
+        Loads the image fields and the start of the question and answer, as
+        `question_preview` and `answer_preview`, instead of the full text.
+        The previews hold one character more than CARD_PREVIEW_LENGTH so
+        templates can tell when to truncate.
+        """
+        return self.only(
+            'id', 'deck_id', 'created_at', 'image_status',
+            'question_image', 'question_image_variants',
+            'answer_image', 'answer_image_variants'
+        ).annotate(
+            question_preview=Substr('question', 1, CARD_PREVIEW_LENGTH + 1),
+            answer_preview=Substr('answer', 1, CARD_PREVIEW_LENGTH + 1)
+        )
 
 
 # Create your models here.
@@ -17,14 +87,45 @@ class Subject(models.Model):
         name (str): The name of the subject.
         creator (User): The user who created the subject.
         created_at (datetime): The date and time when the subject was created.
+        updated_at (datetime): The date and time when the subject or any of
+            its decks and cards last changed.
+        deck_count (int): The number of decks in the subject.
+        card_count (int): The number of cards in all decks of the subject.
     """
     name = models.CharField(max_length=100)
     creator = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    deck_count = models.PositiveIntegerField(default=0)
+    card_count = models.PositiveIntegerField(default=0)
+
+    objects = SubjectQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """
+        Overridden save method to expire the cached subject list of the
+        creator.
+        """
+        super().save(*args, **kwargs)
+        bump_listing_versions(self.creator_id)
+
+    def delete(self, *args, **kwargs):
+        """
+        Overridden delete method to release the images of the subject's
+        cards, which are deleted along with it.
+        """
+        with transaction.atomic():
+            released = CardImage.objects.references(
+                Card.objects.filter(deck__subject=self)
+            )
+            bump_listing_versions(self.creator_id, self.pk)
+            result = super().delete(*args, **kwargs)
+        CardImage.objects.release(released)
+        return result
+
 
 class Deck(models.Model):
     """
@@ -35,15 +136,113 @@ class Deck(models.Model):
         description (str): A description of the deck.
         subject (Subject): The subject to which the deck belongs.
         created_at (datetime): The date and time when the deck was created.
+        updated_at (datetime): The date and time when the deck or any of its
+            cards last changed.
+        card_count (int): The number of cards in the deck.
+        revision (int): A number that changes whenever a card of the deck is
+            added, changed or removed.
     """
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    card_count = models.PositiveIntegerField(default=0)
+    revision = models.PositiveIntegerField(default=0)
+
+    objects = DeckQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """
+        Overridden save method to count new decks in their subject, mark
+        the subject as updated and expire the cached listings showing the
+        deck.
+        """
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            changes = {'updated_at': self.updated_at}
+            if adding:
+                changes['deck_count'] = F('deck_count') + 1
+            Subject.objects.filter(pk=self.subject_id).update(**changes)
+            bump_listing_versions(self.subject.creator_id, self.subject_id)
+
+    def delete(self, *args, **kwargs):
+        """
+        Overridden delete method to remove the deck and its cards from the
+        subject's counts and release the images of its cards.
+        """
+        with transaction.atomic():
+            Subject.objects.filter(pk=self.subject_id).update(
+                updated_at=timezone.now(),
+                deck_count=Greatest(F('deck_count') - 1, 0),
+                card_count=Greatest(
+                    F('card_count') - models.Subquery(
+                        Deck.objects.filter(pk=self.pk).values('card_count')
+                    ),
+                    0
+                )
+            )
+            released = CardImage.objects.references(self.card_set.all())
+            bump_listing_versions(self.subject.creator_id, self.subject_id)
+            result = super().delete(*args, **kwargs)
+        CardImage.objects.release(released)
+        return result
+
+
+def adjust_card_count(deck_id, delta):
+    """
+    Adds `delta` to the card count of a deck and of its subject, using
+    atomic updates so concurrent changes are never lost, bumps the deck's
+    revision, marks both as updated and expires the cached listings
+    showing the counts.
+
+    Call this inside the transaction that adds or removes the cards,
+    including bulk operations that bypass Card.save() and Card.delete().
+
+    Arguments:
+        deck_id (int): The primary key of the deck.
+        delta (int): The number of cards added, negative when removed.
+    """
+    if not delta:
+        return
+    now = timezone.now()
+    Deck.objects.filter(pk=deck_id).update(
+        card_count=Greatest(F('card_count') + delta, 0),
+        revision=F('revision') + 1,
+        updated_at=now
+    )
+    subject = Subject.objects.filter(deck__pk=deck_id).values(
+        'pk', 'creator_id'
+    ).first()
+    if subject is None:
+        return
+    Subject.objects.filter(pk=subject['pk']).update(
+        card_count=Greatest(F('card_count') + delta, 0),
+        updated_at=now
+    )
+    bump_listing_versions(subject['creator_id'], subject['pk'])
+
+
+def bump_deck_revision(deck_id):
+    """
+    Bumps the revision of a deck after one of its cards changed, so
+    payloads cached for the previous revision are no longer used, and
+    marks the deck and its subject as updated.
+
+    Arguments:
+        deck_id (int): The primary key of the deck.
+    """
+    now = timezone.now()
+    Deck.objects.filter(pk=deck_id).update(
+        revision=F('revision') + 1,
+        updated_at=now
+    )
+    Subject.objects.filter(deck__pk=deck_id).update(updated_at=now)
+
 
 def card_img(instance, filename):
     """
@@ -62,32 +261,270 @@ def card_img(instance, filename):
     )
 
 
-class Card(models.Model):
+class CardImageManager(models.Manager):
+    """
+    Manager handling the reference counts of card images.
+    """
+    def acquire(self, digest):
+        """
+        Takes a reference to the image with the given content digest.
+
+        Arguments:
+            digest (str): The SHA-256 hex digest of the uploaded bytes.
+
+        Returns:
+            CardImage: The image, or None if no image has this content.
+        """
+        updated = self.filter(digest=digest, ref_count__gt=0).update(
+            ref_count=F('ref_count') + 1
+        )
+        if not updated:
+            return None
+        return self.get(digest=digest)
+
+    def create_from_variants(self, digest, variants):
+        """
+        Stores the variants of a new image under its content key and takes
+        the first reference to it.
+
+        Arguments:
+            digest (str): The SHA-256 hex digest of the uploaded bytes.
+            variants (list): (width, bytes) tuples from `render_variants`,
+                largest first.
+
+        Returns:
+            CardImage: The new image, or the existing one if the same
+                content was stored concurrently.
+        """
+        name_root = 'card_images/{0}/{1}'.format(digest[:2], digest)
+        records = []
+        for index, (width, data) in enumerate(variants):
+            suffix = '.webp' if index == 0 else f'_{width}w.webp'
+            name = default_storage.save(
+                name_root + suffix,
+                ContentFile(data)
+            )
+            records.append({'width': width, 'name': name})
+        records.reverse()
+        try:
+            with transaction.atomic():
+                return self.create(
+                    digest=digest,
+                    name=records[-1]['name'],
+                    variants=records,
+                    ref_count=1
+                )
+        except IntegrityError:
+            for record in records:
+                default_storage.delete(record['name'])
+            return self.acquire(digest)
+
+    def references(self, cards, field_names=None):
+        """
+        Lists the image references held by a set of cards, for example
+        before the cards are deleted in bulk.
+
+        Arguments:
+            cards (QuerySet): The cards.
+            field_names (tuple): The image fields to count, all by default.
+
+        Returns:
+            Counter: The number of references per image primary key.
+        """
+        counts = Counter()
+        for field_name in field_names or Card.IMAGE_FIELDS:
+            ref_name = field_name + '_ref'
+            rows = cards.filter(
+                **{ref_name + '__isnull': False}
+            ).order_by().values_list(ref_name).annotate(count=Count('pk'))
+            for pk, count in rows:
+                counts[pk] += count
+        return counts
+
+    def retain(self, counts):
+        """
+        Adds references to images that are already referenced, for example
+        when cards are copied in bulk.
+
+        Arguments:
+            counts (Counter): The number of references to add per image
+                primary key, as returned by `references`.
+        """
+        for pk, count in counts.items():
+            self.filter(pk=pk).update(ref_count=F('ref_count') + count)
+
+    def release(self, ids):
+        """
+        Drops one reference to each of the given images, deleting the
+        images and their files once nothing refers to them.
+
+        Arguments:
+            ids (iterable): The primary keys of the images to release, an
+                image listed n times loses n references. A Counter from
+                `references` is accepted as well.
+        """
+        counts = ids if isinstance(ids, Counter) else Counter(ids)
+        for pk, count in counts.items():
+            self.filter(pk=pk, ref_count__gt=0).update(
+                ref_count=Greatest(F('ref_count') - count, 0)
+            )
+        if counts:
+            self.delete_unused(self.filter(pk__in=counts))
+
+    def delete_unused(self, images=None):
+        """
+        Deletes the images no card refers to, along with their files.
+
+        Arguments:
+            images (QuerySet): Optionally, the images to consider.
+
+        Returns:
+            int: The number of deleted images.
+        """
+        if images is None:
+            images = self.all()
+        deleted = 0
+        for card_image in images.filter(ref_count=0):
+            # Skip images that were acquired again in the meantime
+            rows, _ = self.filter(pk=card_image.pk, ref_count=0).delete()
+            if rows:
+                for variant in card_image.variants:
+                    default_storage.delete(variant['name'])
+                deleted += 1
+        return deleted
+
+
+class CardImage(models.Model):
+    """
+    Represents a converted card image, stored once per distinct upload.
+
+    Attributes:
+        digest (str): The SHA-256 hex digest of the uploaded bytes.
+        name (str): The storage name of the largest variant.
+        variants (list): The stored sizes of the image, smallest first, as
+            {"width", "name"} dictionaries.
+        ref_count (int): The number of card sides showing the image.
+        created_at (datetime): The date and time when the image was stored.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    variants = models.JSONField(default=list)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = CardImageManager()
+
+    def __str__(self):
+        return self.name
+
+
+class Card(FieldTrackerMixin, models.Model):
     """
     Represents a flashcard within a deck.
 
     Attributes:
         question (str): The question or front side of the card.
         question_image (ImageField): The image for the question side.
+        question_image_variants (list): The stored sizes of the question
+            image, copied from `question_image_ref`.
+        question_image_ref (CardImage): The stored question image.
         answer (str): The answer or back side of the card.
         answer_image (ImageField): The image for the answer side.
+        answer_image_variants (list): The stored sizes of the answer image.
+        answer_image_ref (CardImage): The stored answer image.
         deck (Deck): The deck to which the card belongs.
         created_at (datetime): The date and time when the card was created.
+        updated_at (datetime): The date and time when the card last changed.
+        image_status (str): Whether the images of the card are converted
+            ("ready") or waiting for the image worker ("processing").
+        scheduled (bool): Whether the card has a review schedule. Only the
+            owner of a deck reviews its cards, so cards without one are the
+            new cards of the due queue.
     """
+    IMAGE_FIELDS = ('question_image', 'answer_image')
+    tracked_fields = (
+        'question',
+        'answer',
+        'question_image',
+        'answer_image',
+        'deck',
+    )
+    READY = 'ready'
+    PROCESSING = 'processing'
+    IMAGE_STATUS_CHOICES = [
+        (READY, 'Ready'),
+        (PROCESSING, 'Processing'),
+    ]
+
     question = models.TextField(blank=True)
     question_image = models.ImageField(
         upload_to=card_img,
         blank=True,
         null=True
     )
+    question_image_variants = models.JSONField(default=list, blank=True)
+    question_image_ref = models.ForeignKey(
+        CardImage,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+'
+    )
     answer = models.TextField(blank=True)
     answer_image = models.ImageField(
         upload_to=card_img,
         blank=True,
         null=True
     )
+    answer_image_variants = models.JSONField(default=list, blank=True)
+    answer_image_ref = models.ForeignKey(
+        CardImage,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+'
+    )
     deck = models.ForeignKey(Deck, on_delete=models.CASCADE)
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    image_status = models.CharField(
+        max_length=10,
+        choices=IMAGE_STATUS_CHOICES,
+        default=READY
+    )
+    scheduled = models.BooleanField(default=False)
+
+    objects = CardQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a deck's cards in the quiz
+            models.Index(fields=['deck', 'id'], name='card_deck_id_idx'),
+            # Newest cards of a deck first on the manage cards page
+            models.Index(
+                fields=['deck', 'created_at'],
+                name='card_deck_created_idx'
+            ),
+            # Queue of the process_card_images command
+            models.Index(
+                fields=['id'],
+                condition=models.Q(image_status='processing'),
+                name='card_processing_idx'
+            ),
+            # New cards of a deck in the due queue
+            models.Index(
+                fields=['deck', 'id'],
+                condition=models.Q(scheduled=False),
+                name='card_deck_new_idx'
+            ),
+            # Cards of a deck changed since a similarity index was synced
+            models.Index(
+                fields=['deck', 'updated_at'],
+                name='card_deck_updated_idx'
+            ),
+            # Cards changed since the saved similarity indexes were refreshed
+            models.Index(fields=['updated_at'], name='card_updated_idx'),
+        ]
 
     def clean(self):
         """
@@ -105,40 +542,272 @@ class Card(models.Model):
 
     def save(self, *args, **kwargs):
         """
-        Overridden save method to process images before saving.
+        Overridden save method to process newly uploaded images before
+        saving. Image fields that did not change since the card was loaded
+        are left alone, so text-only edits do no image work at all.
+
+        When CARD_IMAGE_PROCESSING is "deferred", uploads that are not
+        already stored are kept as they are and the card is marked as
+        processing, the process_card_images command converts them later.
         """
         self.clean()
-        # Process question image
-        if self.question_image:
-            self.process_image(self.question_image)
+        deferred = settings.CARD_IMAGE_PROCESSING == 'deferred'
+        released = []
+        for field_name in self.IMAGE_FIELDS:
+            if not self.has_changed(field_name):
+                continue
+            image_field = getattr(self, field_name)
+            previous_ref_id = getattr(self, field_name + '_ref_id')
+            if image_field and not image_field._committed:
+                if not self.process_image(image_field, convert=not deferred):
+                    self.image_status = self.PROCESSING
+            elif not image_field:
+                self.detach_image(field_name)
+            current_ref_id = getattr(self, field_name + '_ref_id')
+            if previous_ref_id and previous_ref_id != current_ref_id:
+                released.append(previous_ref_id)
 
-        # Process answer image
-        if self.answer_image:
-            self.process_image(self.answer_image)
+        adding = self._state.adding
+        previous_deck_id = None
+        if not adding and self.has_changed('deck'):
+            previous_deck_id = self.loaded_value('deck')
+        content_changed = not adding and any(
+            name != 'deck' for name in self.changed_fields
+        )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                adjust_card_count(self.deck_id, 1)
+            elif previous_deck_id and previous_deck_id != self.deck_id:
+                adjust_card_count(previous_deck_id, -1)
+                adjust_card_count(self.deck_id, 1)
+                if self.scheduled:
+                    CardSchedule.objects.filter(card=self).update(
+                        deck_id=self.deck_id
+                    )
+            elif content_changed:
+                bump_deck_revision(self.deck_id)
+        CardImage.objects.release(released)
 
-        super().save(*args, **kwargs)
+    def delete(self, *args, **kwargs):
+        """
+        Overridden delete method to update the card counts and release the
+        card's images.
+        """
+        released = [
+            getattr(self, field_name + '_ref_id')
+            for field_name in self.IMAGE_FIELDS
+            if getattr(self, field_name + '_ref_id')
+        ]
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            adjust_card_count(self.deck_id, -1)
+        CardImage.objects.release(released)
+        return result
 
-    def process_image(self, image_field):
+    def process_image(self, image_field, convert=True):
         """
-        Processes the image by resizing and converting it to WEBP format.
+        Processes the image by resizing it to each of the card image widths
+        and converting it to WEBP format.
+
+        The upload is hashed first: if an image with the same content is
+        already stored, the card points to it and the upload is neither
+        decoded nor stored again.
 
         Arguments:
             image_field (ImageField): The image field to process.
+            convert (bool): Whether to convert the image if its content is
+                not stored yet.
+
+        Returns:
+            bool: True if the field now points to a stored image, False if
+                the conversion was skipped.
         """
-        MAX_SIZE = (800, 800)
-        with Image.open(image_field) as img:
-            # Resize the image if it's bigger than 800px
-            img.thumbnail(MAX_SIZE)
-
-            # Create a BytesIO object to save the image
-            in_mem_file = BytesIO()
-            img.save(in_mem_file, format='WEBP')
-            in_mem_file.seek(0)
-
-            # Change the file extension to .webp
-            filename = os.path.basename(image_field.name)
-            image_field.save(
-                filename,
-                ContentFile(in_mem_file.read()),
-                save=False
+        image_field.seek(0)
+        data = image_field.read()
+        digest = hashlib.sha256(data).hexdigest()
+        card_image = CardImage.objects.acquire(digest)
+        if card_image is None:
+            if not convert:
+                # The field stores the upload as it is
+                image_field.seek(0)
+                self.detach_image(image_field.field.name)
+                return False
+            card_image = CardImage.objects.create_from_variants(
+                digest,
+                render_variants(data)
             )
+        self.attach_image(image_field.field.name, card_image)
+        return True
+
+    def attach_image(self, field_name, card_image):
+        """
+        Points an image field to a stored image.
+
+        Arguments:
+            field_name (str): "question_image" or "answer_image".
+            card_image (CardImage): The image to show.
+        """
+        setattr(self, field_name, card_image.name)
+        setattr(self, field_name + '_variants', card_image.variants)
+        setattr(self, field_name + '_ref', card_image)
+
+    def detach_image(self, field_name):
+        """
+        Clears the stored image reference of an image field.
+
+        Arguments:
+            field_name (str): "question_image" or "answer_image".
+        """
+        setattr(self, field_name + '_variants', [])
+        setattr(self, field_name + '_ref', None)
+
+    def has_variants(self, field_name):
+        """
+        Returns True if the variants of an image field match its image.
+
+        Arguments:
+            field_name (str): "question_image" or "answer_image".
+        """
+        image_field = getattr(self, field_name)
+        variants = getattr(self, field_name + '_variants')
+        return bool(variants) and variants[-1]['name'] == image_field.name
+
+    def srcset(self, field_name, build_url=None):
+        """
+        Builds the srcset attribute of an image field from its variants.
+
+        Arguments:
+            field_name (str): "question_image" or "answer_image".
+            build_url (callable): Optional function applied to each URL,
+                for example request.build_absolute_uri.
+
+        Returns:
+            str: The srcset, or an empty string if the image has no
+                variants.
+        """
+        if not self.has_variants(field_name):
+            return ''
+        storage = getattr(self, field_name).storage
+        candidates = []
+        for variant in getattr(self, field_name + '_variants'):
+            url = storage.url(variant['name'])
+            if build_url:
+                url = build_url(url)
+            candidates.append(f'{url} {variant["width"]}w')
+        return ', '.join(candidates)
+
+
+class CardSchedule(models.Model):
+    """
+    Stores the spaced-repetition state of a card for a single user,
+    following the SM-2 algorithm.
+
+    Attributes:
+        user (User): The user studying the card.
+        card (Card): The card being scheduled.
+        deck (Deck): The deck of the card, copied from it so the due
+            cards of a deck are one range of the (user, deck, due_at)
+            index.
+        ease (float): The SM-2 easiness factor, never lower than 1.3.
+        interval (int): The number of days until the next review.
+        repetitions (int): The number of successful reviews in a row.
+        due_at (datetime): The date and time when the card is next due.
+        reviewed_at (datetime): The date and time of the last review.
+    """
+    MIN_EASE = 1.3
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    card = models.ForeignKey(Card, on_delete=models.CASCADE)
+    deck = models.ForeignKey(Deck, on_delete=models.CASCADE)
+    ease = models.FloatField(default=2.5)
+    interval = models.PositiveIntegerField(default=0)
+    repetitions = models.PositiveIntegerField(default=0)
+    due_at = models.DateTimeField(default=timezone.now)
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'card'],
+                name='unique_schedule_per_user_card'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'deck', 'due_at'],
+                name='schedule_user_deck_due_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username}: {self.card_id} due {self.due_at}'
+
+    def save(self, *args, **kwargs):
+        """
+        Overridden save method to copy the deck of the card and to take a
+        new schedule's card out of the new cards.
+        """
+        adding = self._state.adding
+        if self.deck_id is None:
+            self.deck_id = self.card.deck_id
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Card.objects.filter(pk=self.card_id, scheduled=False).update(
+                    scheduled=True
+                )
+                if CardSchedule.card.is_cached(self):
+                    self.card.scheduled = True
+
+    def review(self, quality):
+        """
+        Updates the schedule after a review, using the SM-2 algorithm.
+
+        Arguments:
+            quality (int): How well the card was recalled, from 0 (blackout)
+                to 5 (perfect recall).
+        """
+        if quality < 3:
+            self.repetitions = 0
+            self.interval = 1
+        else:
+            if self.repetitions == 0:
+                self.interval = 1
+            elif self.repetitions == 1:
+                self.interval = 6
+            else:
+                self.interval = round(self.interval * self.ease)
+            self.repetitions += 1
+        self.ease = max(
+            self.MIN_EASE,
+            self.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+        )
+        self.reviewed_at = timezone.now()
+        self.due_at = self.reviewed_at + timedelta(days=self.interval)
+
+
+class SavedSimilarityIndex(models.Model):
+    """
+    The similarity index of a user's cards, saved so that every process
+    serving requests can load it instead of building it, see
+    cards/similarity.py.
+
+    Attributes:
+        user (User): The owner of the cards.
+        data (bytes): The arrays of the index, in the numpy .npz format.
+        synced_at (datetime): The last modification time of the cards read
+            into the index, or None if the user had no cards.
+        saved_at (datetime): When the index was last saved.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    data = models.BinaryField()
+    synced_at = models.DateTimeField(null=True)
+    saved_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user.username}: similarity index of {self.saved_at}'
@@ -0,0 +1,194 @@
+"""
+Full-text search over the cards of a user.
+
+The cards are indexed in the `cards_card_search` table created by migration
+0015: an FTS5 table on SQLite and a tsvector column on PostgreSQL. Both index
+the creator of each card along with its words (migration 0019), so a search
+reads the rows of one user rather than the matches of every user. Database
+triggers keep the index in sync with the cards, decks
+and subjects, including bulk inserts and updates that bypass save(). Other
+databases have no index and fall back to substring matching.
+"""
+import re
+from collections import namedtuple
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Card
+
+# The number of results per page
+SEARCH_PAGE_SIZE = 20
+# Results further than this are not served, deep pages get slower
+SEARCH_MAX_PAGE = 50
+# The words of a query, without the operators of either search syntax
+SEARCH_TERM = re.compile(r'[^\W_]+')
+
+# The text columns of the SQLite index, searched by the words of a query
+SQLITE_TEXT_COLUMNS = '{question answer deck subject}'
+
+# The card ids of a user matching a query string, best first
+RANKED_QUERIES = {
+    # The match expression includes the creator, see match_expression
+    'sqlite': (
+        'SELECT rowid FROM cards_card_search '
+        'WHERE cards_card_search MATCH %s '
+        # Weights of the question, answer, deck, subject and creator columns
+        'ORDER BY bm25(cards_card_search, 4.0, 2.0, 1.0, 0.5, 0.0), rowid '
+        'LIMIT %s OFFSET %s'
+    ),
+    'postgresql': (
+        "SELECT card_id FROM cards_card_search, "
+        "to_tsquery('english', %s) query "
+        'WHERE document @@ query AND creator_id = %s '
+        'ORDER BY ts_rank_cd(document, query) DESC, card_id '
+        'LIMIT %s OFFSET %s'
+    ),
+}
+# The card ids matching a query string, in any order
+MATCH_QUERIES = {
+    'sqlite': (
+        'SELECT rowid FROM cards_card_search '
+        'WHERE cards_card_search MATCH %s'
+    ),
+    'postgresql': (
+        'SELECT card_id FROM cards_card_search '
+        "WHERE document @@ to_tsquery('english', %s)"
+    ),
+}
+
+# One page of search results
+SearchPage = namedtuple('SearchPage', ['cards', 'number', 'has_next'])
+
+
+def search_terms(query):
+    """
+    Splits a query into words.
+
+    Arguments:
+        query (str): The query typed by the user.
+
+    Returns:
+        list: The words, lowercased.
+    """
+    return SEARCH_TERM.findall(query.lower())
+
+
+def match_expression(terms, vendor=None, user_id=None):
+    """
+    Builds the full-text query matching cards containing every term, the
+    last word of a query typed so far matching as a prefix as well.
+
+    Arguments:
+        terms (list): The words from `search_terms`.
+        vendor (str): The database vendor, defaults to the connection's.
+        user_id (int): Optionally, on SQLite, the creator whose cards to
+            match. PostgreSQL queries filter on the creator_id column.
+
+    Returns:
+        str: The FTS5 MATCH or PostgreSQL to_tsquery expression.
+    """
+    vendor = vendor or connection.vendor
+    if vendor == 'postgresql':
+        return ' & '.join(f'{term}:*' for term in terms)
+    words = ' '.join(f'"{term}"*' for term in terms)
+    expression = f'{SQLITE_TEXT_COLUMNS} : ({words})'
+    if user_id is not None:
+        expression = f'creator_id : "{int(user_id)}" AND {expression}'
+    return expression
+
+
+def has_search_index():
+    """
+    Returns True if the database has a full-text index of the cards.
+    """
+    return connection.vendor in RANKED_QUERIES
+
+
+def search_cards(user, query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """
+    Finds the cards of a user whose question, answer, deck or subject
+    contain every word of a query, best matches first.
+
+    Only the requested page is ranked and loaded, and no count of all the
+    matches is made, so the cost of a search follows the number of matches
+    rather than the number of cards.
+
+    Arguments:
+        user (User): The owner of the cards.
+        query (str): The query typed by the user.
+        page (int): The page number, from 1 to SEARCH_MAX_PAGE.
+        per_page (int): The number of results per page.
+
+    Returns:
+        SearchPage: The cards of the page, with their deck and subject.
+    """
+    terms = search_terms(query)
+    page = min(max(page, 1), SEARCH_MAX_PAGE)
+    if not terms:
+        return SearchPage([], page, False)
+    offset = (page - 1) * per_page
+    if has_search_index():
+        if connection.vendor == 'sqlite':
+            params = [match_expression(terms, user_id=user.pk)]
+        else:
+            params = [match_expression(terms), user.pk]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                RANKED_QUERIES[connection.vendor],
+                params + [per_page + 1, offset]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(question__icontains=term)
+                | Q(answer__icontains=term)
+                | Q(deck__name__icontains=term)
+                | Q(deck__description__icontains=term)
+                | Q(deck__subject__name__icontains=term)
+            )
+        ids = list(Card.objects.filter(
+            condition,
+            deck__subject__creator=user
+        ).order_by('-id').values_list('id', flat=True)[
+            offset:offset + per_page + 1
+        ])
+    has_next = len(ids) > per_page and page < SEARCH_MAX_PAGE
+    ids = ids[:per_page]
+    cards = Card.objects.filter(pk__in=ids).for_listing().select_related(
+        'deck__subject'
+    ).in_bulk()
+    return SearchPage(
+        [cards[pk] for pk in ids if pk in cards],
+        page,
+        has_next
+    )
+
+
+def filter_cards(cards, query):
+    """
+    Narrows a queryset of cards to those matching a query through the
+    full-text index, for example in the admin.
+
+    Arguments:
+        cards (QuerySet): The cards.
+        query (str): The query.
+
+    Returns:
+        QuerySet: The matching cards, in the order of `cards`.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return cards
+    if not has_search_index():
+        condition = Q()
+        for term in terms:
+            condition &= Q(question__icontains=term) | Q(
+                answer__icontains=term
+            ) | Q(deck__name__icontains=term)
+        return cards.filter(condition)
+    return cards.filter(pk__in=RawSQL(
+        MATCH_QUERIES[connection.vendor],
+        [match_expression(terms)]
+    ))
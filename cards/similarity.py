@@ -0,0 +1,579 @@
+"""
+TF-IDF similarity between the cards of a user.
+
+Each process keeps, per user, a sparse matrix holding the term frequencies
+of the question and answer of every card. Words are hashed to a fixed
+number of columns, so adding a card never reshapes the matrix, and the
+document frequencies are kept as a vector updated with each card, so the
+IDF weights are always current without rebuilding anything. A query is a
+single sparse matrix-vector product giving the cosine similarity of a text
+to every card at once.
+
+Indexes are built off the request path and saved in the database, one
+SavedSimilarityIndex row per user, so every process and every host serving
+requests shares them. The process_card_images worker refreshes the saved
+indexes of the users whose cards changed whenever its image queue is empty,
+and the build_similarity_indexes command refreshes them all.
+
+Processes load the saved index of a user on first use, and again whenever a
+newer one was saved. Before each query an index reads only the cards
+changed since its last sync, so it follows edits made through any process.
+Deleted cards are noticed when they come up in results, and dropped from
+the saved indexes when they are refreshed.
+
+A user without a saved index gets no similarity results until the worker
+saves one, a few seconds after their first card, rather than a request
+reading all of their cards.
+"""
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from datetime import timedelta
+from io import BytesIO
+import numpy as np
+from django.db.models import Max
+from django.utils import timezone
+from scipy import sparse
+from .models import Card, SavedSimilarityIndex
+from .search import SEARCH_TERM
+
+# The number of hashed word columns
+SIMILARITY_FEATURES = 2 ** 17
+# The number of user indexes kept per process, least recently used first out
+SIMILARITY_MAX_INDEXES = 64
+# The cosine similarity from which a new card is reported as similar
+SIMILARITY_THRESHOLD = 0.6
+SIMILAR_CARDS_LIMIT = 3
+RELATED_CARDS_LIMIT = 5
+# Cards changed this long before the last synced change are read again,
+# for writes committed late or stamped by servers with a lagging clock
+SIMILARITY_SYNC_MARGIN = timedelta(minutes=1)
+# The number of new rows collected before they are merged into the matrix
+SIMILARITY_FLUSH_ROWS = 256
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def vectorize(text):
+    """
+    Converts a text to hashed word columns and sublinear term frequencies.
+
+    Arguments:
+        text (str): The text.
+
+    Returns:
+        tuple: The sorted column indices (int32 array) and their weights
+            (float32 array).
+    """
+    counts = Counter(
+        zlib.crc32(word.encode()) % SIMILARITY_FEATURES
+        for word in SEARCH_TERM.findall(text.lower())
+    )
+    indices = np.fromiter(sorted(counts), dtype=np.int32, count=len(counts))
+    values = 1 + np.log(
+        np.fromiter(
+            (counts[index] for index in indices),
+            dtype=np.float32,
+            count=len(counts)
+        )
+    )
+    return indices, values.astype(np.float32)
+
+
+def card_text(question, answer):
+    """
+    Returns the text of a card compared for similarity.
+    """
+    return f'{question}\n{answer}'
+
+
+class SimilarityIndex:
+    """
+    The TF-IDF index of the cards of one user.
+
+    New rows are collected in a small pending matrix and only merged into
+    the main matrix once there are SIMILARITY_FLUSH_ROWS of them, so adding
+    a card does not copy the whole index. Replacing or removing a card
+    marks its row dead, and dead rows are dropped at the next merge once
+    they make up half of the matrix.
+
+    Attributes:
+        user_id (int): The owner of the cards.
+        synced_at (datetime): The last modification time read from the
+            database, or None before the first sync.
+        saved_at (datetime): When the saved index this one was loaded
+            from or saved as was saved, or None.
+    """
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.synced_at = None
+        self.saved_at = None
+        self.lock = threading.Lock()
+        self.matrix = sparse.csr_matrix(
+            (0, SIMILARITY_FEATURES),
+            dtype=np.float32
+        )
+        self.squares = self.matrix
+        self.card_ids = np.zeros(0, dtype=np.int64)
+        self.deck_ids = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.document_frequency = np.zeros(SIMILARITY_FEATURES, np.int32)
+        # The row and a checksum of the text of each live card
+        self.rows = {}
+        self.checksums = {}
+        # Rows added since the last merge, which of them were removed
+        # again, and their matrix once built
+        self._pending = []
+        self._dead_pending = set()
+        self._recent = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def set(self, card_id, deck_id, text):
+        """
+        Adds a card, replacing its previous text if it was indexed.
+
+        Returns:
+            bool: False if the card was indexed with this deck and text.
+        """
+        checksum = (deck_id, zlib.crc32(text.encode()))
+        if self.checksums.get(card_id) == checksum:
+            return False
+        self.remove(card_id)
+        indices, values = vectorize(text)
+        self.document_frequency[indices] += 1
+        self.rows[card_id] = len(self.card_ids) + len(self._pending)
+        self.checksums[card_id] = checksum
+        self._pending.append((card_id, deck_id, indices, values))
+        self._recent = None
+        return True
+
+    def remove(self, card_id):
+        """
+        Removes a card if it is indexed.
+        """
+        row = self.rows.pop(card_id, None)
+        if row is None:
+            return
+        del self.checksums[card_id]
+        offset = row - len(self.card_ids)
+        if offset >= 0:
+            indices = self._pending[offset][2]
+            self._dead_pending.add(offset)
+            self._recent = None
+        else:
+            start = self.matrix.indptr[row]
+            end = self.matrix.indptr[row + 1]
+            indices = self.matrix.indices[start:end]
+            self.alive[row] = False
+        self.document_frequency[indices] -= 1
+
+    def recent(self):
+        """
+        Returns the matrix, card ids, deck ids and live mask of the pending
+        rows.
+        """
+        if self._recent is None:
+            if self._pending:
+                card_ids, deck_ids, indices, values = zip(*self._pending)
+                indptr = np.concatenate(
+                    ([0], np.cumsum([len(row) for row in indices]))
+                )
+                matrix = sparse.csr_matrix(
+                    (np.concatenate(values), np.concatenate(indices), indptr),
+                    shape=(len(card_ids), SIMILARITY_FEATURES)
+                )
+            else:
+                card_ids = deck_ids = ()
+                matrix = sparse.csr_matrix(
+                    (0, SIMILARITY_FEATURES),
+                    dtype=np.float32
+                )
+            alive = np.ones(len(card_ids), dtype=bool)
+            alive[list(self._dead_pending)] = False
+            self._recent = (
+                matrix,
+                np.array(card_ids, dtype=np.int64),
+                np.array(deck_ids, dtype=np.int64),
+                alive
+            )
+        return self._recent
+
+    def flush(self):
+        """
+        Merges the pending rows into the main matrix, dropping the dead
+        rows once they make up half of it.
+        """
+        matrix, card_ids, deck_ids, alive = self.recent()
+        self.matrix = sparse.vstack([self.matrix, matrix], format='csr')
+        self.card_ids = np.concatenate((self.card_ids, card_ids))
+        self.deck_ids = np.concatenate((self.deck_ids, deck_ids))
+        self.alive = np.concatenate((self.alive, alive))
+        self._pending = []
+        self._dead_pending = set()
+        self._recent = None
+        if (~self.alive).sum() * 2 > len(self.alive):
+            self.matrix = self.matrix[self.alive]
+            self.card_ids = self.card_ids[self.alive]
+            self.deck_ids = self.deck_ids[self.alive]
+            self.alive = self.alive[self.alive]
+            self.rows = {
+                int(card_id): row for row, card_id in enumerate(self.card_ids)
+            }
+        self.squares = self.matrix.power(2)
+
+    def sync(self, reconcile=False):
+        """
+        Reads the cards changed since the last sync.
+
+        Arguments:
+            reconcile (bool): Whether to also drop the cards that were
+                deleted, which reads the ids of every card of the user.
+
+        Returns:
+            int: The number of cards added, changed or dropped.
+        """
+        changes = 0
+        cards = Card.objects.filter(deck__subject__creator_id=self.user_id)
+        changed = cards
+        if self.synced_at is not None:
+            changed = cards.filter(
+                updated_at__gte=self.synced_at - SIMILARITY_SYNC_MARGIN
+            )
+        rows = changed.values_list(
+            'id', 'deck_id', 'question', 'answer', 'updated_at'
+        ).iterator()
+        for card_id, deck_id, question, answer, updated_at in rows:
+            changes += self.set(card_id, deck_id, card_text(question, answer))
+            if self.synced_at is None or updated_at > self.synced_at:
+                self.synced_at = updated_at
+        if reconcile:
+            # Deletions leave no changed rows to read
+            existing = set(cards.values_list('id', flat=True))
+            for card_id in set(self.rows) - existing:
+                self.remove(card_id)
+                changes += 1
+        if len(self._pending) >= SIMILARITY_FLUSH_ROWS:
+            self.flush()
+        return changes
+
+    def save(self):
+        """
+        Saves the live rows of the index in the database, replacing the
+        saved index of the user.
+        """
+        self.flush()
+        alive = self.alive
+        matrix = self.matrix[alive]
+        card_ids = self.card_ids[alive]
+        output = BytesIO()
+        np.savez_compressed(
+            output,
+            data=matrix.data,
+            indices=matrix.indices,
+            indptr=matrix.indptr,
+            card_ids=card_ids,
+            deck_ids=self.deck_ids[alive],
+            checksums=np.array(
+                [self.checksums[card_id][1] for card_id in card_ids.tolist()],
+                dtype=np.uint32
+            ),
+            document_frequency=self.document_frequency
+        )
+        saved, _ = SavedSimilarityIndex.objects.update_or_create(
+            user_id=self.user_id,
+            defaults={'data': output.getvalue(), 'synced_at': self.synced_at}
+        )
+        self.saved_at = saved.saved_at
+
+    @classmethod
+    def load(cls, saved):
+        """
+        Loads an index saved with `save`.
+
+        Arguments:
+            saved (SavedSimilarityIndex): The saved index.
+        """
+        index = cls(saved.user_id)
+        index.synced_at = saved.synced_at
+        index.saved_at = saved.saved_at
+        with np.load(BytesIO(saved.data)) as arrays:
+            card_ids = arrays['card_ids']
+            index.matrix = sparse.csr_matrix(
+                (arrays['data'], arrays['indices'], arrays['indptr']),
+                shape=(len(card_ids), SIMILARITY_FEATURES)
+            )
+            index.card_ids = card_ids
+            index.deck_ids = arrays['deck_ids']
+            index.document_frequency = arrays['document_frequency']
+            checksums = arrays['checksums'].tolist()
+        index.squares = index.matrix.power(2)
+        index.alive = np.ones(len(card_ids), dtype=bool)
+        for row, (card_id, deck_id, checksum) in enumerate(zip(
+            card_ids.tolist(), index.deck_ids.tolist(), checksums
+        )):
+            index.rows[card_id] = row
+            index.checksums[card_id] = (deck_id, checksum)
+        return index
+
+    def idf(self):
+        """
+        Returns the smoothed inverse document frequency of every column.
+        """
+        count = len(self.rows)
+        return (
+            np.log((1 + count) / (1 + self.document_frequency)) + 1
+        ).astype(np.float32)
+
+    def query(self, vector, limit, exclude_card=None, exclude_deck=None,
+              threshold=0.0):
+        """
+        Finds the cards most similar to a term frequency vector.
+
+        Arguments:
+            vector (ndarray): The dense term frequencies of the query.
+            limit (int): The maximum number of cards.
+            exclude_card (int): Optionally, a card to leave out.
+            exclude_deck (int): Optionally, a deck whose cards to leave out.
+            threshold (float): The minimum cosine similarity.
+
+        Returns:
+            list: (card id, similarity) tuples, most similar first.
+        """
+        if not len(self.rows):
+            return []
+        idf = self.idf()
+        weighted = vector * idf
+        query_norm = np.sqrt(weighted @ weighted)
+        if not query_norm:
+            return []
+        recent, recent_card_ids, recent_deck_ids, recent_alive = self.recent()
+        squared_idf = idf * idf
+        scores = np.concatenate((
+            self.matrix @ (weighted * idf),
+            recent @ (weighted * idf)
+        ))
+        norms = np.sqrt(np.concatenate((
+            self.squares @ squared_idf,
+            recent.power(2) @ squared_idf
+        )))
+        card_ids = np.concatenate((self.card_ids, recent_card_ids))
+        deck_ids = np.concatenate((self.deck_ids, recent_deck_ids))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.nan_to_num(scores / (norms * query_norm))
+        scores[~np.concatenate((self.alive, recent_alive))] = 0
+        if exclude_card is not None:
+            scores[card_ids == exclude_card] = 0
+        if exclude_deck is not None:
+            scores[deck_ids == exclude_deck] = 0
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(card_ids[row]), float(scores[row]))
+            for row in top if scores[row] > 0 and scores[row] >= threshold
+        ]
+
+    def similar_to_text(self, text, limit, exclude_card=None, threshold=0.0):
+        """
+        Finds the cards most similar to a text.
+        """
+        indices, values = vectorize(text)
+        vector = np.zeros(SIMILARITY_FEATURES, dtype=np.float32)
+        vector[indices] = values
+        return self.query(
+            vector,
+            limit,
+            exclude_card=exclude_card,
+            threshold=threshold
+        )
+
+    def related_to_deck(self, deck_id, limit):
+        """
+        Finds the cards of other decks most similar to the cards of a deck
+        as a whole.
+        """
+        recent, _, recent_deck_ids, recent_alive = self.recent()
+        vector = np.zeros(SIMILARITY_FEATURES, dtype=np.float32)
+        for matrix, rows in (
+            (self.matrix, (self.deck_ids == deck_id) & self.alive),
+            (recent, (recent_deck_ids == deck_id) & recent_alive),
+        ):
+            if rows.any():
+                vector += np.asarray(matrix[rows].sum(axis=0)).ravel()
+        if not vector.any():
+            return []
+        return self.query(vector, limit, exclude_deck=deck_id)
+
+
+def keep_index(index):
+    """
+    Keeps an index in the process, dropping the least recently used ones
+    beyond SIMILARITY_MAX_INDEXES.
+    """
+    with _indexes_lock:
+        _indexes[index.user_id] = index
+        _indexes.move_to_end(index.user_id)
+        while len(_indexes) > SIMILARITY_MAX_INDEXES:
+            _indexes.popitem(last=False)
+
+
+def get_index(user_id):
+    """
+    Returns the similarity index of a user kept by the process, loading the
+    saved one on first use and whenever a newer one was saved.
+
+    Returns:
+        SimilarityIndex: The index, or None if none was saved yet.
+    """
+    saved_at = SavedSimilarityIndex.objects.filter(
+        user_id=user_id
+    ).values_list('saved_at', flat=True).first()
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None:
+            _indexes.move_to_end(user_id)
+    if saved_at is not None and (index is None or index.saved_at != saved_at):
+        saved = SavedSimilarityIndex.objects.filter(user_id=user_id).first()
+        if saved is not None:
+            index = SimilarityIndex.load(saved)
+            keep_index(index)
+    return index
+
+
+def refresh_indexes(user_ids, reconcile=False):
+    """
+    Brings the saved indexes of users up to date, creating those missing.
+    Indexes without changes are not saved again.
+
+    Arguments:
+        user_ids (iterable): The ids of the users.
+        reconcile (bool): Whether to drop the deleted cards.
+
+    Returns:
+        int: The number of indexes saved.
+    """
+    count = 0
+    for user_id in user_ids:
+        index = get_index(user_id)
+        if index is None:
+            index = SimilarityIndex(user_id)
+            keep_index(index)
+        with index.lock:
+            if index.sync(reconcile=reconcile) or index.saved_at is None:
+                index.save()
+                count += 1
+    return count
+
+
+def refresh_changed_indexes(since=None):
+    """
+    Brings up to date the saved indexes of the users whose cards changed
+    since a time, for workers polling for changes. Deleting cards changes
+    no row, build_similarity_indexes drops the deleted cards.
+
+    Arguments:
+        since (datetime): The time returned by the previous call. Defaults
+            to the last change read into a saved index, or to every user
+            owning cards when none was saved yet.
+
+    Returns:
+        tuple: The number of indexes saved and the `since` of the next
+            call.
+    """
+    started = timezone.now()
+    if since is None:
+        since = SavedSimilarityIndex.objects.aggregate(
+            last=Max('synced_at')
+        )['last']
+    cards = Card.objects.all()
+    if since is not None:
+        cards = cards.filter(updated_at__gte=since - SIMILARITY_SYNC_MARGIN)
+    user_ids = cards.order_by().values_list(
+        'deck__subject__creator_id', flat=True
+    ).distinct()
+    return refresh_indexes(list(user_ids)), started
+
+
+def clear_indexes():
+    """
+    Forgets the indexes of every user.
+    """
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def load_cards(index, scored):
+    """
+    Loads the cards of (card id, similarity) tuples, keeping their order.
+    Cards deleted since the index last looked for deletions are left out
+    and removed from the index.
+
+    Returns:
+        list: (card, similarity) tuples.
+    """
+    cards = Card.objects.filter(
+        pk__in=[card_id for card_id, _ in scored]
+    ).for_listing().select_related('deck__subject').in_bulk()
+    missing = [card_id for card_id, _ in scored if card_id not in cards]
+    if missing:
+        with index.lock:
+            for card_id in missing:
+                index.remove(card_id)
+    return [
+        (cards[card_id], score) for card_id, score in scored
+        if card_id in cards
+    ]
+
+
+def similar_cards(user, card, limit=SIMILAR_CARDS_LIMIT,
+                  threshold=SIMILARITY_THRESHOLD):
+    """
+    Finds the other cards of a user that are near duplicates of a card.
+
+    Arguments:
+        user (User): The owner of the cards.
+        card (Card): The saved card.
+        limit (int): The maximum number of cards.
+        threshold (float): The minimum cosine similarity.
+
+    Returns:
+        list: (card, similarity) tuples, most similar first, empty while
+            the user has no saved index.
+    """
+    index = get_index(user.pk)
+    if index is None:
+        return []
+    with index.lock:
+        index.sync()
+        scored = index.similar_to_text(
+            card_text(card.question, card.answer),
+            limit,
+            exclude_card=card.pk,
+            threshold=threshold
+        )
+    return load_cards(index, scored)
+
+
+def related_cards(user, deck, limit=RELATED_CARDS_LIMIT):
+    """
+    Finds the cards of a user's other decks most related to a deck.
+
+    Arguments:
+        user (User): The owner of the cards.
+        deck (Deck): The deck.
+        limit (int): The maximum number of cards.
+
+    Returns:
+        list: (card, similarity) tuples, most similar first, empty while
+            the user has no saved index.
+    """
+    index = get_index(user.pk)
+    if index is None:
+        return []
+    with index.lock:
+        index.sync()
+        scored = index.related_to_deck(deck.pk, limit)
+    return load_cards(index, scored)
@@ -0,0 +1,40 @@
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def card_image(card, side, sizes, alt=''):
+    """
+    Renders the image of one side of a card with a srcset of its variants.
+
+    The smallest variant is used as the fallback src, so browsers without
+    srcset support still download the lightest file.
+
+    Arguments:
+        card (Card): The card to render the image of.
+        side (str): "question" or "answer".
+        sizes (str): The sizes attribute of the image.
+        alt (str): The alternative text of the image.
+
+    Returns:
+        str: The img element, or an empty string if there is no image.
+    """
+    field_name = f'{side}_image'
+    image_field = getattr(card, field_name)
+    if not image_field:
+        return ''
+    if card.has_variants(field_name):
+        smallest = getattr(card, field_name + '_variants')[0]
+        src = image_field.storage.url(smallest['name'])
+    else:
+        src = image_field.url
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" class="img-thumbnail rounded" '
+        'alt="{}" loading="lazy">',
+        src,
+        card.srcset(field_name),
+        sizes,
+        alt
+    )
@@ -1,14 +1,56 @@
+import csv
+import gzip
+import json
 import os
-from django.test import TestCase
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
-from django.urls import reverse
+from django.urls import resolve, reverse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import ConnectionHandler, connections
+from django.test import override_settings
 from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+from django.utils import timezone
+from datetime import timedelta
 from PIL import Image
-from .models import Subject, Deck, Card
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from flashcards.benchmark import (
+    capture_queries, count_storage_calls, named_patterns
+)
+from flashcards.db.pool import ConnectionPool, PoolTimeout, close_pools
+from flashcards import metrics
+from flashcards.metrics import TimedStorageMixin
+from flashcards.middleware import MetricsMiddleware, WhiteNoiseMiddleware
+from flashcards.query_plans import (
+    Finding, plan_findings, postgresql_findings, sqlite_findings,
+    suggest_index
+)
+from .models import (
+    Subject, Deck, Card, CardImage, CardSchedule, SavedSimilarityIndex,
+    CARD_PREVIEW_LENGTH
+)
+from . import async_views
 from .forms import SubjectForm, DeckForm, CardForm
+from .search import filter_cards, search_cards
+from .similarity import (
+    SimilarityIndex, clear_indexes, get_index, related_cards, similar_cards
+)
+from .views import due_cards
+from .management.commands.bench_images import (
+    IMAGE_CLASSES, generate_image, measure, regressions
+)
 
 
 class ModelsTest(TestCase):
@@ -61,7 +103,7 @@ class ModelsTest(TestCase):
         """
         Tests the creation of a Deck.
         """
-        deck = Deck.objects.get(id=1)
+        deck = Deck.objects.get(id=self.deck.id)
         self.assertEqual(deck.name, "Cartoons")
         self.assertEqual(deck.subject.name, "Nostalgia")
 
@@ -75,7 +117,7 @@ class ModelsTest(TestCase):
         """
         Tests the creation of a Card with text as question and answer.
         """
-        deck = Deck.objects.get(id=1)
+        deck = Deck.objects.get(id=self.deck.id)
         card = Card(
             question="Who lives in a pineapple under the sea?",
             answer="Spongebob squarepants!",
@@ -140,6 +182,38 @@ class ModelsTest(TestCase):
                 "Small image was resized incorrectly."
             )
 
+    def test_card_image_variants(self):
+        """
+        Tests that every variant of the images is stored and recorded,
+        smallest first, and that the srcset lists all of them.
+        """
+        with open(self.large_image_path, 'rb') as large_img:
+            large_image = SimpleUploadedFile(
+                name='sample-large.jpg',
+                content=large_img.read(),
+                content_type='image/jpeg'
+            )
+        card = Card.objects.create(
+            deck=self.deck,
+            question_image=large_image,
+            answer="Test Answer"
+        )
+        variants = card.question_image_variants
+        self.assertEqual(
+            [variant['width'] for variant in variants],
+            [160, 400, 800]
+        )
+        self.assertEqual(variants[-1]['name'], card.question_image.name)
+        for variant in variants:
+            with card.question_image.storage.open(variant['name']) as file:
+                with Image.open(file) as img:
+                    self.assertEqual(img.format, 'WEBP')
+                    self.assertEqual(img.width, variant['width'])
+        srcset = card.srcset('question_image')
+        self.assertIn(' 160w', srcset)
+        self.assertIn(' 800w', srcset)
+        self.assertEqual(card.srcset('answer_image'), '')
+
     def test_card_clean_without_question(self):
         """
         Test that a ValidationError is raised if a card is created without
@@ -671,3 +745,2510 @@ class QuizViewTest(TestCase):
         self.assertIn('cards', response.context)
         self.assertEqual(len(response.context['cards']), 2)
         self.assertEqual(response.context['deck'], self.deck)
+        self.assertIsNone(response.context['next_page'])
+
+    def test_quiz_cards_pages(self):
+        """
+        Tests that the card stream returns every card exactly once,
+        following the next page links.
+        """
+        for i in range(3, 6):
+            Card.objects.create(
+                question=f"Test Question {i}",
+                answer=f"Test Answer {i}",
+                deck=self.deck
+            )
+        url = reverse('quiz_cards', args=[self.deck.id]) + '?limit=2'
+        questions = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['cards']), 2)
+            questions.extend(card['question'] for card in page['cards'])
+            url = page['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(
+            sorted(questions),
+            [f"Test Question {i}" for i in range(1, 6)]
+        )
+
+    def test_quiz_cards_other_user(self):
+        """
+        Tests that the card stream of another user's deck is not found.
+        """
+        User.objects.create_user(
+            username='other@example.com',
+            password='12345'
+        )
+        self.client.login(username='other@example.com', password='12345')
+        response = self.client.get(reverse('quiz_cards', args=[self.deck.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+})
+class QuizCacheTest(TestCase):
+    """
+    Tests for the cached quiz payload.
+    """
+    def setUp(self):
+        """
+        Set up a user with a deck of cards.
+        """
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Test Deck", subject=self.subject)
+        self.card = Card.objects.create(
+            question="Test Question 1",
+            answer="Test Answer " * 20,
+            deck=self.deck
+        )
+        Card.objects.create(
+            question="Test Question 2",
+            answer="Test Answer " * 20,
+            deck=self.deck
+        )
+        self.client.login(username='testuser@example.com', password='12345')
+
+    def test_repeat_session_uses_cache(self):
+        """
+        Tests that an unchanged deck's quiz is served without reading its
+        cards.
+        """
+        url = reverse('quiz_view', args=[self.deck.id])
+        self.client.get(url)
+        # The session, the user, the deck's modification time, the deck
+        # and the navbar profile
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['cards']), 2)
+
+    def test_card_changes_bump_revision(self):
+        """
+        Tests that adding, editing and deleting cards serve a new payload.
+        """
+        url = reverse('quiz_cards', args=[self.deck.id])
+        self.client.get(url)
+
+        self.card.question = "Edited Question"
+        self.card.save()
+        page = self.client.get(url).json()
+        questions = [card['question'] for card in page['cards']]
+        self.assertIn("Edited Question", questions)
+
+        Card.objects.create(question="Q3", answer="A3", deck=self.deck)
+        self.assertEqual(len(self.client.get(url).json()['cards']), 3)
+
+        self.card.delete()
+        self.assertEqual(len(self.client.get(url).json()['cards']), 2)
+
+    def test_text_unchanged_keeps_revision(self):
+        """
+        Tests that saving a card without changes keeps the deck revision.
+        """
+        revision = Deck.objects.get(pk=self.deck.pk).revision
+        card = Card.objects.get(pk=self.card.pk)
+        card.save()
+        self.assertEqual(Deck.objects.get(pk=self.deck.pk).revision, revision)
+
+    def test_gzip_payload(self):
+        """
+        Tests that clients accepting gzip get the compressed copy.
+        """
+        url = reverse('quiz_cards', args=[self.deck.id])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        page = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(page['cards']), 2)
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.json(), page)
+
+
+class ConditionalGetTest(TestCase):
+    """
+    Tests for the ETag and Last-Modified handling of the subject, deck and
+    quiz pages.
+    """
+    def setUp(self):
+        """
+        Set up a user with a deck of cards.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Test Deck", subject=self.subject)
+        self.card = Card.objects.create(
+            question="Test Question",
+            answer="Test Answer",
+            deck=self.deck
+        )
+        self.client.login(username='testuser@example.com', password='12345')
+        # The CSRF cookie is part of the validators, get it set up front
+        self.client.get(reverse('quiz_view', args=[self.deck.id]))
+        self.urls = [
+            reverse('subject_detail', args=[self.subject.id]),
+            reverse('deck_detail', args=[self.deck.id]),
+            reverse('quiz_view', args=[self.deck.id]),
+        ]
+
+    def revisit(self, url):
+        """
+        Requests a page again with the validators of a first response.
+        """
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_not_modified(self):
+        """
+        Tests that revisiting unchanged pages returns 304 without rendering
+        them.
+        """
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.revisit(url)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.templates)
+
+    def test_card_change_propagates(self):
+        """
+        Tests that changing a card updates the deck and its subject, so
+        every page is served again.
+        """
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        self.card.question = "Edited Question"
+        self.card.save()
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_other_user_not_modified(self):
+        """
+        Tests that another user never gets a 304 for the pages.
+        """
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        User.objects.create_user(
+            username='other@example.com',
+            password='12345'
+        )
+        self.client.login(username='other@example.com', password='12345')
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 404)
+
+    def test_due_mode_not_conditional(self):
+        """
+        Tests that the due cards session, which depends on the schedules,
+        has no validators.
+        """
+        url = reverse('quiz_view', args=[self.deck.id]) + '?mode=due'
+        self.assertFalse(self.client.get(url).has_header('ETag'))
+
+
+class SpacedRepetitionTest(TestCase):
+    """
+    Tests for the spaced-repetition scheduling.
+    This class tests the SM-2 schedule updates and the due mode of the quiz.
+    """
+    def setUp(self):
+        """
+        Set up a user and creates a subject, deck and five cards
+        associated with that user.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(
+            name="Test Deck",
+            subject=self.subject
+        )
+        self.cards = [
+            Card.objects.create(
+                question=f"Question {i}",
+                answer=f"Answer {i}",
+                deck=self.deck
+            )
+            for i in range(5)
+        ]
+        self.client.login(
+            username='testuser@example.com',
+            password='12345'
+        )
+
+    def test_review_schedule(self):
+        """
+        Tests that successful reviews grow the interval and a failed
+        review resets it.
+        """
+        schedule = CardSchedule(user=self.user, card=self.cards[0])
+        schedule.review(4)
+        self.assertEqual(schedule.interval, 1)
+        schedule.review(4)
+        self.assertEqual(schedule.interval, 6)
+        schedule.review(5)
+        self.assertEqual(schedule.interval, 15)
+        schedule.review(1)
+        self.assertEqual(schedule.interval, 1)
+        self.assertEqual(schedule.repetitions, 0)
+        self.assertGreaterEqual(schedule.ease, CardSchedule.MIN_EASE)
+
+    def test_due_mode_limits_cards(self):
+        """
+        Tests that due mode serves overdue cards first, skips cards that
+        are not due and never serves more than the limit.
+        """
+        now = timezone.now()
+        CardSchedule.objects.create(
+            user=self.user,
+            card=self.cards[3],
+            due_at=now - timedelta(days=1)
+        )
+        CardSchedule.objects.create(
+            user=self.user,
+            card=self.cards[4],
+            due_at=now + timedelta(days=1)
+        )
+        cards = due_cards(self.user, self.deck, limit=3)
+        self.assertEqual(
+            [card.id for card in cards],
+            [self.cards[3].id, self.cards[0].id, self.cards[1].id]
+        )
+
+    def test_due_queue_reads_index_ranges(self):
+        """
+        Tests that the due and new cards are each read from one range of
+        an index, without scans or sorts, so the queue stops after `limit`
+        rows whatever the size of the deck and the user's history.
+        """
+        CardSchedule.objects.create(
+            user=self.user,
+            card=self.cards[0],
+            due_at=timezone.now() - timedelta(days=1)
+        )
+        with capture_queries() as queries:
+            due_cards(self.user, self.deck, limit=3)
+        self.assertEqual(len(queries), 2)
+        vendor = connections['default'].vendor
+        for query, index in zip(
+            queries, ('schedule_user_deck_due_idx', 'card_deck_new_idx')
+        ):
+            self.assertEqual(
+                plan_findings(query['sql'], query['params']), []
+            )
+            if vendor not in ('sqlite', 'postgresql'):
+                continue
+            with connections['default'].cursor() as cursor:
+                if vendor == 'sqlite':
+                    cursor.execute(
+                        'EXPLAIN QUERY PLAN ' + query['sql'], query['params']
+                    )
+                    plan = ' '.join(row[-1] for row in cursor.fetchall())
+                else:
+                    # As in plan_findings, small tables are not scanned
+                    # merely because they are small
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                    cursor.execute('EXPLAIN ' + query['sql'], query['params'])
+                    plan = ' '.join(row[0] for row in cursor.fetchall())
+                    cursor.execute('SET LOCAL enable_seqscan = on')
+            self.assertIn(index, plan)
+
+    def test_schedule_follows_card(self):
+        """
+        Tests that a schedule copies the deck of its card and follows the
+        card to another deck, and that scheduled cards are no longer new.
+        """
+        other_deck = Deck.objects.create(name="Other", subject=self.subject)
+        schedule = CardSchedule.objects.create(
+            user=self.user,
+            card=self.cards[0]
+        )
+        self.assertEqual(schedule.deck, self.deck)
+        card = Card.objects.get(pk=self.cards[0].pk)
+        self.assertTrue(card.scheduled)
+        card.deck = other_deck
+        card.save()
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.deck, other_deck)
+        self.assertEqual(
+            [card.id for card in due_cards(self.user, other_deck)],
+            [card.id]
+        )
+
+    def test_due_mode_view(self):
+        """
+        Tests that the quiz in due mode includes review URLs and that
+        reviewing a card reschedules it.
+        """
+        response = self.client.get(
+            reverse('quiz_view', args=[self.deck.id]) + '?mode=due'
+        )
+        self.assertTrue(response.context['due_mode'])
+        self.assertEqual(len(response.context['cards']), 5)
+        review_url = response.context['cards'][0]['review_url']
+        response = self.client.post(review_url, {'quality': 5})
+        self.assertEqual(response.status_code, 200)
+        schedule = CardSchedule.objects.get(user=self.user)
+        self.assertGreater(schedule.due_at, timezone.now())
+
+        response = self.client.get(
+            reverse('quiz_view', args=[self.deck.id]) + '?mode=due'
+        )
+        self.assertEqual(len(response.context['cards']), 4)
+
+    def test_review_invalid_quality(self):
+        """
+        Tests that an invalid quality is rejected.
+        """
+        response = self.client.post(
+            reverse('review_card', args=[self.cards[0].id]),
+            {'quality': 9}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CARD_IMAGE_PROCESSING='deferred')
+class DeferredImageTest(TestCase):
+    """
+    Tests for the deferred image processing.
+    This class tests that uploads are stored as they are and converted by
+    the process_card_images command.
+    """
+    def setUp(self):
+        """
+        Set up a user, subject and deck and reads a large image.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(
+            name="Test Deck",
+            subject=self.subject
+        )
+        large_image_path = os.path.join(
+            settings.BASE_DIR,
+            'cards/tests/test_images/sample-large.jpg'
+        )
+        with open(large_image_path, 'rb') as large_img:
+            self.large_image = SimpleUploadedFile(
+                name='sample-large.jpg',
+                content=large_img.read(),
+                content_type='image/jpeg'
+            )
+
+    def test_upload_is_deferred(self):
+        """
+        Tests that the upload is stored unconverted and the card is marked
+        as processing.
+        """
+        card = Card.objects.create(
+            deck=self.deck,
+            question_image=self.large_image,
+            answer="Test Answer"
+        )
+        self.assertEqual(card.image_status, Card.PROCESSING)
+        with Image.open(card.question_image) as question_img:
+            self.assertEqual(question_img.format, 'JPEG')
+
+    def test_text_card_is_ready(self):
+        """
+        Tests that a card without images is ready straight away.
+        """
+        card = Card.objects.create(
+            deck=self.deck,
+            question="Test Question",
+            answer="Test Answer"
+        )
+        self.assertEqual(card.image_status, Card.READY)
+
+    def test_process_card_images(self):
+        """
+        Tests that the command converts the image and marks the card as
+        ready.
+        """
+        card = Card.objects.create(
+            deck=self.deck,
+            question_image=self.large_image,
+            answer="Test Answer"
+        )
+        original_name = card.question_image.name
+        call_command('process_card_images', workers=1, stdout=StringIO())
+        card.refresh_from_db()
+        self.assertEqual(card.image_status, Card.READY)
+        self.assertTrue(card.question_image.name.endswith('.webp'))
+        self.assertFalse(card.question_image.storage.exists(original_name))
+        with Image.open(card.question_image) as question_img:
+            self.assertEqual(question_img.format, 'WEBP')
+            self.assertLessEqual(question_img.width, 800)
+        self.assertTrue(card.has_variants('question_image'))
+
+    def test_missing_original(self):
+        """
+        Tests that a card whose original is gone is reported and leaves the
+        queue without stopping the worker.
+        """
+        card = Card.objects.create(
+            deck=self.deck,
+            question_image=self.large_image,
+            answer="Test Answer"
+        )
+        card.question_image.storage.delete(card.question_image.name)
+        stderr = StringIO()
+        call_command(
+            'process_card_images',
+            workers=1,
+            stdout=StringIO(),
+            stderr=stderr
+        )
+        self.assertIn(
+            f'Could not read {card.question_image.name}',
+            stderr.getvalue()
+        )
+        card.refresh_from_db()
+        self.assertEqual(card.image_status, Card.READY)
+        self.assertFalse(card.has_variants('question_image'))
+
+
+class ImageDeduplicationTest(TestCase):
+    """
+    Tests for the content-addressed storage of card images.
+    This class tests that identical uploads are stored once and that the
+    stored images are released when no card refers to them.
+    """
+    def setUp(self):
+        """
+        Set up a user, subject and deck and reads the sample images.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(
+            name="Test Deck",
+            subject=self.subject
+        )
+        with open(os.path.join(
+            settings.BASE_DIR,
+            'cards/tests/test_images/sample-large.jpg'
+        ), 'rb') as large_img:
+            self.large_data = large_img.read()
+        with open(os.path.join(
+            settings.BASE_DIR,
+            'cards/tests/test_images/sample-small.jpg'
+        ), 'rb') as small_img:
+            self.small_data = small_img.read()
+
+    def create_card(self, data, name='sample.jpg'):
+        """
+        Creates a card with an uploaded question image.
+        """
+        return Card.objects.create(
+            deck=self.deck,
+            question_image=SimpleUploadedFile(name, data),
+            answer="Test Answer"
+        )
+
+    def test_identical_upload_is_reused(self):
+        """
+        Tests that a second identical upload points to the stored image
+        without converting it again.
+        """
+        first = self.create_card(self.large_data)
+        with mock.patch('cards.models.render_variants') as render:
+            second = self.create_card(self.large_data, name='copy.jpg')
+        render.assert_not_called()
+        self.assertEqual(first.question_image.name, second.question_image.name)
+        self.assertEqual(CardImage.objects.count(), 1)
+        self.assertEqual(CardImage.objects.get().ref_count, 2)
+
+    def test_release_on_delete(self):
+        """
+        Tests that the stored image is deleted with its last card.
+        """
+        first = self.create_card(self.large_data)
+        second = self.create_card(self.large_data)
+        storage = first.question_image.storage
+        name = first.question_image.name
+        first.delete()
+        self.assertEqual(CardImage.objects.get().ref_count, 1)
+        self.assertTrue(storage.exists(name))
+        second.delete()
+        self.assertEqual(CardImage.objects.count(), 0)
+        self.assertFalse(storage.exists(name))
+
+    def test_release_on_replace(self):
+        """
+        Tests that replacing or clearing an image releases the old one.
+        """
+        card = self.create_card(self.large_data)
+        card.question_image = SimpleUploadedFile('small.jpg', self.small_data)
+        card.save()
+        self.assertEqual(CardImage.objects.count(), 1)
+        self.assertEqual(
+            CardImage.objects.get().name,
+            card.question_image.name
+        )
+        card.question = "Test Question"
+        card.question_image = None
+        card.save()
+        self.assertEqual(CardImage.objects.count(), 0)
+        self.assertEqual(card.question_image_variants, [])
+
+    def test_release_on_deck_delete(self):
+        """
+        Tests that deleting a deck releases the images of its cards.
+        """
+        self.create_card(self.large_data)
+        self.create_card(self.large_data)
+        Deck.objects.get(pk=self.deck.pk).delete()
+        self.assertEqual(CardImage.objects.count(), 0)
+
+    @override_settings(CARD_IMAGE_PROCESSING='deferred')
+    def test_deferred_upload_is_reused(self):
+        """
+        Tests that a deferred upload of an already stored image is ready
+        straight away.
+        """
+        with override_settings(CARD_IMAGE_PROCESSING='sync'):
+            first = self.create_card(self.large_data)
+        second = self.create_card(self.large_data)
+        self.assertEqual(second.image_status, Card.READY)
+        self.assertEqual(first.question_image.name, second.question_image.name)
+
+
+class FieldTrackingTest(TestCase):
+    """
+    Tests for the change tracking of cards.
+    This class tests that only changed fields are reported and that
+    text-only edits do no image work.
+    """
+    def setUp(self):
+        """
+        Set up a user, subject and deck and a card with an image.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(
+            name="Test Deck",
+            subject=self.subject
+        )
+        with open(os.path.join(
+            settings.BASE_DIR,
+            'cards/tests/test_images/sample-small.jpg'
+        ), 'rb') as small_img:
+            small_image = SimpleUploadedFile(
+                name='sample-small.jpg',
+                content=small_img.read(),
+                content_type='image/jpeg'
+            )
+        self.card = Card.objects.create(
+            deck=self.deck,
+            question="Test Question",
+            question_image=small_image,
+            answer="Test Answer"
+        )
+
+    def test_changed_fields(self):
+        """
+        Tests that only the edited fields are reported as changed.
+        """
+        card = Card.objects.get(pk=self.card.pk)
+        self.assertEqual(card.changed_fields, [])
+        card.question = "Updated Question"
+        self.assertEqual(card.changed_fields, ['question'])
+        card.save()
+        self.assertEqual(card.changed_fields, [])
+        card.question_image = None
+        self.assertEqual(card.changed_fields, ['question_image'])
+
+    def test_text_edit_skips_images(self):
+        """
+        Tests that saving a text edit does not touch the images.
+        """
+        card = Card.objects.get(pk=self.card.pk)
+        card.answer = "Updated Answer"
+        with mock.patch('cards.models.render_variants') as render, \
+                count_storage_calls() as calls:
+            card.save()
+        render.assert_not_called()
+        self.assertEqual(calls, {'open': 0, 'save': 0})
+        self.assertEqual(card.question_image_ref.ref_count, 1)
+
+
+class CounterTest(TestCase):
+    """
+    Tests for the denormalized card and deck counts.
+    This class tests that the counts follow creations, moves and
+    deletions, and that the recount command repairs them.
+    """
+    def setUp(self):
+        """
+        Set up a user, a subject with two decks and three cards.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Deck 1", subject=self.subject)
+        self.other_deck = Deck.objects.create(
+            name="Deck 2",
+            subject=self.subject
+        )
+        self.cards = [
+            Card.objects.create(
+                question=f"Question {i}",
+                answer=f"Answer {i}",
+                deck=self.deck
+            )
+            for i in range(3)
+        ]
+
+    def assertCounts(self, deck_cards, other_deck_cards, decks):
+        """
+        Asserts the counts stored in the database.
+        """
+        self.deck.refresh_from_db()
+        self.other_deck.refresh_from_db()
+        self.subject.refresh_from_db()
+        self.assertEqual(self.deck.card_count, deck_cards)
+        self.assertEqual(self.other_deck.card_count, other_deck_cards)
+        self.assertEqual(self.subject.deck_count, decks)
+        self.assertEqual(
+            self.subject.card_count,
+            deck_cards + other_deck_cards
+        )
+
+    def test_counts_on_create(self):
+        """
+        Tests the counts after creating decks and cards.
+        """
+        self.assertCounts(3, 0, 2)
+
+    def test_counts_on_move_and_delete(self):
+        """
+        Tests the counts after moving and deleting cards.
+        """
+        card = Card.objects.get(pk=self.cards[0].pk)
+        card.deck = self.other_deck
+        card.save()
+        self.assertCounts(2, 1, 2)
+        card.delete()
+        self.assertCounts(2, 0, 2)
+
+    def test_counts_on_deck_delete(self):
+        """
+        Tests the subject counts after deleting a deck with cards.
+        """
+        Deck.objects.get(pk=self.deck.pk).delete()
+        self.subject.refresh_from_db()
+        self.assertEqual(self.subject.deck_count, 1)
+        self.assertEqual(self.subject.card_count, 0)
+
+    def test_recount_cards(self):
+        """
+        Tests that the recount command repairs counts broken by a bulk
+        delete that bypasses the models.
+        """
+        Card.objects.filter(pk=self.cards[0].pk).delete()
+        Deck.objects.filter(pk=self.deck.pk).update(card_count=10)
+        call_command('recount_cards', stdout=StringIO())
+        self.assertCounts(2, 0, 2)
+
+    def test_counts_in_listings(self):
+        """
+        Tests that the home and subject pages show the counts.
+        """
+        self.client.login(username='testuser@example.com', password='12345')
+        response = self.client.get(reverse('cards-home'))
+        self.assertContains(response, '2 decks, 3 cards')
+        response = self.client.get(
+            reverse('subject_detail', args=[self.subject.id])
+        )
+        self.assertContains(response, '3 cards')
+
+
+class ListingQuerySetTest(TestCase):
+    """
+    Tests for the querysets used by the list pages.
+    """
+    def setUp(self):
+        """
+        Set up data for the test case.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Nostalgia",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Cartoons", subject=self.subject)
+
+    def test_card_listing_previews(self):
+        """
+        Tests that card listings load a preview of the text instead of the
+        full text.
+        """
+        Card.objects.create(
+            deck=self.deck,
+            question='Q' * (CARD_PREVIEW_LENGTH * 2),
+            answer='A'
+        )
+        card = Card.objects.for_listing().get()
+        self.assertTrue(
+            {'question', 'answer'} <= card.get_deferred_fields()
+        )
+        self.assertEqual(len(card.question_preview), CARD_PREVIEW_LENGTH + 1)
+        self.assertEqual(card.answer_preview, 'A')
+
+    def test_deck_for_user(self):
+        """
+        Tests that decks are limited to the user's subjects and come with
+        their subject.
+        """
+        other = User.objects.create_user(username='other', password='12345')
+        self.assertFalse(Deck.objects.for_user(other).exists())
+        with self.assertNumQueries(1):
+            deck = Deck.objects.for_user(self.user).get()
+            self.assertEqual(deck.subject.name, "Nostalgia")
+
+
+class CardImportTest(TestCase):
+    """
+    Tests for importing cards from CSV/TSV files and Anki packages.
+    """
+    def setUp(self):
+        """
+        Set up a user with an empty deck.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Test Deck", subject=self.subject)
+        self.client.login(username='testuser@example.com', password='12345')
+        self.url = reverse('import_cards', args=[self.deck.id])
+        self.image_path = os.path.join(
+            settings.BASE_DIR,
+            'cards/tests/test_images/sample-small.jpg'
+        )
+
+    def upload(self, name, content, **data):
+        """
+        Posts a file to the import view.
+        """
+        return self.client.post(self.url, {
+            'file': SimpleUploadedFile(name, content),
+            **data
+        })
+
+    def make_apkg(self, notes, media=None):
+        """
+        Builds an Anki package holding notes with the given fields and the
+        given media files.
+        """
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        collection = os.path.join(directory, 'collection.anki2')
+        connection = sqlite3.connect(collection)
+        connection.execute('CREATE TABLE notes (id INTEGER, flds TEXT)')
+        connection.executemany(
+            'INSERT INTO notes VALUES (?, ?)',
+            [(i, '\x1f'.join(fields)) for i, fields in enumerate(notes)]
+        )
+        connection.commit()
+        connection.close()
+        media = media or {}
+        package = BytesIO()
+        with zipfile.ZipFile(package, 'w') as archive:
+            archive.write(collection, 'collection.anki2')
+            archive.writestr('media', json.dumps({
+                str(i): name for i, name in enumerate(media)
+            }))
+            for i, data in enumerate(media.values()):
+                archive.writestr(str(i), data)
+        return package.getvalue()
+
+    def test_import_csv_in_batches(self):
+        """
+        Tests that a CSV file is imported in batches and counted.
+        """
+        lines = ['question,answer'] + [
+            f'Question {i},"Answer, {i}"' for i in range(1200)
+        ]
+        with mock.patch.object(
+            Card.objects, 'bulk_create',
+            wraps=Card.objects.bulk_create
+        ) as bulk_create:
+            response = self.upload(
+                'cards.csv',
+                '\n'.join(lines).encode(),
+                has_header='on'
+            )
+        self.assertRedirects(
+            response,
+            reverse('create_card', args=[self.deck.id])
+        )
+        self.assertEqual(bulk_create.call_count, 3)
+        self.assertEqual(self.deck.card_set.count(), 1200)
+        self.assertEqual(Deck.objects.get(pk=self.deck.pk).card_count, 1200)
+        self.assertEqual(
+            Subject.objects.get(pk=self.subject.pk).card_count,
+            1200
+        )
+        self.assertTrue(
+            self.deck.card_set.filter(answer='Answer, 7').exists()
+        )
+
+    def test_import_tsv_skips_incomplete_rows(self):
+        """
+        Tests that rows without a question or answer are skipped.
+        """
+        response = self.upload(
+            'cards.tsv',
+            'Q1\tA1\nQ2\n\n\tA3\n'.encode()
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            list(self.deck.card_set.values_list('question', 'answer')),
+            [('Q1', 'A1')]
+        )
+        messages = [str(m) for m in response.wsgi_request._messages]
+        self.assertIn('skipped 2 row(s)', messages[0])
+
+    def test_import_apkg_with_images(self):
+        """
+        Tests that Anki notes are imported with their text and images, and
+        that an image used twice is stored once.
+        """
+        with open(self.image_path, 'rb') as image:
+            data = image.read()
+        package = self.make_apkg([
+            ['What is <b>this</b>?<br><img src="cat.jpg">', 'A cat'],
+            ['Same &amp; again', '<img src="cat.jpg">[sound:meow.mp3]'],
+        ], {'cat.jpg': data})
+        response = self.upload('deck.apkg', package)
+        self.assertEqual(response.status_code, 302)
+        first, second = self.deck.card_set.order_by('id')
+        self.assertEqual(first.question, 'What is this?')
+        self.assertEqual(second.question, 'Same & again')
+        self.assertEqual(second.answer, '')
+        self.assertTrue(first.has_variants('question_image'))
+        self.assertEqual(first.question_image_ref, second.answer_image_ref)
+        self.assertEqual(CardImage.objects.get().ref_count, 2)
+
+    def test_import_errors_roll_back(self):
+        """
+        Tests that invalid files are reported and import nothing.
+        """
+        response = self.upload('cards.pdf', b'Q,A')
+        self.assertContains(response, 'Upload a .csv')
+        response = self.upload('cards.csv', b'Q1,A1\n\xff\xfe,A2\n')
+        self.assertContains(response, 'UTF-8')
+        response = self.upload('deck.apkg', b'not a zip')
+        self.assertContains(response, 'not an Anki package')
+        response = self.upload('cards.csv', b'Q1,A1\nQ2\x00,A2\n')
+        self.assertContains(response, 'Line 2 contains a NUL byte')
+        # Restores the previous limit, returned when setting a new one
+        self.addCleanup(csv.field_size_limit, csv.field_size_limit(8))
+        response = self.upload('cards.csv', b'Q1,A1\nQ2,' + b'A' * 9)
+        self.assertContains(response, 'Line 2 could not be read')
+        self.assertFalse(self.deck.card_set.exists())
+        self.assertEqual(Deck.objects.get(pk=self.deck.pk).card_count, 0)
+
+    def test_import_other_user_deck(self):
+        """
+        Tests that cards cannot be imported into another user's deck.
+        """
+        User.objects.create_user(username='other', password='12345')
+        self.client.login(username='other', password='12345')
+        response = self.upload('cards.csv', b'Q,A')
+        self.assertEqual(response.status_code, 404)
+
+
+class CardExportTest(TestCase):
+    """
+    Tests for exporting decks and subjects.
+    """
+    def setUp(self):
+        """
+        Set up a user with two decks of cards, two of which share an image.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Test Deck", subject=self.subject)
+        self.other_deck = Deck.objects.create(
+            name="Other Deck",
+            subject=self.subject
+        )
+        image_path = os.path.join(
+            settings.BASE_DIR,
+            'cards/tests/test_images/sample-small.jpg'
+        )
+        with open(image_path, 'rb') as image:
+            self.image_data = image.read()
+        for question in ("Q1", "Q2"):
+            Card.objects.create(
+                deck=self.deck,
+                question=question,
+                answer="A, with a comma",
+                answer_image=SimpleUploadedFile(
+                    'sample.jpg',
+                    self.image_data,
+                    content_type='image/jpeg'
+                )
+            )
+        Card.objects.create(deck=self.other_deck, question="Q3", answer="A3")
+        self.client.login(username='testuser@example.com', password='12345')
+
+    def download(self, url):
+        """
+        Downloads a streamed export.
+        """
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_export_deck_csv(self):
+        """
+        Tests that a deck is exported as CSV with absolute image URLs.
+        """
+        response, content = self.download(
+            reverse('export_deck', args=[self.deck.id]) + '?format=csv'
+        )
+        self.assertIn('test-deck.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(content.decode())))
+        self.assertEqual([row['question'] for row in rows], ["Q1", "Q2"])
+        self.assertEqual(rows[0]['answer'], "A, with a comma")
+        self.assertTrue(rows[0]['answer_image'].startswith('http://'))
+        self.assertEqual(rows[0]['question_image'], '')
+
+    def test_export_subject_jsonl(self):
+        """
+        Tests that a subject is exported as JSON Lines with every deck.
+        """
+        _, content = self.download(
+            reverse('export_subject', args=[self.subject.id])
+            + '?format=jsonl'
+        )
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(
+            sorted((row['deck'], row['question']) for row in rows),
+            [("Other Deck", "Q3"), ("Test Deck", "Q1"), ("Test Deck", "Q2")]
+        )
+
+    def test_export_zip_with_images(self):
+        """
+        Tests that the zip export holds the cards and each image once.
+        """
+        _, content = self.download(
+            reverse('export_subject', args=[self.subject.id]) + '?format=zip'
+        )
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            rows = list(csv.DictReader(StringIO(
+                archive.read('cards.csv').decode()
+            )))
+            images = [
+                name for name in archive.namelist()
+                if name.startswith('images/')
+            ]
+            self.assertEqual(len(images), 1)
+            self.assertEqual(rows[0]['answer_image'], images[0])
+            stored = Card.objects.get(question="Q1").answer_image
+            with stored.open('rb'):
+                self.assertEqual(archive.read(images[0]), stored.read())
+
+    def test_export_errors(self):
+        """
+        Tests that unknown formats and other users' decks are not found.
+        """
+        url = reverse('export_deck', args=[self.deck.id])
+        self.assertEqual(self.client.get(url + '?format=pdf').status_code, 404)
+        User.objects.create_user(username='other', password='12345')
+        self.client.login(username='other', password='12345')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('export_subject', args=[self.subject.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+})
+class FragmentCacheTest(TestCase):
+    """
+    Tests for the cached subject and deck listings.
+    """
+    def setUp(self):
+        """
+        Set up data for the test case.
+        """
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.client.login(username='testuser@example.com', password='12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subject = Subject.objects.create(
+                name="Nostalgia",
+                creator=self.user
+            )
+            self.deck = Deck.objects.create(
+                name="Cartoons",
+                subject=self.subject
+            )
+
+    def test_cached_listings_skip_queries(self):
+        """
+        Tests that unchanged listings are rendered without querying them.
+        """
+        home = reverse('cards-home')
+        detail = reverse('subject_detail', args=[self.subject.id])
+        self.client.get(home)
+        self.client.get(detail)
+        # The session, the user and the navbar profile
+        with self.assertNumQueries(3):
+            response = self.client.get(home)
+        self.assertContains(response, "Nostalgia")
+        # And the subject's modification time and the subject itself
+        with self.assertNumQueries(5):
+            response = self.client.get(detail)
+        self.assertContains(response, "Cartoons")
+
+    def test_changes_expire_listings(self):
+        """
+        Tests that creating, editing and deleting decks and cards refreshes
+        the cached listings.
+        """
+        home = reverse('cards-home')
+        detail = reverse('subject_detail', args=[self.subject.id])
+        self.assertContains(self.client.get(home), "0 cards")
+        self.assertContains(self.client.get(detail), "0 cards")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            card = Card.objects.create(
+                deck=self.deck,
+                question="Q",
+                answer="A"
+            )
+        self.assertContains(self.client.get(home), "1 card")
+        self.assertContains(self.client.get(detail), "1 card")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deck.name = "Comics"
+            self.deck.save()
+        self.assertContains(self.client.get(detail), "Comics")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            card.delete()
+        self.assertContains(self.client.get(home), "0 cards")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deck.delete()
+        self.assertContains(self.client.get(home), "0 decks")
+        self.assertContains(self.client.get(detail), "No decks yet.")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subject.delete()
+        self.assertNotContains(self.client.get(home), "Nostalgia")
+
+
+class BatchCardActionsTest(TestCase):
+    """
+    Tests for the batch actions on the selected cards of a deck.
+    """
+    def setUp(self):
+        """
+        Set up a user with two decks, the first holding five cards of which
+        two share a question image.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Test Subject",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Test Deck", subject=self.subject)
+        self.other_deck = Deck.objects.create(
+            name="Other Deck",
+            subject=self.subject
+        )
+        with open(os.path.join(
+            settings.BASE_DIR,
+            'cards/tests/test_images/sample-small.jpg'
+        ), 'rb') as small_img:
+            data = small_img.read()
+        self.cards = [
+            Card.objects.create(
+                deck=self.deck,
+                question=f"Question {index}",
+                answer=f"Answer {index}"
+            )
+            for index in range(3)
+        ] + [
+            Card.objects.create(
+                deck=self.deck,
+                question=question,
+                question_image=SimpleUploadedFile('sample.jpg', data),
+                answer="Answer"
+            )
+            for question in ("Question", "")
+        ]
+        self.client.login(username='testuser@example.com', password='12345')
+        self.url = reverse('batch_cards', args=[self.deck.id])
+
+    def post(self, action, cards, target=None):
+        """
+        Posts a batch action for the given cards.
+        """
+        data = {'action': action, 'cards': [card.id for card in cards]}
+        if target is not None:
+            data['target'] = target.id
+        return self.client.post(self.url, data)
+
+    def test_delete(self):
+        """
+        Tests that deleting cards runs a fixed number of queries, updates
+        the counters and releases the shared image with its last card.
+        """
+        CardSchedule.objects.create(user=self.user, card=self.cards[0])
+        with self.assertNumQueries(20):
+            response = self.post('delete', self.cards[1:])
+        self.assertRedirects(
+            response,
+            reverse('create_card', args=[self.deck.id])
+        )
+        self.assertEqual(list(self.deck.card_set.all()), self.cards[:1])
+        self.assertEqual(CardSchedule.objects.count(), 1)
+        self.deck.refresh_from_db()
+        self.subject.refresh_from_db()
+        self.assertEqual(self.deck.card_count, 1)
+        self.assertEqual(self.subject.card_count, 1)
+        self.assertEqual(CardImage.objects.count(), 0)
+
+    def test_move(self):
+        """
+        Tests that moved cards keep their schedules and are counted in
+        their new deck.
+        """
+        CardSchedule.objects.create(user=self.user, card=self.cards[0])
+        self.post('move', self.cards[:2], self.other_deck)
+        self.assertEqual(
+            set(self.other_deck.card_set.all()),
+            set(self.cards[:2])
+        )
+        self.assertEqual(CardSchedule.objects.get().card, self.cards[0])
+        self.assertEqual(CardSchedule.objects.get().deck, self.other_deck)
+        self.deck.refresh_from_db()
+        self.other_deck.refresh_from_db()
+        self.subject.refresh_from_db()
+        self.assertEqual(self.deck.card_count, 3)
+        self.assertEqual(self.other_deck.card_count, 2)
+        self.assertEqual(self.subject.card_count, 5)
+
+    def test_move_requires_another_deck(self):
+        """
+        Tests that cards cannot be moved without a target or to their own
+        deck.
+        """
+        self.post('move', self.cards[:1])
+        self.post('move', self.cards[:1], self.deck)
+        self.assertEqual(self.deck.card_set.count(), 5)
+        self.assertEqual(self.other_deck.card_set.count(), 0)
+
+    def test_copy_shares_images(self):
+        """
+        Tests that copies point to the stored images of the originals and
+        keep them alive once the originals are deleted, and that they are
+        new cards.
+        """
+        CardSchedule.objects.create(user=self.user, card=self.cards[2])
+        self.post('copy', self.cards[2:], self.other_deck)
+        copies = self.other_deck.card_set.order_by('id')
+        self.assertFalse(any(card.scheduled for card in copies))
+        self.assertEqual(
+            [card.question for card in copies],
+            [card.question for card in self.cards[2:]]
+        )
+        card_image = CardImage.objects.get()
+        self.assertEqual(card_image.ref_count, 4)
+        self.assertEqual(copies[1].question_image_ref, card_image)
+        self.other_deck.refresh_from_db()
+        self.assertEqual(self.other_deck.card_count, 3)
+        self.post('delete', self.cards)
+        self.assertEqual(CardImage.objects.get().ref_count, 2)
+
+    def test_clear_images(self):
+        """
+        Tests that images are only removed from sides that have text.
+        """
+        response = self.post('clear_images', self.cards[3:])
+        self.assertContains(
+            self.client.get(response.url),
+            "Removed 1 image(s)"
+        )
+        with_text, image_only = Card.objects.filter(
+            pk__in=[card.pk for card in self.cards[3:]]
+        ).order_by('id')
+        self.assertFalse(with_text.question_image)
+        self.assertEqual(with_text.question_image_variants, [])
+        self.assertTrue(image_only.question_image)
+        self.assertEqual(CardImage.objects.get().ref_count, 1)
+
+    def test_processing_cards_cannot_be_copied(self):
+        """
+        Tests that cards with images waiting for conversion are not copied.
+        """
+        Card.objects.filter(pk=self.cards[0].pk).update(
+            image_status=Card.PROCESSING
+        )
+        self.post('copy', self.cards[:2], self.other_deck)
+        self.assertEqual(self.other_deck.card_set.count(), 0)
+
+    def test_cards_of_other_users_are_rejected(self):
+        """
+        Tests that a selection including a card of another deck or user is
+        rejected as a whole.
+        """
+        other_user = User.objects.create_user(
+            username='otheruser@example.com',
+            password='12345'
+        )
+        other_subject = Subject.objects.create(
+            name="Other Subject",
+            creator=other_user
+        )
+        foreign_deck = Deck.objects.create(
+            name="Theirs",
+            subject=other_subject
+        )
+        foreign_card = Card.objects.create(
+            deck=foreign_deck,
+            question="Question",
+            answer="Answer"
+        )
+        self.post('delete', [self.cards[0], foreign_card])
+        self.post('move', self.cards[:1], foreign_deck)
+        self.assertTrue(Card.objects.filter(pk=foreign_card.pk).exists())
+        self.assertEqual(self.deck.card_set.count(), 5)
+        self.assertEqual(foreign_deck.card_set.count(), 1)
+
+    def test_get_not_allowed(self):
+        """
+        Tests that batch actions are only run on POST requests.
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 405)
+
+
+class SearchTest(TestCase):
+    """
+    Tests for the full-text search of a user's cards.
+    """
+    def setUp(self):
+        """
+        Set up a user with a subject, a deck and a few cards, and a second
+        user with a matching card.
+        """
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Biology",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(
+            name="Cytology",
+            description="Organelles and membranes",
+            subject=self.subject
+        )
+        self.mitochondria = Card.objects.create(
+            deck=self.deck,
+            question="What does the mitochondria produce?",
+            answer="Energy for the cell"
+        )
+        self.ribosome = Card.objects.create(
+            deck=self.deck,
+            question="What do ribosomes make?",
+            answer="Proteins, using energy from the mitochondria"
+        )
+        other_user = User.objects.create_user(
+            username='otheruser@example.com',
+            password='12345'
+        )
+        other_subject = Subject.objects.create(
+            name="Biology",
+            creator=other_user
+        )
+        Card.objects.create(
+            deck=Deck.objects.create(name="Cells", subject=other_subject),
+            question="Mitochondria",
+            answer="Powerhouse"
+        )
+        self.client.login(username='testuser@example.com', password='12345')
+
+    def search(self, query, **kwargs):
+        """
+        Returns the cards of the user matching a query.
+        """
+        return search_cards(self.user, query, **kwargs).cards
+
+    def test_ranked_by_field(self):
+        """
+        Tests that matches in the question rank above matches in the
+        answer, and that the cards of other users are left out.
+        """
+        self.assertEqual(
+            self.search("mitochondria"),
+            [self.mitochondria, self.ribosome]
+        )
+
+    def test_every_term_and_prefix(self):
+        """
+        Tests that results contain every word, the words matching as
+        prefixes, and that punctuation is ignored.
+        """
+        self.assertEqual(self.search('ribo* "prot'), [self.ribosome])
+        self.assertEqual(self.search("mitochondria proteins"), [self.ribosome])
+        self.assertEqual(self.search("?!"), [])
+
+    def test_deck_and_subject_names(self):
+        """
+        Tests that cards are found by the name and description of their
+        deck and the name of their subject, and that renames reach the
+        index.
+        """
+        self.assertEqual(len(self.search("cytology")), 2)
+        self.assertEqual(len(self.search("membranes")), 2)
+        self.assertEqual(len(self.search("biology")), 2)
+        self.deck.name = "Organisms"
+        self.deck.save()
+        self.subject.name = "Life Sciences"
+        self.subject.save()
+        self.assertEqual(self.search("cytology"), [])
+        self.assertEqual(len(self.search("organisms")), 2)
+        self.assertEqual(len(self.search("life sciences")), 2)
+
+    def test_index_follows_cards(self):
+        """
+        Tests that edits, bulk inserts, set-based updates and deletions
+        reach the index.
+        """
+        self.mitochondria.question = "What is the powerhouse of the cell?"
+        self.mitochondria.save()
+        self.assertEqual(self.search("powerhouse"), [self.mitochondria])
+        Card.objects.bulk_create([
+            Card(deck=self.deck, question="Chloroplast", answer="Plants")
+        ])
+        self.assertEqual(len(self.search("chloroplast")), 1)
+        Card.objects.filter(pk=self.ribosome.pk).update(question="Lysosome")
+        self.assertEqual(self.search("lysosome"), [self.ribosome])
+        self.ribosome.delete()
+        self.assertEqual(self.search("lysosome"), [])
+
+    def test_bigint_ids(self):
+        """
+        Tests that cards with ids beyond the integer range are indexed and
+        follow their deck, card ids being bigint.
+        """
+        card = Card.objects.create(
+            id=2 ** 31 + 7,
+            deck=self.deck,
+            question="Golgi apparatus",
+            answer="Packaging"
+        )
+        self.assertEqual(self.search("golgi"), [card])
+        other_deck = Deck.objects.create(
+            name="Histology",
+            subject=self.subject
+        )
+        Card.objects.filter(pk=card.pk).update(deck=other_deck)
+        self.assertEqual(self.search("golgi histology"), [card])
+
+    def test_update_trigger_columns(self):
+        """
+        Tests that only updates of the indexed columns of a card reach the
+        index, not those of its counters or image status.
+        """
+        vendor = connections['default'].vendor
+        queries = {
+            'sqlite': 'SELECT sql FROM sqlite_master WHERE name = %s',
+            'postgresql': (
+                'SELECT pg_get_triggerdef(oid) FROM pg_trigger '
+                'WHERE tgname = %s'
+            ),
+        }
+        if vendor not in queries:
+            self.skipTest(f'No search index on {vendor}.')
+        with connections['default'].cursor() as cursor:
+            cursor.execute(queries[vendor], ['cards_card_search_update'])
+            definition = ' '.join(cursor.fetchone()[0].split())
+        self.assertIn('UPDATE OF question, answer, deck_id', definition)
+
+    def test_indexed_by_creator(self):
+        """
+        Tests that the index is scoped by creator, that the words of a
+        query do not match the creator, and that a subject changing hands
+        moves its cards to the results of the new creator.
+        """
+        vendor = connections['default'].vendor
+        queries = {
+            'sqlite': (
+                "SELECT sql FROM sqlite_master WHERE name = %s",
+                'cards_card_search',
+                'creator_id, tokenize'
+            ),
+            'postgresql': (
+                'SELECT indexdef FROM pg_indexes WHERE indexname = %s',
+                'cards_card_search_creator_document_idx',
+                'gin (creator_id, document)'
+            ),
+        }
+        if vendor not in queries:
+            self.skipTest(f'No search index on {vendor}.')
+        query, name, expected = queries[vendor]
+        with connections['default'].cursor() as cursor:
+            cursor.execute(query, [name])
+            definition = ' '.join(cursor.fetchone()[0].split())
+        self.assertIn(expected, definition)
+        self.assertEqual(self.search(str(self.user.pk)), [])
+        self.assertFalse(
+            filter_cards(Card.objects.all(), str(self.user.pk)).exists()
+        )
+        self.assertEqual(self.search("powerhouse"), [])
+        Subject.objects.exclude(creator=self.user).update(creator=self.user)
+        self.assertEqual(len(self.search("powerhouse")), 1)
+
+    def test_pagination(self):
+        """
+        Tests that pages hold at most a page of results and tell whether
+        another page follows.
+        """
+        first = search_cards(self.user, "energy", per_page=1)
+        self.assertTrue(first.has_next)
+        second = search_cards(self.user, "energy", page=2, per_page=1)
+        self.assertFalse(second.has_next)
+        self.assertEqual(
+            set(first.cards + second.cards),
+            {self.mitochondria, self.ribosome}
+        )
+
+    def test_view(self):
+        """
+        Tests that the search page shows the matching cards with their
+        deck.
+        """
+        response = self.client.get(reverse('search'), {'q': 'ribosomes'})
+        self.assertContains(response, "What do ribosomes make?")
+        self.assertContains(
+            response,
+            reverse('deck_detail', args=[self.deck.id])
+        )
+        self.assertNotContains(response, "mitochondria produce")
+
+    def test_admin_filter(self):
+        """
+        Tests that the admin search goes through the index across users.
+        """
+        self.assertEqual(
+            filter_cards(Card.objects.all(), "mitochondria").count(),
+            3
+        )
+
+
+class SimilarityTest(TestCase):
+    """
+    Tests for the TF-IDF similarity of a user's cards.
+    """
+    def setUp(self):
+        """
+        Set up a user with two decks of cards and a saved index.
+        """
+        clear_indexes()
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Chemistry",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Elements", subject=self.subject)
+        self.other_deck = Deck.objects.create(
+            name="Metals",
+            subject=self.subject
+        )
+        self.sodium = Card.objects.create(
+            deck=self.deck,
+            question="What is the chemical symbol of sodium?",
+            answer="Na"
+        )
+        self.iron = Card.objects.create(
+            deck=self.other_deck,
+            question="What is the chemical symbol of iron?",
+            answer="Fe"
+        )
+        self.rust = Card.objects.create(
+            deck=self.other_deck,
+            question="What forms when iron oxidizes?",
+            answer="Rust"
+        )
+        call_command('build_similarity_indexes', stdout=StringIO())
+        self.client.login(username='testuser@example.com', password='12345')
+
+    def test_similar_cards(self):
+        """
+        Tests that a near duplicate is found, most similar first, without
+        the card itself.
+        """
+        duplicate = Card.objects.create(
+            deck=self.other_deck,
+            question="What's the chemical symbol of sodium?",
+            answer="Na"
+        )
+        found = similar_cards(self.user, duplicate, threshold=0.1)
+        self.assertEqual(found[0][0], self.sodium)
+        self.assertNotIn(duplicate, [card for card, _ in found])
+        self.assertGreater(found[0][1], 0.6)
+
+    def test_unrelated_card_has_no_match(self):
+        """
+        Tests that a card sharing no words with the others has no match.
+        """
+        card = Card.objects.create(
+            deck=self.deck,
+            question="Avogadro constant?",
+            answer="6.022e23"
+        )
+        self.assertEqual(similar_cards(self.user, card), [])
+
+    def test_index_follows_changes(self):
+        """
+        Tests that edits and deletions reach an index that was already
+        built.
+        """
+        index = get_index(self.user.pk)
+        with index.lock:
+            index.sync()
+        self.assertEqual(len(index), 3)
+        self.rust.question = "What is the chemical symbol of sodium?"
+        self.rust.answer = "Na"
+        self.rust.save()
+        self.assertEqual(
+            similar_cards(self.user, self.sodium)[0][0],
+            self.rust
+        )
+        self.rust.delete()
+        found = similar_cards(self.user, self.sodium, threshold=0)
+        self.assertNotIn(self.rust.pk, [card.pk for card, _ in found])
+        self.assertEqual(len(index), 2)
+
+    def test_saved_index(self):
+        """
+        Tests that a process loads the saved index, and loads it again once
+        another process saved a newer one.
+        """
+        clear_indexes()
+        index = get_index(self.user.pk)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.synced_at, self.rust.updated_at)
+        with index.lock:
+            # The cards read again within the sync margin are unchanged
+            self.assertEqual(index.sync(), 0)
+        duplicate = Card.objects.create(
+            deck=self.deck,
+            question="What forms when iron oxidizes?",
+            answer="Rust"
+        )
+        self.assertEqual(similar_cards(self.user, duplicate)[0][0], self.rust)
+        Card.objects.filter(pk=self.iron.pk).delete()
+        other = SimilarityIndex.load(
+            SavedSimilarityIndex.objects.get(user=self.user)
+        )
+        other.sync(reconcile=True)
+        other.save()
+        reloaded = get_index(self.user.pk)
+        self.assertIsNot(reloaded, index)
+        self.assertEqual(len(reloaded), 3)
+        self.assertNotIn(self.iron.pk, reloaded.rows)
+        self.assertIs(get_index(self.user.pk), reloaded)
+
+    def test_worker_refreshes_changed_indexes(self):
+        """
+        Tests that the image worker saves the indexes of the users whose
+        cards changed once its queue is empty, and only when they changed,
+        and that the command drops the deleted cards.
+        """
+        gold = Card.objects.create(
+            deck=self.deck,
+            question="What is the chemical symbol of gold?",
+            answer="Au"
+        )
+        output = StringIO()
+        call_command('process_card_images', workers=1, stdout=output)
+        self.assertIn(
+            'Saved the similarity index of 1 user(s).',
+            output.getvalue()
+        )
+        clear_indexes()
+        self.assertIn(gold.pk, get_index(self.user.pk).rows)
+        output = StringIO()
+        call_command('process_card_images', workers=1, stdout=output)
+        self.assertNotIn('Saved', output.getvalue())
+        gold.delete()
+        call_command('build_similarity_indexes', stdout=StringIO())
+        clear_indexes()
+        self.assertNotIn(gold.pk, get_index(self.user.pk).rows)
+
+    def test_no_saved_index(self):
+        """
+        Tests that a user without a saved index gets no similar or related
+        cards, and that the requests only look the saved index up.
+        """
+        SavedSimilarityIndex.objects.filter(user=self.user).delete()
+        clear_indexes()
+        with self.assertNumQueries(3):
+            self.assertIsNone(get_index(self.user.pk))
+            self.assertEqual(similar_cards(self.user, self.sodium), [])
+            self.assertEqual(related_cards(self.user, self.deck), [])
+        response = self.client.post(
+            reverse('create_card', args=[self.deck.id]),
+            {
+                'question': "What is the chemical symbol of iron?",
+                'answer': "Fe"
+            }
+        )
+        self.assertNotContains(response, "This card is similar to")
+
+    def test_index_rows(self):
+        """
+        Tests that replaced and removed rows stop matching, before and
+        after being merged into the main matrix.
+        """
+        index = SimilarityIndex(self.user.pk)
+        index.set(1, 1, "alpha beta")
+        index.set(2, 1, "gamma delta")
+        index.flush()
+        index.set(1, 1, "gamma epsilon")
+        index.set(3, 2, "alpha beta")
+        index.remove(3)
+        self.assertEqual(index.similar_to_text("alpha beta", 5), [])
+        self.assertEqual(
+            {card_id for card_id, _ in index.similar_to_text("gamma", 5)},
+            {1, 2}
+        )
+        index.remove(2)
+        index.flush()
+        # Three of the four rows were dead and have been dropped
+        self.assertEqual(index.rows, {1: 0})
+        self.assertEqual(index.similar_to_text("delta", 5), [])
+        self.assertEqual(index.similar_to_text("epsilon", 5)[0][0], 1)
+
+    def test_related_cards(self):
+        """
+        Tests that a deck lists the related cards of other decks only.
+        """
+        related = [card for card, _ in related_cards(self.user, self.deck)]
+        self.assertEqual(related[0], self.iron)
+        self.assertNotIn(self.sodium, related)
+
+    def test_create_card_warns(self):
+        """
+        Tests that creating a near duplicate shows a warning naming the
+        similar card.
+        """
+        response = self.client.post(
+            reverse('create_card', args=[self.deck.id]),
+            {
+                'question': "What is the chemical symbol of iron?",
+                'answer': "Fe"
+            }
+        )
+        self.assertContains(response, "This card is similar to")
+        self.assertContains(response, "in Metals")
+
+    def test_related_cards_view(self):
+        """
+        Tests that the related cards of a deck are rendered as a fragment
+        for its owner only.
+        """
+        url = reverse('deck_related_cards', args=[self.deck.id])
+        self.assertContains(
+            self.client.get(url),
+            "What is the chemical symbol of iron?"
+        )
+        self.client.logout()
+        User.objects.create_user(username='other', password='12345')
+        self.client.login(username='other', password='12345')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class IndexAdvisorTest(TestCase):
+    """
+    Tests for the EXPLAIN-based index advisor.
+    """
+    def test_sqlite_findings(self):
+        """
+        Tests that full scans and sorts are read from a SQLite plan, and
+        that index searches are not reported.
+        """
+        findings = sqlite_findings([
+            'SCAN cards_card',
+            'SEARCH cards_deck USING INTEGER PRIMARY KEY (rowid=?)',
+            'SCAN cards_subject USING INDEX cards_subject_creator_idx',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ])
+        self.assertEqual(
+            [(finding.kind, finding.table) for finding in findings],
+            [('scan', 'cards_card'), ('sort', 'cards_subject')]
+        )
+
+    def test_postgresql_findings(self):
+        """
+        Tests that sequential scans and sorts are read from a PostgreSQL
+        plan tree.
+        """
+        plan = {
+            'Node Type': 'Sort',
+            'Sort Key': ['cards_card.created_at DESC'],
+            'Plans': [{
+                'Node Type': 'Seq Scan',
+                'Relation Name': 'cards_card',
+                'Filter': '(deck_id = 1)',
+            }],
+        }
+        self.assertEqual(postgresql_findings(plan), [
+            Finding('sort', 'cards_card', 'Sort cards_card.created_at DESC'),
+            Finding('scan', 'cards_card', '(deck_id = 1)'),
+        ])
+
+    def test_suggest_index(self):
+        """
+        Tests that suggested indexes start with the columns compared for
+        equality and continue with the ordering columns.
+        """
+        sql = (
+            'SELECT "cards_card"."id" FROM "cards_card" INNER JOIN '
+            '"cards_deck" ON ("cards_card"."deck_id" = "cards_deck"."id") '
+            'WHERE ("cards_card"."image_status" = %s AND '
+            '"cards_deck"."subject_id" = %s) '
+            'ORDER BY "cards_card"."created_at" DESC LIMIT 21'
+        )
+        suggestion = suggest_index(sql, Finding('sort', None, ''))
+        self.assertEqual(suggestion.table, 'cards_card')
+        self.assertEqual(
+            suggestion.columns,
+            ('image_status', 'deck_id', 'created_at')
+        )
+
+    def test_current_views_need_no_index(self):
+        """
+        Tests that the advisor finds no missing index for the queries of
+        the current views.
+        """
+        out = StringIO()
+        call_command(
+            'advise_indexes',
+            subjects=1,
+            decks=2,
+            cards=3,
+            stdout=out
+        )
+        self.assertIn('No missing indexes.', out.getvalue())
+
+
+class ConnectionPoolTest(TestCase):
+    """
+    Tests for the pool of database connections.
+    """
+    class FakeConnection:
+        def __init__(self):
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    def test_reuse(self):
+        """
+        Tests that a released connection is handed out again and counted
+        as a hit, while new connections count as misses.
+        """
+        pool = ConnectionPool(max_size=2)
+        first = pool.acquire(self.FakeConnection)
+        pool.release(first)
+        self.assertIs(pool.acquire(self.FakeConnection), first)
+        second = pool.acquire(self.FakeConnection)
+        self.assertIsNot(second, first)
+        stats = pool.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['in_use'], 2)
+
+    def test_wait_and_timeout(self):
+        """
+        Tests that a full pool makes callers wait for a release, and
+        raises PoolTimeout when none comes in time.
+        """
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        connection = pool.acquire(self.FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(self.FakeConnection)
+        pool.timeout = 5
+        timer = threading.Timer(0.05, pool.release, [connection])
+        timer.start()
+        self.assertIs(pool.acquire(self.FakeConnection), connection)
+        timer.join()
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreater(stats['wait_seconds'], 0)
+
+    def test_health_check(self):
+        """
+        Tests that an idle connection failing its check is closed and
+        replaced.
+        """
+        pool = ConnectionPool(max_size=1, check_interval=0)
+        broken = pool.acquire(self.FakeConnection)
+        pool.release(broken)
+
+        def check(connection):
+            raise OSError('Connection reset')
+
+        connection = pool.acquire(self.FakeConnection, check=check)
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+        stats = pool.stats()
+        self.assertEqual(stats['failed_checks'], 1)
+        self.assertEqual(stats['size'], 1)
+
+    def test_max_age(self):
+        """
+        Tests that connections older than max_age are closed instead of
+        being reused.
+        """
+        pool = ConnectionPool(max_size=1, max_age=0)
+        connection = pool.acquire(self.FakeConnection)
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_pooled_backend(self):
+        """
+        Tests that the pooled backend keeps its connection open when Django
+        closes it at the end of a request.
+        """
+        handle, name = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.unlink, name)
+        databases = ConnectionHandler({'default': {
+            'ENGINE': 'flashcards.db.backends.sqlite3_pool',
+            'NAME': name,
+            'POOL': {'MAX_SIZE': 1},
+        }})
+        wrapper = databases['default']
+        pool = wrapper.get_pool()
+        self.addCleanup(close_pools)
+        wrapper.ensure_connection()
+        first = wrapper.connection
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(wrapper.connection, first)
+        wrapper.close()
+        self.assertEqual(pool.stats()['hits'], 1)
+        self.assertEqual(pool.stats()['misses'], 1)
+
+    def test_benchmark_command(self):
+        """
+        Tests that the pooling benchmark reports both modes.
+        """
+        out = StringIO()
+        call_command(
+            'bench_db_pool', repeat=3, threads=2, pool_size=1, stdout=out
+        )
+        self.assertIn('connection per request', out.getvalue())
+        self.assertIn('pooled connection', out.getvalue())
+
+
+@override_settings(ROOT_URLCONF='flashcards.asgi_urls')
+class AsyncViewsTest(TransactionTestCase):
+    """
+    Tests for the async views served through flashcards/asgi.py.
+
+    Django renders error pages of async views in another thread, which
+    would wait for the transaction of a TestCase.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Cytology",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Cells", subject=self.subject)
+        self.cards = [
+            Card.objects.create(
+                question=f"Question {i}",
+                answer=f"Answer {i}",
+                deck=self.deck
+            )
+            for i in range(3)
+        ]
+        self.async_client.force_login(self.user)
+
+    def test_routing(self):
+        """
+        Tests that the ASGI URL configuration serves the async views under
+        the URLs of the sync ones.
+        """
+        url = reverse('quiz_cards', args=[self.deck.id])
+        self.assertEqual(url, f'/deck/{self.deck.id}/quiz/cards/')
+        self.assertIs(resolve(url).func, async_views.quiz_cards)
+        self.assertIs(
+            resolve(reverse('deck_detail', args=[self.deck.id])).func,
+            async_views.deck_detail
+        )
+
+    def test_async_middleware(self):
+        """
+        Tests that the metrics and WhiteNoise middleware stay async in an
+        async chain, so Django does not run the views in a thread.
+        """
+        async def get_response(request):
+            pass
+
+        for middleware in (MetricsMiddleware, WhiteNoiseMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(get_response)))
+            self.assertFalse(iscoroutinefunction(
+                middleware(lambda request: None)
+            ))
+
+    async def test_server_timing(self):
+        """
+        Tests that the queries and templates of an async view, run in
+        threads, count for its request.
+        """
+        response = await self.async_client.get(
+            reverse('deck_detail', args=[self.deck.id])
+        )
+        self.assertEqual(response.status_code, 200)
+        timing = dict(
+            part.split(';', 1)
+            for part in response['Server-Timing'].split(', ')
+        )
+        self.assertNotIn('desc="0 queries"', timing['db'])
+        self.assertNotEqual(timing['template'], 'dur=0.0')
+
+    async def test_quiz_cards(self):
+        """
+        Tests that the async card stream pages through the deck like the
+        sync one.
+        """
+        url = reverse('quiz_cards', args=[self.deck.id])
+        response = await self.async_client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual(
+            [card['id'] for card in page['cards']],
+            [card.id for card in self.cards[:2]]
+        )
+        response = await self.async_client.get(page['next'])
+        page = response.json()
+        self.assertEqual(page['cards'][0]['question'], 'Question 2')
+        self.assertIsNone(page['next'])
+        response = await self.async_client.get(url, {'after': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_deck_detail(self):
+        """
+        Tests that the async deck page renders and answers conditional
+        requests with 304.
+        """
+        url = reverse('deck_detail', args=[self.deck.id])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Cells')
+        response = await self.async_client.get(
+            url,
+            headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_access(self):
+        """
+        Tests that anonymous users are sent to the login page and that
+        other users' decks are not found.
+        """
+        other = await User.objects.acreate(username='other@example.com')
+        url = reverse('quiz_cards', args=[self.deck.id])
+        await sync_to_async(self.async_client.force_login)(other)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 404)
+        await sync_to_async(self.async_client.logout)()
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse('login')))
+
+
+class LoadTestCommandTest(LiveServerTestCase):
+    """
+    Tests for the load-testing command, run against a live server.
+    """
+    def test_journey(self):
+        """
+        Tests that a student goes through the whole journey without
+        failures, that the baseline is saved and that the students are
+        deleted afterwards.
+        """
+        handle, baseline = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.unlink, baseline)
+        options = {
+            'url': self.live_server_url,
+            'students': 1,
+            'concurrency': 1,
+            'cards': 2,
+            'images': 1,
+            'quiz_rounds': 1,
+            'stdout': StringIO(),
+            'stderr': StringIO(),
+        }
+        call_command('loadtest', save=baseline, **options)
+        with open(baseline) as baseline_file:
+            results = json.load(baseline_file)
+        self.assertEqual(results['total']['failures'], 0)
+        self.assertEqual(results['endpoints']['POST create_card']['count'], 2)
+        self.assertEqual(results['endpoints']['POST review_card']['count'], 2)
+        self.assertFalse(
+            User.objects.filter(username__startswith='loadtest-').exists()
+        )
+
+        # A run failing more often than the baseline regresses
+        results['endpoints']['GET quiz_view']['failures'] = -1
+        with open(baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file)
+        with self.assertRaisesMessage(CommandError, 'GET quiz_view'):
+            call_command('loadtest', compare=baseline, **options)
+
+
+class ImageBenchmarkTest(TestCase):
+    """
+    Tests for the image pipeline benchmark.
+    """
+    def test_corpus(self):
+        """
+        Tests that every image class is generated the same on every run and
+        decodes to its format and size.
+        """
+        for image_class, (_, image_format, size) in IMAGE_CLASSES.items():
+            data = generate_image(image_class)
+            self.assertEqual(data, generate_image(image_class))
+            image = Image.open(BytesIO(data))
+            self.assertEqual((image.format, image.size), (image_format, size))
+        gif = Image.open(BytesIO(generate_image('gif_animated')))
+        self.assertTrue(gif.is_animated)
+        png = Image.open(BytesIO(generate_image('png_alpha')))
+        self.assertEqual(png.mode, 'RGBA')
+
+    def test_measure(self):
+        """
+        Tests that both targets are measured without leaving card images
+        or users behind.
+        """
+        original = default_storage._wrapped
+        self.addCleanup(setattr, default_storage, '_wrapped', original)
+        data = generate_image('icon')
+        for target in ('card', 'profile'):
+            result = measure(target, 'icon', data, 2)
+            self.assertEqual(result['count'], 2)
+            self.assertEqual(result['input_bytes'], len(data))
+            self.assertGreater(result['output_bytes'], 0)
+            self.assertGreater(result['peak_rss_mb'], 0)
+        self.assertFalse(CardImage.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_regressions(self):
+        """
+        Tests that only measurements beyond the tolerance, and above the
+        resolution of the measurement, regress.
+        """
+        baseline = {
+            'card jpeg': {
+                'p50_ms': 100.0, 'rss_growth_mb': 0.2, 'output_bytes': 1000
+            },
+        }
+        within = {
+            'card jpeg': {
+                'p50_ms': 110.0, 'rss_growth_mb': 0.9, 'output_bytes': 1000
+            },
+            'card icon': {
+                'p50_ms': 1.0, 'rss_growth_mb': 0.1, 'output_bytes': 100
+            },
+        }
+        self.assertEqual(regressions(within, baseline, 15), [])
+        beyond = {
+            'card jpeg': {
+                'p50_ms': 120.0, 'rss_growth_mb': 0.2, 'output_bytes': 1200
+            },
+        }
+        self.assertEqual(regressions(beyond, baseline, 15), [
+            'card jpeg p50_ms 100.0 -> 120.0',
+            'card jpeg output_bytes 1000.0 -> 1200.0',
+        ])
+
+    def test_needs_shared_database(self):
+        """
+        Tests that the workers refuse an in-memory database.
+        """
+        connection = connections['default']
+        if not (
+            connection.vendor == 'sqlite' and connection.is_in_memory_db()
+        ):
+            self.skipTest('The test database is shared between processes.')
+        with self.assertRaisesMessage(CommandError, 'shared'):
+            call_command('bench_images', stdout=StringIO())
+
+
+class MetricsTest(TestCase):
+    """
+    Tests for the request timings and the /metrics endpoint.
+    """
+    def setUp(self):
+        for histogram in metrics.HISTOGRAMS.values():
+            histogram.clear()
+        self.user = User.objects.create_user(
+            username='testuser@example.com',
+            password='12345'
+        )
+        self.subject = Subject.objects.create(
+            name="Cytology",
+            creator=self.user
+        )
+        self.deck = Deck.objects.create(name="Cells", subject=self.subject)
+        self.client.force_login(self.user)
+
+    def histogram_sum(self, key, view):
+        """
+        Returns the sum of the values a histogram observed for a view.
+        """
+        return metrics.HISTOGRAMS[key]._values[view][-1]
+
+    def test_server_timing(self):
+        """
+        Tests that a response reports its SQL queries and template time,
+        and that the histograms record them under the view name.
+        """
+        with capture_queries() as queries:
+            response = self.client.get(
+                reverse('deck_detail', args=[self.deck.id])
+            )
+        header = response['Server-Timing']
+        self.assertRegex(header, r'^total;dur=[\d.]+, db;dur=[\d.]+;')
+        self.assertIn(f'desc="{len(queries)} queries"', header)
+        # The timing wrapper is not reported as where queries come from
+        self.assertFalse(any(
+            query['origin'].startswith('flashcards/metrics.py')
+            for query in queries
+        ))
+        self.assertEqual(
+            self.histogram_sum('queries', 'deck_detail'), len(queries)
+        )
+        self.assertGreater(self.histogram_sum('template', 'deck_detail'), 0)
+        self.assertGreater(self.histogram_sum('total', 'deck_detail'), 0)
+
+        self.client.get('/no/such/page/')
+        self.assertIn('unresolved', metrics.HISTOGRAMS['total']._values)
+
+    def test_nested_timing(self):
+        """
+        Tests that nested calls of one kind count once, and that nothing
+        is recorded outside a request.
+        """
+        with metrics.timed('storage'):
+            pass
+        timings, token = metrics.start_request()
+        try:
+            with metrics.timed('storage'):
+                with metrics.timed('storage'):
+                    time.sleep(0.01)
+                nested = timings.storage
+            self.assertEqual(nested, 0)
+            self.assertGreaterEqual(timings.storage, 0.01)
+        finally:
+            metrics.end_request(token)
+
+    @override_settings(DEFAULT_FILE_STORAGE=(
+        'flashcards.storages.filesystem.FileSystemStorage'
+    ))
+    def test_storage_timing(self):
+        """
+        Tests that the calls of a timed storage count for the request.
+        """
+        self.client.get(reverse('profile'))
+        self.assertIsInstance(default_storage._wrapped, TimedStorageMixin)
+        self.assertGreater(self.histogram_sum('storage', 'profile'), 0)
+
+    def test_metrics_access(self):
+        """
+        Tests that only staff users and scrapers with the token read the
+        metrics.
+        """
+        url = reverse('metrics')
+        self.assertEqual(url, '/metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get(
+                url, HTTP_AUTHORIZATION='Bearer wrong'
+            )
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get(
+                url, HTTP_AUTHORIZATION='Bearer secret'
+            )
+            self.assertEqual(response.status_code, 200)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_export(self):
+        """
+        Tests that the histograms and the pool counters are exported in
+        the Prometheus text format.
+        """
+        self.client.get(reverse('deck_detail', args=[self.deck.id]))
+        pool = ConnectionPool(max_size=2)
+        with mock.patch.object(
+            metrics, 'pool_stats', return_value={'default': pool.stats()}
+        ):
+            response = self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+            )
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        lines = response.content.decode().splitlines()
+        self.assertIn(
+            '# TYPE flashcards_request_duration_seconds histogram', lines
+        )
+        self.assertIn(
+            'flashcards_request_duration_seconds_bucket'
+            '{view="deck_detail",le="+Inf"} 1', lines
+        )
+        self.assertIn(
+            'flashcards_request_duration_seconds_count'
+            '{view="deck_detail"} 1', lines
+        )
+        self.assertIn('flashcards_db_pool_max_size{alias="default"} 2', lines)
+        self.assertIn(
+            'flashcards_db_pool_hits_total{alias="default"} 0', lines
+        )
+
+    def test_histogram_buckets(self):
+        """
+        Tests that the bucket counts are cumulative and bounds inclusive.
+        """
+        histogram = metrics.Histogram('test', 'Test.', (1, 5))
+        for value in (0.5, 1, 3, 7):
+            histogram.observe('view', value)
+        self.assertEqual(histogram.export().splitlines()[2:], [
+            'test_bucket{view="view",le="1"} 2',
+            'test_bucket{view="view",le="5"} 3',
+            'test_bucket{view="view",le="+Inf"} 4',
+            'test_sum{view="view"} 11.5',
+            'test_count{view="view"} 4',
+        ])
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Renders every named URL as a logged-in user and checks the number of
+    SQL queries each view issues against a declared budget, for a small
+    and a large dataset, so that query counts cannot grow with data.
+    """
+    # The maximum number of queries per view, for any amount of data. Every
+    # page loads the session, the user and the user's profile for the
+    # navbar avatar, and conditional pages look up their validators.
+    QUERY_BUDGETS = {
+        'cards-home': 4,
+        'search': 3,
+        'create_subject': 3,
+        'subject_detail': 6,
+        'edit_subject': 4,
+        'delete_subject': 14,
+        'create_deck': 4,
+        'deck_detail': 5,
+        'deck_related_cards': 6,
+        'edit_deck': 4,
+        'delete_deck': 13,
+        'create_card': 6,
+        'edit_card': 7,
+        'batch_cards': 2,
+        'delete_card': 10,
+        'import_cards': 4,
+        'export_deck': 4,
+        'export_subject': 4,
+        'quiz_view': 6,
+        'quiz_cards': 4,
+        'review_card': 2,
+        'register': 3,
+        'login': 3,
+        'logout': 4,
+        'profile': 3,
+        'metrics': 2,
+    }
+    # Views that change data are rendered after all the others
+    DESTRUCTIVE = ('delete_card', 'delete_deck', 'delete_subject', 'logout')
+
+    def seed(self, username, subjects, decks, cards):
+        """
+        Creates a user owning subjects, each with decks of cards, and
+        reviews one card, and returns the URL keyword arguments to use.
+        """
+        user = User.objects.create_user(username=username, password='12345')
+        for s in range(subjects):
+            subject = Subject.objects.create(name=f'S{s}', creator=user)
+            for d in range(decks):
+                deck = Deck.objects.create(name=f'D{d}', subject=subject)
+                for c in range(cards):
+                    Card.objects.create(
+                        deck=deck, question=f'Q{c}', answer=f'A{c}'
+                    )
+        first_card = Card.objects.filter(deck__subject__creator=user).first()
+        CardSchedule.objects.create(user=user, card=first_card)
+        # The card and deck views use the last deck, so deleting them
+        # leaves the first subject with data to delete
+        return user, {
+            'subject_id': first_card.deck.subject_id,
+            'deck_id': deck.id,
+            'card_id': deck.card_set.first().id,
+        }
+
+    def measure(self, user, kwargs):
+        """
+        Renders every named URL as the user and returns the queries each
+        view ran.
+        """
+        patterns = named_patterns()
+        names = sorted(
+            patterns, key=lambda name: (name in self.DESTRUCTIVE, name)
+        )
+        self.client.force_login(user)
+        results = {}
+        for name in names:
+            url = reverse(name, kwargs={
+                key: kwargs[key] for key in patterns[name]
+            })
+            with capture_queries() as queries:
+                response = self.client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 500, url)
+            results[name] = queries
+        return results
+
+    def format_queries(self, queries):
+        """
+        Lists captured queries with where they were run from.
+        """
+        return '\n'.join(
+            f'  {query["sql"]}\n    from {query["origin"]}'
+            for query in queries
+        )
+
+    def test_every_view_has_a_budget(self):
+        """
+        Tests that every named URL declares a query budget.
+        """
+        missing = set(named_patterns()) - set(self.QUERY_BUDGETS)
+        self.assertFalse(missing, f'Views without a query budget: {missing}')
+
+    def test_query_counts_within_budget(self):
+        """
+        Tests that every view stays within its budget for a small and a
+        large dataset and issues no more queries for the large one.
+        """
+        small = self.measure(*self.seed('small@example.com', 1, 2, 2))
+        # Django deletes rows in batches of 100, so a subject of the large
+        # dataset stays within one batch
+        large = self.measure(*self.seed('large@example.com', 3, 4, 20))
+        for name, budget in self.QUERY_BUDGETS.items():
+            for label, queries in (('small', small), ('large', large)):
+                with self.subTest(view=name, data=label):
+                    self.assertLessEqual(
+                        len(queries[name]), budget,
+                        f'{name} ran {len(queries[name])} queries with the '
+                        f'{label} dataset, budget {budget}:\n'
+                        + self.format_queries(queries[name])
+                    )
+            with self.subTest(view=name, data='growth'):
+                self.assertLessEqual(
+                    len(large[name]), len(small[name]),
+                    f'{name} ran more queries with more data:\n'
+                    + self.format_queries(large[name])
+                )
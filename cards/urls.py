@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('', views.home, name='cards-home'),
+    path('search/', views.search, name='search'),
     path(
         'create_subject/',
         views.create_subject,
@@ -24,6 +25,11 @@ urlpatterns = [
         views.delete_subject,
         name='delete_subject'
     ),
+    path(
+        'subject/<int:subject_id>/export/',
+        views.export_subject,
+        name='export_subject'
+    ),
     path(
         'subject/<int:subject_id>/create_deck/',
         views.create_deck,
@@ -34,6 +40,11 @@ urlpatterns = [
         views.deck_detail,
         name='deck_detail'
     ),
+    path(
+        'deck/<int:deck_id>/related/',
+        views.deck_related_cards,
+        name='deck_related_cards'
+    ),
     path(
         'deck/<int:deck_id>/edit/',
         views.edit_deck,
@@ -54,6 +65,21 @@ urlpatterns = [
         views.manage_card,
         name='edit_card'
     ),
+    path(
+        'deck/<int:deck_id>/card/batch/',
+        views.batch_cards,
+        name='batch_cards'
+    ),
+    path(
+        'deck/<int:deck_id>/export/',
+        views.export_deck,
+        name='export_deck'
+    ),
+    path(
+        'deck/<int:deck_id>/import/',
+        views.import_cards,
+        name='import_cards'
+    ),
     path(
         'card/<int:card_id>/delete/',
         views.delete_card,
@@ -64,4 +90,14 @@ urlpatterns = [
         views.quiz_view,
         name='quiz_view'
     ),
+    path(
+        'deck/<int:deck_id>/quiz/cards/',
+        views.quiz_cards,
+        name='quiz_cards'
+    ),
+    path(
+        'card/<int:card_id>/review/',
+        views.review_card,
+        name='review_card'
+    ),
 ]
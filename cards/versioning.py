@@ -0,0 +1,67 @@
+"""
+Version counters for cached fragments.
+
+Each user and each subject has a version number kept in the cache. The
+number is part of the key of every fragment rendered from their data, and
+is bumped whenever that data changes, so a changed listing is rendered
+under a new key and stale fragments are never read again.
+"""
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'cards:version:{0}:{1}'
+
+
+def get_version(scope, pk):
+    """
+    Returns the current version of an object's cached fragments.
+
+    A missing counter starts from the current time in nanoseconds, so a
+    counter evicted from the cache never restarts at a version that was
+    already used.
+
+    Arguments:
+        scope (str): The kind of object, "user" or "subject".
+        pk (int): The primary key of the object.
+    """
+    key = VERSION_KEY.format(scope, pk)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(scope, pk):
+    """
+    Moves an object's fragments to a new version once the current
+    transaction commits, so no request can cache the old data under the
+    new version.
+
+    Arguments:
+        scope (str): The kind of object, "user" or "subject".
+        pk (int): The primary key of the object.
+    """
+    def bump():
+        key = VERSION_KEY.format(scope, pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+    transaction.on_commit(bump)
+
+
+def bump_listing_versions(user_id, subject_id=None):
+    """
+    Bumps the versions of the listings showing a subject: the user's
+    subject list and, if given, the subject's deck list.
+
+    Arguments:
+        user_id (int): The primary key of the subject's creator.
+        subject_id (int): The primary key of the subject.
+    """
+    bump_version('user', user_id)
+    if subject_id is not None:
+        bump_version('subject', subject_id)
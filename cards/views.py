@@ -1,11 +1,30 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from .forms import SubjectForm, DeckForm, CardForm
-from .models import Subject, Deck, Card
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from django.views.decorators.http import require_POST
+from .conditional import conditional_page, deck_updated_at, subject_updated_at
+from . import batch
+from .forms import (
+    SubjectForm, DeckForm, CardForm, CardBatchForm, CardImportForm
+)
+from .exporters import EXPORT_FORMATS, export_response
+from .importers import CardImporter, upload_rows
+from .models import Subject, Deck, Card, CardSchedule
+from .search import search_cards
+from .similarity import related_cards, similar_cards
+from .versioning import get_version
 from django.core.serializers import serialize
 import json
+import re
 
 
 # Home view
@@ -19,12 +38,13 @@ def home(request):
     """
     if request.user.is_authenticated:
         # Render a template with user-specific content for logged-in users
-        user_subjects = Subject.objects.filter(creator=request.user)
-        return render(
-            request,
-            'cards/home.html',
-            {'user_subjects': user_subjects}
-        )
+        # The list is only queried when its cached fragment is stale
+        user_subjects = Subject.objects.for_user(request.user).for_listing()
+        return render(request, 'cards/home.html', {
+            'user_subjects': user_subjects,
+            'listing_version': get_version('user', request.user.pk),
+            'cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT
+        })
     else:
         # Render a generic template (index.html) for non-logged-in users
         return render(request, 'cards/index.html')
@@ -54,6 +74,7 @@ def create_subject(request):
 
 # Subject Details
 @login_required
+@conditional_page(subject_updated_at)
 def subject_detail(request, subject_id):
     """
     Display the details of a specific subject.
@@ -63,7 +84,13 @@ def subject_detail(request, subject_id):
     user is denied access.
     """
     subject = get_object_or_404(Subject, id=subject_id, creator=request.user)
-    return render(request, 'cards/subject_detail.html', {'subject': subject})
+    # The decks are only queried when their cached fragment is stale
+    return render(request, 'cards/subject_detail.html', {
+        'subject': subject,
+        'decks': subject.deck_set.for_listing(),
+        'listing_version': get_version('subject', subject.pk),
+        'cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT
+    })
 
 
 # Edit Subject
@@ -139,6 +166,8 @@ def create_deck(request, subject_id):
 
 
 # Deck Details
+@login_required
+@conditional_page(deck_updated_at)
 def deck_detail(request, deck_id):
     """
     Display the details of a specific deck.
@@ -147,16 +176,29 @@ def deck_detail(request, deck_id):
     logged in user is the creator of the subject, if not the
     user is denied access.
     """
-    deck = get_object_or_404(Deck, id=deck_id, subject__creator=request.user)
-    cards = deck.card_set.all()
-    num_cards = deck.card_set.count()
+    deck = get_object_or_404(Deck.objects.for_user(request.user), id=deck_id)
     return render(
         request,
         'cards/deck_detail.html',
-        {'deck': deck, 'cards': cards, 'num_cards': num_cards}
+        {'deck': deck, 'num_cards': deck.card_count}
     )
 
 
+# Related Cards
+@login_required
+def deck_related_cards(request, deck_id):
+    """
+    Render the cards of the user's other decks most related to a deck.
+
+    The list is loaded by the deck page after it is shown, so the deck page
+    can still be answered from its own validators.
+    """
+    deck = get_object_or_404(Deck.objects.for_user(request.user), id=deck_id)
+    return render(request, 'cards/related_cards.html', {
+        'related': related_cards(request.user, deck)
+    })
+
+
 # Edit Deck
 @login_required
 def edit_deck(request, deck_id):
@@ -167,7 +209,7 @@ def edit_deck(request, deck_id):
     After a successful edit the user is redirected to the
     detail page.
     """
-    deck = get_object_or_404(Deck, id=deck_id, subject__creator=request.user)
+    deck = get_object_or_404(Deck.objects.for_user(request.user), id=deck_id)
 
     if request.method == 'POST':
         form = DeckForm(request.POST, instance=deck)
@@ -176,7 +218,7 @@ def edit_deck(request, deck_id):
             return redirect('deck_detail', deck_id=deck.id)
     else:
         form = DeckForm(instance=deck)
-    num_cards = deck.card_set.count()
+    num_cards = deck.card_count
     return render(
         request,
         'cards/deck_edit.html',
@@ -195,11 +237,11 @@ def delete_deck(request, deck_id):
     successful deletion, the user is redirected to the
     subject detail page.
     """
-    deck = get_object_or_404(Deck, id=deck_id, subject__creator=request.user)
+    deck = get_object_or_404(Deck.objects.for_user(request.user), id=deck_id)
 
     deck.delete()
     messages.success(request, "Deck deleted successfully")
-    return redirect('subject_detail', subject_id=deck.subject.id)
+    return redirect('subject_detail', subject_id=deck.subject_id)
 
 
 # CARDS
@@ -214,7 +256,7 @@ def manage_card(request, deck_id, card_id=None):
     If no card ID is provided, the view presents a form
     for creating a new card.
     """
-    deck = get_object_or_404(Deck, id=deck_id, subject__creator=request.user)
+    deck = get_object_or_404(Deck.objects.for_user(request.user), id=deck_id)
     if card_id:
         card = get_object_or_404(Card, id=card_id, deck=deck)
         action = "Edit"
@@ -228,12 +270,25 @@ def manage_card(request, deck_id, card_id=None):
             card = form.save(commit=False)
             card.deck = deck
             card.save()
+            similar = similar_cards(request.user, card)
+            if similar:
+                matches = ", ".join(
+                    f'"{other.question_preview[:60]}" in {other.deck.name}'
+                    for other, _ in similar
+                )
+                messages.warning(
+                    request,
+                    f"This card is similar to {matches}"
+                )
             form = CardForm()
     else:
         form = CardForm(instance=card)
-    cards = Card.objects.filter(deck=deck).order_by('-created_at')
+    cards = Card.objects.filter(deck=deck).for_listing().order_by(
+        '-created_at'
+    )
     return render(request, 'cards/card_form.html', {
         'form': form,
+        'batch_form': CardBatchForm(deck, request.user),
         'deck': deck,
         'cards': cards,
         'action': action
@@ -255,39 +310,432 @@ def delete_card(request, card_id):
         id=card_id,
         deck__subject__creator=request.user
     )
-    deck_id = card.deck.id
+    deck_id = card.deck_id
     card.delete()
     messages.success(request, "Card deleted successfully")
     return redirect('create_card', deck_id=deck_id)
 
 
+# Batch actions on Cards
+@login_required
+@require_POST
+def batch_cards(request, deck_id):
+    """
+    Delete, move, copy or remove the images of the selected cards of a
+    deck.
+
+    The selection is checked against the deck in a single query and each
+    action runs as set-based queries in one transaction, whatever the
+    number of selected cards.
+    """
+    deck = get_object_or_404(Deck.objects.for_user(request.user), id=deck_id)
+    form = CardBatchForm(deck, request.user, request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect('create_card', deck_id=deck.id)
+    action = form.cleaned_data['action']
+    cards = form.cleaned_data['cards']
+    target = form.cleaned_data['target']
+    if action == CardBatchForm.DELETE:
+        count = batch.delete_cards(deck, cards)
+        message = f"Deleted {count} card(s)"
+    elif action == CardBatchForm.MOVE:
+        count = batch.move_cards(deck, cards, target)
+        message = f"Moved {count} card(s) to {target.name}"
+    elif action == CardBatchForm.COPY:
+        count = batch.copy_cards(cards, target)
+        message = f"Copied {count} card(s) to {target.name}"
+    else:
+        count = batch.clear_card_images(deck, cards)
+        message = f"Removed {count} image(s)"
+    messages.success(request, message)
+    return redirect('create_card', deck_id=deck.id)
+
+
+# Export Cards
+@login_required
+def export_deck(request, deck_id):
+    """
+    Download the cards of a deck as CSV, JSON Lines or a zip archive with
+    their images, chosen with `?format=`.
+    """
+    deck = get_object_or_404(Deck.objects.for_user(request.user), id=deck_id)
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise Http404('Unknown export format.')
+    return export_response(
+        request,
+        deck.card_set.all(),
+        export_format,
+        deck.name
+    )
+
+
+@login_required
+def export_subject(request, subject_id):
+    """
+    Download the cards of every deck of a subject as CSV, JSON Lines or a
+    zip archive with their images, chosen with `?format=`.
+    """
+    subject = get_object_or_404(Subject, id=subject_id, creator=request.user)
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise Http404('Unknown export format.')
+    cards = Card.objects.filter(deck__subject=subject)
+    return export_response(request, cards, export_format, subject.name)
+
+
+# Import Cards
+@login_required
+def import_cards(request, deck_id):
+    """
+    Import cards into a deck from a CSV/TSV file or an Anki package.
+
+    The file is read as a stream and the cards are inserted in batches in
+    a single transaction, so either every card of the file is imported or
+    none is.
+    """
+    deck = get_object_or_404(Deck.objects.for_user(request.user), id=deck_id)
+    if request.method == 'POST':
+        form = CardImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            importer = CardImporter(deck)
+            try:
+                importer.run(upload_rows(
+                    form.cleaned_data['file'],
+                    form.cleaned_data['has_header']
+                ))
+            except ValidationError as error:
+                form.add_error('file', error)
+            except UnicodeDecodeError:
+                form.add_error('file', 'The file must be UTF-8 encoded.')
+            else:
+                message = f"Imported {importer.created} card(s)"
+                if importer.skipped:
+                    message += (
+                        f", skipped {importer.skipped} row(s) without a "
+                        "question or answer"
+                    )
+                messages.success(request, message)
+                return redirect('create_card', deck_id=deck.id)
+    else:
+        form = CardImportForm()
+    return render(
+        request,
+        'cards/card_import.html',
+        {'form': form, 'deck': deck}
+    )
+
+
 # Quiz view
+# The number of cards served per session in "due" mode
+DUE_CARDS_LIMIT = 20
+# The number of cards per page of the quiz card stream
+QUIZ_PAGE_SIZE = 50
+QUIZ_MAX_PAGE_SIZE = 200
+JSON_CONTENT = 'application/json'
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def card_data(request, card):
+    """
+    Builds the dictionary representing a card in the quiz payload.
+
+    Arguments:
+        request (HttpRequest): The current request, used to build absolute
+            image URLs.
+        card (Card): The card to serialize.
+
+    Returns:
+        dict: The card data consumed by quiz.js.
+    """
+    if card.question_image:
+        question_img = request.build_absolute_uri(card.question_image.url)
+    else:
+        question_img = ''
+    if card.answer_image:
+        answer_img = request.build_absolute_uri(card.answer_image.url)
+    else:
+        answer_img = ''
+    return {
+        'id': card.id,
+        'question': card.question,
+        'answer': card.answer,
+        'question_image': question_img,
+        'question_srcset': card.srcset(
+            'question_image',
+            request.build_absolute_uri
+        ),
+        'answer_image': answer_img,
+        'answer_srcset': card.srcset(
+            'answer_image',
+            request.build_absolute_uri
+        )
+    }
+
+
+def due_cards(user, deck, limit=DUE_CARDS_LIMIT):
+    """
+    Returns at most `limit` cards of a deck that are due for review.
+
+    Cards with an overdue schedule are returned first, oldest due date
+    first, read from one range of the (user, deck, due_at) index. Any
+    remaining slots are filled with the deck's unscheduled cards, read
+    from the partial index of new cards. Both reads stop after `limit`
+    rows, so the cost depends neither on the size of the deck nor on the
+    user's history.
+    """
+    schedules = CardSchedule.objects.filter(
+        user=user,
+        deck=deck,
+        due_at__lte=timezone.now()
+    ).select_related('card').order_by('due_at')[:limit]
+    cards = [schedule.card for schedule in schedules]
+    if len(cards) < limit:
+        new_cards = deck.card_set.filter(
+            scheduled=False
+        ).order_by('id')[:limit - len(cards)]
+        cards.extend(new_cards)
+    return cards
+
+
+def quiz_page(request, deck, after=0, limit=QUIZ_PAGE_SIZE):
+    """
+    Returns one page of a deck's cards for the quiz, keyset-paginated on
+    (deck_id, id).
+
+    Arguments:
+        request (HttpRequest): The current request.
+        deck (Deck): The deck to read the cards from.
+        after (int): The id of the last card of the previous page.
+        limit (int): The maximum number of cards in the page.
+
+    Returns:
+        dict: The cards of the page and the URL of the next page, which is
+            None on the last page.
+    """
+    return quiz_page_data(
+        request, deck, list(quiz_page_cards(deck, after, limit)), limit
+    )
+
+
+def quiz_page_cards(deck, after, limit):
+    """
+    Returns the cards of a quiz page, with one extra row telling whether
+    there is a next page.
+    """
+    return Card.objects.filter(
+        deck=deck, id__gt=after
+    ).order_by('id')[:limit + 1]
+
+
+def quiz_page_data(request, deck, cards, limit):
+    """
+    Builds a page of the quiz from the cards read by `quiz_page_cards`.
+    """
+    next_url = None
+    if len(cards) > limit:
+        cards = cards[:limit]
+        next_url = '{0}?after={1}&limit={2}'.format(
+            reverse('quiz_cards', kwargs={'deck_id': deck.id}),
+            cards[-1].id,
+            limit
+        )
+    return {
+        'cards': [card_data(request, card) for card in cards],
+        'next': next_url
+    }
+
+
+def quiz_cache_key(request, deck, after, limit):
+    """
+    Returns the cache key of a page of the quiz.
+
+    Entries are keyed on the deck's revision, which changes whenever one of
+    its cards changes, so an entry never has to be invalidated. The host is
+    part of the key because the image URLs are absolute.
+    """
+    return 'cards:quiz:{0}:{1}:{2}:{3}:{4}'.format(
+        deck.pk,
+        deck.revision,
+        after,
+        limit,
+        request.build_absolute_uri('/')
+    )
+
+
+def quiz_cache_entry(page):
+    """
+    Builds the cache entry of a page from `quiz_page`, holding the page as
+    "page", its JSON encoding as "body" and, when it is smaller, a gzip
+    copy of it as "gzip".
+    """
+    body = json.dumps(page, cls=DjangoJSONEncoder).encode()
+    entry = {'page': page, 'body': body}
+    compressed = compress_string(body)
+    if len(compressed) < len(body):
+        entry['gzip'] = compressed
+    return entry
+
+
+def cached_quiz_page(request, deck, after=0, limit=QUIZ_PAGE_SIZE):
+    """
+    Returns a page of the quiz from the cache, building and caching it on a
+    miss.
+
+    Arguments:
+        request (HttpRequest): The current request.
+        deck (Deck): The deck to read the cards from.
+        after (int): The id of the last card of the previous page.
+        limit (int): The maximum number of cards in the page.
+
+    Returns:
+        dict: The entry from `quiz_cache_entry`.
+    """
+    key = quiz_cache_key(request, deck, after, limit)
+    entry = cache.get(key)
+    if entry is None:
+        entry = quiz_cache_entry(quiz_page(request, deck, after, limit))
+        cache.set(key, entry, settings.QUIZ_CACHE_TIMEOUT)
+    return entry
+
+
 @login_required
+@conditional_page(deck_updated_at)
 def quiz_view(request, deck_id):
     """
     Renders the quiz page with a set of cards from a specified deck.
     Ensures that all necessary content is available for front-end parsing.
+
+    With `?mode=due`, only the cards currently due for review are served,
+    and each card can be graded to update its schedule.
+    """
+    deck = get_object_or_404(Deck.objects.for_user(request.user), pk=deck_id)
+    due_mode = request.GET.get('mode') == 'due'
+    if due_mode:
+        data = []
+        for card in due_cards(request.user, deck):
+            card_dict = card_data(request, card)
+            card_dict['review_url'] = reverse(
+                'review_card',
+                kwargs={'card_id': card.id}
+            )
+            data.append(card_dict)
+        page = {'cards': data, 'next': None}
+    else:
+        # Only the first page is inlined, quiz.js streams the rest
+        page = cached_quiz_page(request, deck)['page']
+    return render(request, 'cards/quiz.html', {
+        'deck': deck,
+        'cards': page['cards'],
+        'next_page': page['next'],
+        'due_mode': due_mode
+    })
+
+
+# Quiz card stream
+@login_required
+def quiz_cards(request, deck_id):
+    """
+    Returns a page of the deck's cards as JSON for the quiz client.
+
+    Pages are keyset-paginated: `after` is the id of the last card of the
+    previous page, so every page costs the same regardless of its position
+    in the deck.
     """
-    deck = get_object_or_404(Deck, pk=deck_id, subject__creator=request.user)
-    cards = deck.card_set.all()
-    data = []
-    for card in cards:
-        if card.question_image:
-            question_img = request.build_absolute_uri(card.question_image.url)
-        else:
-            question_img = ''
-        if card.answer_image:
-            answer_img = request.build_absolute_uri(card.answer_image.url)
-        else:
-            answer_img = ''
-        card_data = {
-            'question': card.question,
-            'answer': card.answer,
-            'question_image': question_img,
-            'answer_image': answer_img
-        }
-        data.append(card_data)
-    return render(request, 'cards/quiz.html', {'deck': deck, 'cards': data})
+    deck = get_object_or_404(Deck.objects.for_user(request.user), pk=deck_id)
+    try:
+        after, limit = quiz_cursor(request)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    entry = cached_quiz_page(request, deck, after, limit)
+    return quiz_response(request, entry)
+
+
+def quiz_cursor(request):
+    """
+    Reads the `after` and `limit` parameters of a quiz card stream request.
+
+    Returns:
+        tuple: The id of the last card of the previous page and the page
+            size, clamped to QUIZ_MAX_PAGE_SIZE.
+
+    Raises:
+        ValueError: If a parameter is not a number.
+    """
+    after = int(request.GET.get('after', 0))
+    limit = int(request.GET.get('limit', QUIZ_PAGE_SIZE))
+    return after, max(1, min(limit, QUIZ_MAX_PAGE_SIZE))
+
+
+def quiz_response(request, entry):
+    """
+    Responds with a cached quiz page, gzipped if the client accepts it.
+    """
+    accepts_gzip = ACCEPTS_GZIP.search(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')
+    )
+    if 'gzip' in entry and accepts_gzip:
+        response = HttpResponse(entry['gzip'], content_type=JSON_CONTENT)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(entry['body'], content_type=JSON_CONTENT)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+# Review a card
+@login_required
+@require_POST
+def review_card(request, card_id):
+    """
+    Records a review of a card in due mode.
+
+    Expects a `quality` between 0 and 5 and responds with the next due
+    date of the card.
+    """
+    card = get_object_or_404(
+        Card,
+        id=card_id,
+        deck__subject__creator=request.user
+    )
+    try:
+        quality = int(request.POST.get('quality', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid quality.'}, status=400)
+    if not 0 <= quality <= 5:
+        return JsonResponse({'error': 'Invalid quality.'}, status=400)
+    schedule, created = CardSchedule.objects.get_or_create(
+        user=request.user,
+        card=card
+    )
+    schedule.review(quality)
+    schedule.save()
+    return JsonResponse({
+        'due_at': schedule.due_at.isoformat(),
+        'interval': schedule.interval
+    })
+
+
+# Search
+@login_required
+def search(request):
+    """
+    Search the user's cards by the words of their question, answer, deck
+    and subject, best matches first.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+    results = search_cards(request.user, query, page)
+    return render(request, 'cards/search.html', {
+        'query': query,
+        'results': results,
+    })
 
 
 # 404 handler
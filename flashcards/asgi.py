@@ -2,6 +2,10 @@
 ASGI config for flashcards project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are routed with flashcards/asgi_urls.py, serving the read-heavy
+views asynchronously. Run it with an ASGI server, e.g.:
+
+    gunicorn flashcards.asgi -k uvicorn.workers.UvicornWorker
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -9,8 +13,24 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'flashcards.settings')
 
-application = get_asgi_application()
+# The URL configuration of requests served through this module
+ASGI_URLCONF = 'flashcards.asgi_urls'
+
+
+class URLConfHandler(ASGIHandler):
+    """
+    Django's ASGI handler, resolving requests with ASGI_URLCONF.
+    """
+    async def get_response_async(self, request):
+        request.urlconf = ASGI_URLCONF
+        return await super().get_response_async(request)
+
+
+# As django.core.asgi.get_asgi_application, with the handler above
+django.setup(set_prefix=False)
+application = URLConfHandler()
@@ -0,0 +1,24 @@
+"""
+URL configuration of the ASGI deployment, see flashcards/asgi.py.
+
+The read-heavy views are served by their async variants, everything else
+as in flashcards/urls.py.
+"""
+from django.urls import path
+from cards import async_views
+from . import urls
+
+urlpatterns = [
+    path(
+        'deck/<int:deck_id>/',
+        async_views.deck_detail,
+        name='deck_detail'
+    ),
+    path(
+        'deck/<int:deck_id>/quiz/cards/',
+        async_views.quiz_cards,
+        name='quiz_cards'
+    ),
+] + urls.urlpatterns
+
+handler404 = urls.handler404
@@ -0,0 +1,276 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from unittest import mock
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import CommandError
+from django.db import connections, transaction
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils.functional import LazyObject, empty
+from . import metrics
+
+# The server command of each deployment, one worker process each
+SERVERS = {
+    'wsgi': ['gunicorn', 'flashcards.wsgi', '--workers', '1'],
+    'asgi': [
+        'gunicorn', 'flashcards.asgi', '--workers', '1',
+        '--worker-class', 'uvicorn.workers.UvicornWorker',
+    ],
+}
+# Seconds to wait for a server to answer after starting it
+STARTUP_TIMEOUT = 30
+
+
+@contextmanager
+def rolled_back():
+    """
+    Runs the block in a transaction that is always rolled back, so a
+    benchmark leaves no rows behind in the configured database.
+    """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def time_calls(func, repeat):
+    """
+    Calls a function repeatedly and times each call.
+
+    Arguments:
+        func (callable): The function to call without arguments.
+        repeat (int): The number of calls.
+
+    Returns:
+        list: The duration of each call in seconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, fraction):
+    """
+    Returns the nearest-rank percentile of a list of samples.
+
+    Arguments:
+        samples (list): The samples, in any order.
+        fraction (float): The percentile as a fraction, e.g. 0.95.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    Summarizes duration samples in milliseconds.
+
+    Arguments:
+        samples (list): Durations in seconds.
+
+    Returns:
+        dict: The count, mean, p50, p95, p99 and max of the samples.
+    """
+    count = len(samples)
+    return {
+        'count': count,
+        'mean_ms': sum(samples) / count * 1000 if count else 0.0,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'max_ms': max(samples) * 1000 if count else 0.0,
+    }
+
+
+def format_summary(label, summary):
+    """
+    Formats a summary from `summarize` as a single report line.
+    """
+    return (
+        f'{label:<32} n={summary["count"]:<6} '
+        f'mean={summary["mean_ms"]:8.3f}ms '
+        f'p50={summary["p50_ms"]:8.3f}ms '
+        f'p95={summary["p95_ms"]:8.3f}ms '
+        f'p99={summary["p99_ms"]:8.3f}ms'
+    )
+
+
+@contextmanager
+def count_storage_calls(storage=default_storage):
+    """
+    Counts the reads and writes made through a storage while the block
+    runs.
+
+    Yields:
+        dict: The number of "open" and "save" calls, updated live.
+    """
+    counts = {'open': 0, 'save': 0}
+    if isinstance(storage, LazyObject):
+        if storage._wrapped is empty:
+            storage._setup()
+        storage = storage._wrapped
+    storage_class = type(storage)
+    original_open = storage_class.open
+    original_save = storage_class.save
+
+    def counting_open(self, *args, **kwargs):
+        counts['open'] += 1
+        return original_open(self, *args, **kwargs)
+
+    def counting_save(self, *args, **kwargs):
+        counts['save'] += 1
+        return original_save(self, *args, **kwargs)
+
+    with mock.patch.object(storage_class, 'open', counting_open), \
+            mock.patch.object(storage_class, 'save', counting_save):
+        yield counts
+
+
+def query_origin(base_dir=None):
+    """
+    Describes where the query being executed comes from: the innermost
+    frame of project code and, if a template is being rendered, the
+    template and line.
+
+    Arguments:
+        base_dir (str): The project directory, defaults to BASE_DIR.
+
+    Returns:
+        str: The origin, e.g. "cards/views.py:42 in home".
+    """
+    base_dir = str(base_dir or settings.BASE_DIR)
+    code = None
+    template = None
+    frame = sys._getframe(1)
+    while frame:
+        filename = frame.f_code.co_filename
+        if template is None and frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                template = f'{origin.template_name} line {token.lineno}'
+        if code is None and filename.startswith(base_dir) \
+                and 'site-packages' not in filename \
+                and filename not in (__file__, metrics.__file__) \
+                and not filename.endswith('tests.py'):
+            code = '{0}:{1} in {2}'.format(
+                os.path.relpath(filename, base_dir),
+                frame.f_lineno,
+                frame.f_code.co_name
+            )
+        frame = frame.f_back
+    return '; '.join(
+        part for part in (code, template and f'template {template}') if part
+    ) or 'unknown'
+
+
+@contextmanager
+def capture_queries(using='default'):
+    """
+    Records the SQL run on a database connection while the block runs,
+    with the time and origin of each query.
+
+    Yields:
+        list: {"sql", "time", "origin"} dictionaries, updated live.
+    """
+    queries = []
+
+    def record(execute, sql, params, many, context):
+        origin = query_origin()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            queries.append({
+                'sql': sql,
+                'params': params,
+                'time': time.perf_counter() - start,
+                'origin': origin,
+            })
+
+    with connections[using].execute_wrapper(record):
+        yield queries
+
+
+def named_patterns(resolver=None):
+    """
+    Lists every named URL pattern of the project.
+
+    Arguments:
+        resolver (URLResolver): The resolver to walk, defaults to the root.
+
+    Returns:
+        dict: The names of the URL keyword arguments of each pattern name.
+    """
+    resolver = resolver or get_resolver()
+    patterns = {}
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            patterns.update(named_patterns(pattern))
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            patterns[pattern.name] = set(pattern.pattern.converters)
+    return patterns
+
+
+@contextmanager
+def serve(name, port, config=None):
+    """
+    Runs a deployment on a local port while the block runs, with the
+    settings and database of the current process.
+
+    Arguments:
+        name (str): "wsgi" or "asgi", see SERVERS.
+        port (int): The port to listen on.
+        config (str): An optional gunicorn configuration file.
+
+    Raises:
+        CommandError: If the server exits or does not answer in time.
+    """
+    command = [sys.executable, '-m'] + SERVERS[name] + [
+        '--bind', f'127.0.0.1:{port}'
+    ]
+    if config:
+        command += ['--config', config]
+    process = subprocess.Popen(
+        command,
+        cwd=settings.BASE_DIR,
+        env=dict(os.environ),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                raise CommandError(
+                    f'The {name} server exited with {process.returncode}, '
+                    f'run "{" ".join(command)}" to see why.'
+                )
+            if time.monotonic() > deadline:
+                raise CommandError(f'The {name} server did not start.')
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5)
+                break
+            except urllib.error.HTTPError:
+                # Any response means the server is up
+                break
+            except OSError:
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        process.wait()
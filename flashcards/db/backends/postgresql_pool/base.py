@@ -0,0 +1,9 @@
+"""
+The PostgreSQL backend, taking its connections from a pool.
+"""
+from django.db.backends.postgresql import base
+from flashcards.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
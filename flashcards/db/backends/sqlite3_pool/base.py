@@ -0,0 +1,12 @@
+"""
+The SQLite backend, taking its connections from a pool.
+
+Meant as a stand-in for benchmarks and tests of the pool, in-memory
+databases cannot be pooled since each connection has its own database.
+"""
+from django.db.backends.sqlite3 import base
+from flashcards.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,317 @@
+"""
+A bounded pool of database connections per process.
+
+Django opens a connection the first time a request needs one and closes it
+when the request ends. The pooled backends in flashcards.db.backends hand
+out connections from a pool instead and give them back on close, so a
+request only pays for a new connection when every pooled one is in use.
+
+Idle connections are checked with a query before reuse once they have been
+idle for CHECK_INTERVAL seconds, and replaced after MAX_AGE seconds. When
+MAX_SIZE connections are in use, requests wait up to TIMEOUT seconds for one
+to be given back.
+
+Each pool counts its hits, misses, waits and timeouts, see `pool_stats`.
+"""
+import os
+import threading
+import time
+
+# The defaults of the POOL options of a database
+POOL_DEFAULTS = {
+    'MAX_SIZE': 4,
+    'TIMEOUT': 10.0,
+    'MAX_AGE': 30 * 60.0,
+    'CHECK_INTERVAL': 30.0,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection was given back to a full pool in time.
+    """
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of DB-API connections.
+
+    The most recently released connection is reused first, so connections
+    that are rarely needed age out instead of being kept warm.
+
+    Attributes:
+        max_size (int): The maximum number of open connections.
+        timeout (float): How long to wait for a connection, in seconds.
+        max_age (float): The lifetime of a connection in seconds, or None.
+        check_interval (float): The idle time in seconds after which a
+            connection is checked before reuse, or None to never check.
+        pid (int): The process the pool belongs to.
+    """
+    def __init__(self, max_size=4, timeout=10.0, max_age=None,
+                 check_interval=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        # (connection, created at, released at) of the idle connections
+        self._idle = []
+        # The creation time of every open connection
+        self._created = {}
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.failed_checks = 0
+        self.discarded = 0
+
+    def acquire(self, connect, check=None):
+        """
+        Takes an idle connection, or opens one if the pool is not full, or
+        waits for a connection to be released.
+
+        Arguments:
+            connect (callable): Opens a new connection.
+            check (callable): Called with an idle connection before reuse,
+                raises if the connection is broken.
+
+        Returns:
+            The connection.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._condition:
+                if not self._idle and self._size >= self.max_size:
+                    started = time.monotonic()
+                    self.waits += 1
+                    while not self._idle and self._size >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            self.wait_seconds += time.monotonic() - started
+                            raise PoolTimeout(
+                                f'No connection was released within '
+                                f'{self.timeout:g}s, all {self.max_size} '
+                                f'are in use.'
+                            )
+                        self._condition.wait(remaining)
+                    self.wait_seconds += time.monotonic() - started
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    entry = None
+                    # Reserve the slot while connecting outside the lock
+                    self._size += 1
+            if entry is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self._created[connection] = time.monotonic()
+                    self.misses += 1
+                return connection
+            connection, created_at, released_at = entry
+            now = time.monotonic()
+            if self.max_age is not None and now - created_at > self.max_age:
+                self.discard(connection)
+                continue
+            if check is not None and self.check_interval is not None \
+                    and now - released_at >= self.check_interval:
+                try:
+                    check(connection)
+                except Exception:
+                    with self._condition:
+                        self.failed_checks += 1
+                    self.discard(connection)
+                    continue
+            with self._condition:
+                self.hits += 1
+            return connection
+
+    def release(self, connection):
+        """
+        Gives a connection back to the pool, or closes it if it is too old
+        or the process was forked since it was opened.
+        """
+        if os.getpid() != self.pid:
+            return
+        with self._condition:
+            created_at = self._created.get(connection)
+            if created_at is None:
+                # Not opened by this pool, e.g. discarded meanwhile
+                return
+        now = time.monotonic()
+        if self.max_age is not None and now - created_at > self.max_age:
+            self.discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, created_at, now))
+            self._condition.notify()
+
+    def discard(self, connection):
+        """
+        Closes a connection and frees its slot.
+        """
+        with self._condition:
+            if self._created.pop(connection, None) is None:
+                return
+            self._size -= 1
+            self.discarded += 1
+            self._condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close_idle(self):
+        """
+        Closes every idle connection.
+        """
+        with self._condition:
+            idle = [entry[0] for entry in self._idle]
+            self._idle = []
+        for connection in idle:
+            self.discard(connection)
+
+    def stats(self):
+        """
+        Returns the counters of the pool.
+
+        Returns:
+            dict: The number of open, idle and in use connections, the
+                maximum size, and the hits, misses, waits, total wait time
+                in seconds, timeouts, failed checks and discarded
+                connections since the pool was created.
+        """
+        with self._condition:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+                'timeouts': self.timeouts,
+                'failed_checks': self.failed_checks,
+                'discarded': self.discarded,
+            }
+
+
+def get_pool(alias, options=None):
+    """
+    Returns the pool of a database in the current process, created with
+    the given POOL options on first use.
+
+    Arguments:
+        alias (str): The database alias.
+        options (dict): The POOL options of the database.
+    """
+    with _pools_lock:
+        pool = _pools.get(alias)
+        # Connections inherited from a parent process are not reused
+        if pool is None or pool.pid != os.getpid():
+            options = {**POOL_DEFAULTS, **(options or {})}
+            pool = _pools[alias] = ConnectionPool(
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                max_age=options['MAX_AGE'],
+                check_interval=options['CHECK_INTERVAL'],
+            )
+        return pool
+
+
+def pool_stats():
+    """
+    Returns the counters of every pool of the current process.
+
+    Returns:
+        dict: The `ConnectionPool.stats` of each database alias.
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return {
+        alias: pool.stats() for alias, pool in pools.items()
+        if pool.pid == os.getpid()
+    }
+
+
+def close_pools():
+    """
+    Closes the idle connections of every pool and forgets the pools.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        if pool.pid == os.getpid():
+            pool.close_idle()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mixin for database backends taking their connections from a pool.
+
+    Database settings accept a POOL dictionary with the MAX_SIZE, TIMEOUT,
+    MAX_AGE and CHECK_INTERVAL options, see POOL_DEFAULTS.
+    """
+    def get_pool(self):
+        """
+        Returns the pool of the database in the current process.
+        """
+        return get_pool(self.alias, self.settings_dict.get('POOL'))
+
+    def get_new_connection(self, conn_params):
+        """
+        Takes a connection from the pool, opening a new one only if the
+        pool has no idle connection.
+        """
+        try:
+            return self.get_pool().acquire(
+                lambda: super(PooledDatabaseWrapperMixin, self)
+                .get_new_connection(conn_params),
+                check=self.check_pooled_connection
+            )
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error)) from error
+
+    def check_pooled_connection(self, connection):
+        """
+        Runs a trivial query on an idle connection, raising if it fails.
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _close(self):
+        """
+        Gives the connection back to the pool, or closes it if it had
+        errors or is left in a transaction that cannot be rolled back.
+        """
+        if self.connection is None:
+            return
+        pool = self.get_pool()
+        if self.errors_occurred:
+            pool.discard(self.connection)
+            return
+        try:
+            # A no-op unless a transaction was left open
+            self.connection.rollback()
+        except self.Database.Error:
+            pool.discard(self.connection)
+            return
+        pool.release(self.connection)
@@ -0,0 +1,361 @@
+"""
+Per-request timings, reported in a Server-Timing header and aggregated
+into histograms served in the Prometheus text format at /metrics.
+
+flashcards.middleware.MetricsMiddleware starts a RequestTimings for every
+request, and the instrumented code adds to it while the request runs:
+
+- SQL: an execute wrapper added to every database connection counts the
+  queries and their time.
+- Templates: the DjangoTemplates backend below times the rendering of top
+  level templates. Queries run lazily while rendering count in both.
+- Media storage: storages built on TimedStorageMixin, see
+  flashcards/storages/, time their calls.
+
+The timings live in a context variable, so they follow a request into the
+threads sync_to_async runs it in under ASGI. Code running outside a
+request costs one context variable lookup. Histograms are kept per
+process, like the pool counters of flashcards/db/pool.py: each worker
+reports the requests it served.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends import django as django_backend
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from flashcards.db.pool import pool_stats
+
+# Upper bounds of the buckets of the duration histograms, in seconds
+SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+# Upper bounds of the buckets of the query count histogram
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    The time a request spent on SQL, templates and media storage.
+    """
+    __slots__ = ('start', 'queries', 'sql', 'template', 'storage', 'active')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.storage = 0.0
+        # The kinds being timed, so nested calls are not counted twice
+        self.active = set()
+
+    def server_timing(self, total):
+        """
+        Returns the Server-Timing header value, durations in milliseconds.
+        """
+        return (
+            f'total;dur={total * 1000:.1f}, '
+            f'db;dur={self.sql * 1000:.1f};desc="{self.queries} queries", '
+            f'template;dur={self.template * 1000:.1f}, '
+            f'storage;dur={self.storage * 1000:.1f}'
+        )
+
+
+def start_request():
+    """
+    Starts timing a request in the current context.
+
+    Returns:
+        tuple: The RequestTimings and the token to pass to `end_request`.
+    """
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    """
+    Stops timing the request started with `token`.
+    """
+    _current.reset(token)
+
+
+@contextmanager
+def timed(kind):
+    """
+    Adds the time the block takes to the `kind` ("template" or "storage")
+    of the current request, if any.
+    """
+    timings = _current.get()
+    if timings is None or kind in timings.active:
+        yield
+        return
+    timings.active.add(kind)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(
+            timings, kind,
+            getattr(timings, kind) + time.perf_counter() - start
+        )
+        timings.active.discard(kind)
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Execute wrapper counting the queries of the current request and their
+    time.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.sql += time.perf_counter() - start
+        timings.queries += 1
+
+
+def add_query_timing(connection, **kwargs):
+    """
+    Adds `time_query` to a database connection. It goes first, so the
+    wrappers of `connection.execute_wrapper` blocks still come off last.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+def install():
+    """
+    Times the queries of every connection, those open already and those
+    opened later. Safe to call more than once.
+    """
+    connection_created.connect(add_query_timing)
+    for connection in connections.all(initialized_only=True):
+        add_query_timing(connection)
+
+
+class Template(django_backend.Template):
+    """
+    A template timing its rendering, see DjangoTemplates.
+    """
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    Django's template backend, timing the templates it renders for the
+    current request. Templates included by a template, or rendered by tags
+    while it renders, count as part of it.
+    """
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+class TimedStorageMixin:
+    """
+    Mixin for storages, timing the calls made for the current request.
+    """
+    def _open(self, name, mode='rb'):
+        with timed('storage'):
+            return super()._open(name, mode)
+
+    def _save(self, name, content):
+        with timed('storage'):
+            return super()._save(name, content)
+
+    def delete(self, name):
+        with timed('storage'):
+            return super().delete(name)
+
+    def exists(self, name):
+        with timed('storage'):
+            return super().exists(name)
+
+    def size(self, name):
+        with timed('storage'):
+            return super().size(name)
+
+    def url(self, name):
+        with timed('storage'):
+            return super().url(name)
+
+
+class Histogram:
+    """
+    A histogram of observed values per view, in the Prometheus format.
+
+    Arguments:
+        name (str): The metric name.
+        documentation (str): The HELP text.
+        buckets (tuple): The ascending upper bounds of the buckets.
+    """
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # Per view: the count of each bucket and +Inf, then the sum
+        self._values = {}
+
+    def observe(self, view, value):
+        """
+        Records a value for a view.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(view)
+            if values is None:
+                values = self._values[view] = [0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += value
+
+    def export(self):
+        """
+        Returns the histogram in the Prometheus text format.
+        """
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            views = {view: list(values) for view, values in
+                     self._values.items()}
+        for view, values in sorted(views.items()):
+            label = f'view="{escape_label(view)}"'
+            count = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), values):
+                count += bucket
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="{bound}"}} {count}'
+                )
+            lines.append(f'{self.name}_sum{{{label}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return '\n'.join(lines)
+
+    def clear(self):
+        """
+        Forgets every observed value.
+        """
+        with self._lock:
+            self._values.clear()
+
+
+HISTOGRAMS = {
+    'total': Histogram(
+        'flashcards_request_duration_seconds',
+        'Time spent serving a request.',
+        SECONDS_BUCKETS
+    ),
+    'queries': Histogram(
+        'flashcards_request_queries',
+        'SQL queries run by a request.',
+        QUERY_BUCKETS
+    ),
+    'sql': Histogram(
+        'flashcards_request_query_seconds',
+        'Time spent in SQL queries by a request.',
+        SECONDS_BUCKETS
+    ),
+    'template': Histogram(
+        'flashcards_request_template_seconds',
+        'Time spent rendering templates by a request.',
+        SECONDS_BUCKETS
+    ),
+    'storage': Histogram(
+        'flashcards_request_storage_seconds',
+        'Time spent in media storage calls by a request.',
+        SECONDS_BUCKETS
+    ),
+}
+
+# The pool counters exported, with their Prometheus type and HELP text
+POOL_METRICS = {
+    'size': ('gauge', 'Open connections.'),
+    'idle': ('gauge', 'Idle connections.'),
+    'in_use': ('gauge', 'Connections in use.'),
+    'max_size': ('gauge', 'Maximum number of connections.'),
+    'hits': ('counter', 'Connections reused from the pool.'),
+    'misses': ('counter', 'Connections opened.'),
+    'waits': ('counter', 'Waits for a connection.'),
+    'wait_seconds': ('counter', 'Time spent waiting for a connection.'),
+    'timeouts': ('counter', 'Waits that timed out.'),
+    'failed_checks': ('counter', 'Connections failing a health check.'),
+    'discarded': ('counter', 'Connections closed instead of reused.'),
+}
+
+
+def escape_label(value):
+    """
+    Escapes a label value for the Prometheus text format.
+    """
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+def observe(view, timings, total):
+    """
+    Records the timings of a request to a view.
+
+    Arguments:
+        view (str): The view name, e.g. "quiz_view".
+        timings (RequestTimings): The timings of the request.
+        total (float): The duration of the request in seconds.
+    """
+    HISTOGRAMS['total'].observe(view, total)
+    HISTOGRAMS['queries'].observe(view, timings.queries)
+    HISTOGRAMS['sql'].observe(view, timings.sql)
+    HISTOGRAMS['template'].observe(view, timings.template)
+    HISTOGRAMS['storage'].observe(view, timings.storage)
+
+
+def export():
+    """
+    Returns the histograms and the connection pool counters of the process
+    in the Prometheus text format.
+    """
+    sections = [histogram.export() for histogram in HISTOGRAMS.values()]
+    stats = pool_stats()
+    for key, (kind, documentation) in POOL_METRICS.items():
+        name = f'flashcards_db_pool_{key}'
+        if kind == 'counter':
+            name += '_total'
+        lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+        for alias, counters in sorted(stats.items()):
+            lines.append(
+                f'{name}{{alias="{escape_label(alias)}"}} {counters[key]}'
+            )
+        sections.append('\n'.join(lines))
+    return '\n'.join(sections) + '\n'
+
+
+@never_cache
+def metrics(request):
+    """
+    Serves the metrics of the process to staff users, or to scrapers
+    sending "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (
+        token and constant_time_compare(authorization, f'Bearer {token}')
+    ) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        export(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
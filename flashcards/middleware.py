@@ -0,0 +1,97 @@
+"""
+Middleware shared by the WSGI and ASGI deployments.
+"""
+import time
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from whitenoise import middleware
+from . import metrics
+
+
+class MetricsMiddleware:
+    """
+    Times every request, see flashcards/metrics.py: adds a Server-Timing
+    header with the total, SQL, template and media storage time, and
+    records them in the histograms served at /metrics, per view name.
+
+    Meant to come first in MIDDLEWARE, so the time of the other middleware
+    counts as well.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        metrics.install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.record(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.record(request, response, timings)
+
+    def record(self, request, response, timings):
+        """
+        Records the timings of a request and adds them to its response.
+        """
+        total = time.perf_counter() - timings.start
+        # Unresolved URLs share a label, so paths do not become labels
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.observe(view, timings, total)
+        response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+
+class WhiteNoiseMiddleware(middleware.WhiteNoiseMiddleware):
+    """
+    WhiteNoise's middleware, also usable in an async middleware chain.
+
+    Django runs a sync-only middleware and everything inside it in a
+    thread, which would turn the async views back into sync ones under
+    ASGI. Static files are served from a thread instead, other requests go
+    straight to the next handler.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    def static_file(self, request):
+        """
+        Returns the static file a request asks for, or None.
+        """
+        if self.autorefresh:
+            return self.find_file(request.path_info)
+        return self.files.get(request.path_info)
+
+    async def __acall__(self, request):
+        static_file = self.static_file(request)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(
+                static_file, request
+            )
+        return await self.get_response(request)
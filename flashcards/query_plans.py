@@ -0,0 +1,211 @@
+"""
+Query plan inspection for the index advisor.
+
+Captured queries are explained on the database they ran on, and the plan
+steps reading a whole table or sorting rows are reported together with an
+index that would avoid them. Supported on SQLite and PostgreSQL.
+"""
+import json
+import re
+from collections import namedtuple
+from django.apps import apps
+from django.db import connections
+
+# Statements that can be explained
+EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+# "table"."column" references in Django's SQL
+COLUMN = r'"(?P<table>\w+)"\."(?P<column>\w+)"'
+EQUALITY = re.compile(COLUMN + r'\s*(?:=\s*(?:%s|\d|\')|IN\s*\()')
+RANGE = re.compile(COLUMN + r'\s*(?:[<>]=?)\s*(?:%s|\d|\')')
+JOIN = re.compile(COLUMN + r'\s*=\s*"\w+"\."\w+"')
+ORDER_BY = re.compile(r'\bORDER BY\b(?P<clause>.*?)(?:\bLIMIT\b|$)', re.S)
+# SQLite plan details, e.g. "SCAN cards_card" or "SEARCH ... USING INDEX"
+SQLITE_SCAN = re.compile(r'^SCAN (?P<table>\w+)(?: AS \w+)?$')
+SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY')
+
+# A plan step worth an index: kind is "scan" or "sort"
+Finding = namedtuple('Finding', ['kind', 'table', 'detail'])
+# An index that would avoid a finding
+Suggestion = namedtuple('Suggestion', ['table', 'columns'])
+
+
+def plan_findings(sql, params, using='default'):
+    """
+    Explains a query and lists the steps of its plan reading whole tables
+    or sorting rows.
+
+    On PostgreSQL sequential scans are disabled while explaining, so small
+    tables are not scanned merely because they are small, and a scan left
+    in the plan means no index can be used.
+
+    Arguments:
+        sql (str): The query, with placeholders.
+        params (list): The query parameters.
+        using (str): The database alias.
+
+    Returns:
+        list: Finding tuples, empty if the query cannot be explained.
+    """
+    if not EXPLAINABLE.match(sql):
+        return []
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return sqlite_findings(row[-1] for row in cursor.fetchall())
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            try:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+            finally:
+                cursor.execute('SET LOCAL enable_seqscan = on')
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return postgresql_findings(plan[0]['Plan'])
+    return []
+
+
+def sqlite_findings(details):
+    """
+    Lists the full scans and sorts of a SQLite query plan.
+
+    Arguments:
+        details (iterable): The detail column of EXPLAIN QUERY PLAN rows.
+    """
+    findings = []
+    table = None
+    for detail in details:
+        match = SQLITE_SCAN.match(detail)
+        if match:
+            table = match.group('table')
+            findings.append(Finding('scan', table, detail))
+        elif detail.startswith(('SEARCH ', 'SCAN ')):
+            table = detail.split()[1]
+        elif SQLITE_SORT.search(detail):
+            findings.append(Finding('sort', table, detail))
+    return findings
+
+
+def postgresql_findings(node, findings=None):
+    """
+    Lists the sequential scans and sorts of a PostgreSQL plan tree.
+
+    Arguments:
+        node (dict): A node of an EXPLAIN (FORMAT JSON) plan.
+    """
+    if findings is None:
+        findings = []
+    if node['Node Type'] == 'Seq Scan':
+        findings.append(Finding(
+            'scan',
+            node['Relation Name'],
+            node.get('Filter', 'Seq Scan')
+        ))
+    elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+        keys = ', '.join(node.get('Sort Key', []))
+        table = None
+        match = re.match(r'(\w+)\.', keys)
+        if match:
+            table = match.group(1)
+        findings.append(Finding('sort', table, 'Sort ' + keys))
+    for child in node.get('Plans', []):
+        postgresql_findings(child, findings)
+    return findings
+
+
+def suggest_index(sql, finding):
+    """
+    Proposes the columns of an index avoiding a finding, read from the
+    conditions and ordering of the query: columns compared for equality
+    first, then the ordering columns, then a column compared as a range.
+
+    Arguments:
+        sql (str): The query.
+        finding (Finding): A finding of `plan_findings`.
+
+    Returns:
+        Suggestion: The index, or None if no column of the table is used.
+    """
+    table = finding.table
+    order_by = ORDER_BY.search(sql)
+    if finding.kind == 'sort' and order_by:
+        # Rows are sorted by the table of the first ordering column
+        match = re.search(COLUMN, order_by.group('clause'))
+        if match:
+            table = match.group('table')
+    if table is None:
+        return None
+    columns = []
+
+    def add(column):
+        if column not in columns and column != 'id':
+            columns.append(column)
+
+    for pattern in (EQUALITY, JOIN):
+        for match in pattern.finditer(sql):
+            if match.group('table') == table:
+                add(match.group('column'))
+    if order_by:
+        for match in re.finditer(COLUMN, order_by.group('clause')):
+            if match.group('table') == table:
+                add(match.group('column'))
+    if finding.kind == 'scan':
+        for match in RANGE.finditer(sql):
+            if match.group('table') == table:
+                add(match.group('column'))
+                break
+    if not columns:
+        return None
+    return Suggestion(table, tuple(columns))
+
+
+def existing_indexes(table, using='default'):
+    """
+    Returns the column lists of the indexes of a table, including primary
+    and unique keys.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return [
+        tuple(constraint['columns'])
+        for constraint in constraints.values()
+        if constraint['columns']
+        and (constraint['index'] or constraint['primary_key']
+             or constraint['unique'])
+    ]
+
+
+def is_covered(suggestion, indexes):
+    """
+    Returns True if an existing index starts with the suggested columns.
+    """
+    size = len(suggestion.columns)
+    return any(index[:size] == suggestion.columns for index in indexes)
+
+
+def model_index(suggestion):
+    """
+    Describes a suggestion as the Meta.indexes entry of its model.
+
+    Returns:
+        str: e.g. "cards.Card: models.Index(fields=['deck', 'created_at'])",
+            or the CREATE INDEX statement if no model owns the table.
+    """
+    for model in apps.get_models():
+        if model._meta.db_table != suggestion.table:
+            continue
+        fields = []
+        for column in suggestion.columns:
+            for field in model._meta.concrete_fields:
+                if field.column == column:
+                    fields.append(field.name)
+                    break
+            else:
+                fields.append(column)
+        return f'{model._meta.label}: models.Index(fields={fields!r})'
+    return 'CREATE INDEX ON {0} ({1})'.format(
+        suggestion.table,
+        ', '.join(suggestion.columns)
+    )
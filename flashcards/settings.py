@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'flashcards.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,14 +53,14 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'flashcards.middleware.WhiteNoiseMiddleware',
 ]
 
 ROOT_URLCONF = 'flashcards.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'flashcards.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -76,7 +77,13 @@ TEMPLATES = [
 WSGI_APPLICATION = 'flashcards.wsgi.application'
 
 # Database
-if 'test' in sys.argv:
+# Tests run on SQLite unless TEST_DATABASE_URL names another database,
+# e.g. PostgreSQL to cover its search index
+if 'test' in sys.argv and os.environ.get("TEST_DATABASE_URL"):
+    DATABASES = {
+        'default': dj_database_url.parse(os.environ.get("TEST_DATABASE_URL"))
+    }
+elif 'test' in sys.argv:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
@@ -88,6 +95,49 @@ else:
         'default':
             dj_database_url.parse(os.environ.get("DATABASE_URL"))
     }
+    # Connections kept open per process, 0 opens one per request instead,
+    # see flashcards/db/pool.py
+    DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 4))
+    if DATABASE_POOL_SIZE and DATABASES['default'].get('ENGINE') == \
+            'django.db.backends.postgresql':
+        DATABASES['default']['ENGINE'] = \
+            'flashcards.db.backends.postgresql_pool'
+        DATABASES['default']['POOL'] = {
+            'MAX_SIZE': DATABASE_POOL_SIZE,
+            'TIMEOUT': float(os.environ.get("DATABASE_POOL_TIMEOUT", 10)),
+            'MAX_AGE': float(os.environ.get("DATABASE_POOL_MAX_AGE", 1800)),
+            'CHECK_INTERVAL': float(
+                os.environ.get("DATABASE_POOL_CHECK_INTERVAL", 30)
+            ),
+        }
+
+# Cache
+# Fragment cache versions must be shared by every process serving requests,
+# so deployments running more than one process need REDIS_URL. Tests run
+# without a cache unless they override CACHES.
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }
+    }
+elif os.environ.get("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Seconds a rendered listing fragment is kept
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+# Seconds a serialized quiz page is kept
+QUIZ_CACHE_TIMEOUT = 60 * 60 * 24
 
 CSRF_TRUSTED_ORIGINS = [
     "https://*.gitpod.io",
@@ -133,11 +183,18 @@ STATICFILES_STORAGE = (
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
-DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
+DEFAULT_FILE_STORAGE = "flashcards.storages.cloudinary.MediaStorage"
+
+# Card image conversion: "sync" converts uploads during the request,
+# "deferred" leaves it to the process_card_images command
+CARD_IMAGE_PROCESSING = os.environ.get("CARD_IMAGE_PROCESSING", "sync")
 
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 CRISPY_ALLOWED_TEMPLATE_PACKS = 'bootstrap5'
 
+# Bearer token of the scrapers of /metrics, staff users need none
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
 LOGIN_REDIRECT_URL = 'cards-home'
 LOGIN_URL = 'login'
 
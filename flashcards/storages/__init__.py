@@ -0,0 +1,5 @@
+"""
+Media storages timing their calls for the request metrics, see
+flashcards/metrics.py. One module per storage, so a storage's own
+settings are only needed where it is used.
+"""
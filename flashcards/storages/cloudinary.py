@@ -0,0 +1,9 @@
+"""
+The Cloudinary media storage of the deployments, timing its calls.
+"""
+from cloudinary_storage import storage
+from flashcards.metrics import TimedStorageMixin
+
+
+class MediaStorage(TimedStorageMixin, storage.MediaCloudinaryStorage):
+    pass
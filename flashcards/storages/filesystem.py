@@ -0,0 +1,10 @@
+"""
+The local file system storage, timing its calls. Meant for development
+and tests.
+"""
+from django.core.files import storage
+from flashcards.metrics import TimedStorageMixin
+
+
+class FileSystemStorage(TimedStorageMixin, storage.FileSystemStorage):
+    pass
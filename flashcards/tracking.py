@@ -0,0 +1,96 @@
+"""
+Change tracking for model fields.
+
+Models listing fields in `tracked_fields` remember the values those fields
+had when the instance was loaded from the database, so save methods can
+skip work for fields that did not change.
+"""
+from django.db.models import FileField
+
+
+class FieldTrackerMixin:
+    """
+    Mixin for models that need to know which fields changed since load.
+
+    Attributes:
+        tracked_fields (tuple): The names of the fields to track.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Creates the instance and remembers the loaded values of the
+        tracked fields.
+        """
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        instance._loaded_values = {
+            name: loaded[instance._meta.get_field(name).attname]
+            for name in cls.tracked_fields
+            if instance._meta.get_field(name).attname in loaded
+        }
+        return instance
+
+    def tracked_value(self, name):
+        """
+        Returns the current value of a tracked field, in the form it is
+        stored in the database.
+
+        Arguments:
+            name (str): The name of the field.
+        """
+        field = self._meta.get_field(name)
+        value = getattr(self, field.attname)
+        if isinstance(field, FileField):
+            return (value.name or None) if value is not None else None
+        return value
+
+    def loaded_value(self, name):
+        """
+        Returns the value a tracked field had when the instance was loaded,
+        or None if it was not loaded.
+
+        Arguments:
+            name (str): The name of the field.
+        """
+        return getattr(self, '_loaded_values', {}).get(name)
+
+    def has_changed(self, name):
+        """
+        Returns True if a tracked field changed since the instance was
+        loaded. Every field of an instance that was never saved, and every
+        field that was not loaded, counts as changed.
+
+        Arguments:
+            name (str): The name of the field.
+        """
+        loaded_values = getattr(self, '_loaded_values', {})
+        if self._state.adding or name not in loaded_values:
+            return True
+        field = self._meta.get_field(name)
+        if isinstance(field, FileField):
+            value = getattr(self, field.attname)
+            # A new upload may keep the name of the file it replaces
+            if value and not value._committed:
+                return True
+            return (loaded_values[name] or None) != self.tracked_value(name)
+        return loaded_values[name] != self.tracked_value(name)
+
+    @property
+    def changed_fields(self):
+        """
+        The names of the tracked fields that changed since load.
+        """
+        return [
+            name for name in self.tracked_fields if self.has_changed(name)
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the instance and starts tracking from the saved values.
+        """
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            name: self.tracked_value(name) for name in self.tracked_fields
+        }
@@ -20,6 +20,7 @@ from django.urls import path, include
 from django.conf import settings
 from users import views as user_views
 from cards import views as cards_views
+from . import metrics
 
 urlpatterns = [
     path('', include('cards.urls')),
@@ -31,6 +32,7 @@ urlpatterns = [
         name='logout'
     ),
     path('profile/', user_views.profile, name='profile'),
+    path('metrics', metrics.metrics, name='metrics'),
 ]
 
 # Custom error handlers
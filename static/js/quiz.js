@@ -1,6 +1,7 @@
 document.addEventListener('DOMContentLoaded', function() {
-    // Load the Card data
+    // Load the first page of Card data, the rest is streamed in the background
     const cardsData = JSON.parse(document.getElementById('cards-data').textContent);
+    let nextPageUrl = JSON.parse(document.getElementById('cards-next').textContent);
 
     // Shuffle the order of the questions
     function shuffle(array) {
@@ -13,6 +14,28 @@ document.addEventListener('DOMContentLoaded', function() {
       }
      shuffle(cardsData);
 
+    /**
+     * Fetch the remaining pages of the deck one after another.
+     * Each new card is inserted at a random position among the cards that
+     * have not been shown yet, so the whole deck stays shuffled.
+     */
+    async function loadRemainingPages() {
+        while (nextPageUrl) {
+            const response = await fetch(nextPageUrl, {credentials: 'same-origin'});
+            if (!response.ok) {
+                return;
+            }
+            const page = await response.json();
+            page.cards.forEach(function(card) {
+                const start = currentCardIndex + 1;
+                const position = start + Math.floor(Math.random() * (cardsData.length - start + 1));
+                cardsData.splice(position, 0, card);
+            });
+            nextPageUrl = page.next;
+            updateButtonStates();
+        }
+    }
+
     let currentCardIndex = 0;
 
     // Navigation button states
@@ -66,8 +89,43 @@ document.addEventListener('DOMContentLoaded', function() {
     // Flip the card
     document.getElementById('quiz-card').addEventListener('click', function() {
         document.getElementById('quiz-card').classList.toggle('flip');
+        updateReviewButtons();
     });
 
+    // Review grading, only present when studying due cards
+    const reviewButtons = document.getElementById('review-buttons');
+
+    function updateReviewButtons() {
+        if (!reviewButtons) {
+            return;
+        }
+        const flipped = document.getElementById('quiz-card').classList.contains('flip');
+        if (flipped && cardsData[currentCardIndex].review_url) {
+            reviewButtons.classList.remove('visually-hidden');
+        } else {
+            reviewButtons.classList.add('visually-hidden');
+        }
+    }
+
+    if (reviewButtons) {
+        const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+        reviewButtons.querySelectorAll('.review-btn').forEach(function(button) {
+            button.addEventListener('click', async function() {
+                const card = cardsData[currentCardIndex];
+                const body = new FormData();
+                body.append('quality', button.dataset.quality);
+                await fetch(card.review_url, {
+                    method: 'POST',
+                    headers: {'X-CSRFToken': csrfToken},
+                    body: body
+                });
+                card.review_url = '';
+                updateReviewButtons();
+                document.getElementById('next-question-btn').click();
+            });
+        });
+    }
+
     // Show the question
     function displayQuestion() {
         const card = cardsData[currentCardIndex];
@@ -75,6 +133,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const answerImage = document.getElementById('answer-image');
         // Display the question image, if there is one
         if (card.question_image) {
+            questionImage.srcset = card.question_srcset || '';
             questionImage.src = card.question_image;
             document.getElementById("question-image-area").classList.remove("visually-hidden");
             document.getElementById("question-text-area").classList.remove("card-row-full");
@@ -93,7 +152,8 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         // Display the answer image, if there is one
         if (card.answer_image) {
-            answerImage.src = card.answerimage;
+            answerImage.srcset = card.answer_srcset || '';
+            answerImage.src = card.answer_image;
             document.getElementById("answer-image-area").classList.remove("visually-hidden");
             document.getElementById("answer-text-area").classList.remove("card-row-full");
         } else {
@@ -110,6 +170,7 @@ document.addEventListener('DOMContentLoaded', function() {
             document.getElementById("answer-image-area").classList.add("card-row-full");
         }
         updateButtonStates();
+        updateReviewButtons();
     }
   
     /**
@@ -166,4 +227,5 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     displayQuestion();
+    loadRemainingPages();
 });
\ No newline at end of file
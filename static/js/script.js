@@ -10,6 +10,25 @@ document.addEventListener('DOMContentLoaded', function() {
       });
   });
 
+  // Check or uncheck every checkbox of a batch selection at once
+  document.querySelectorAll('[data-select-all]').forEach(selectAll => {
+      const name = selectAll.getAttribute('data-select-all');
+      selectAll.addEventListener('change', function() {
+          document.querySelectorAll(`input[type="checkbox"][name="${name}"]`).forEach(checkbox => {
+              checkbox.checked = this.checked;
+          });
+      });
+  });
+
+  // Load the parts of a page that are rendered separately
+  document.querySelectorAll('[data-fragment-url]').forEach(container => {
+      fetch(container.getAttribute('data-fragment-url'))
+          .then(response => response.ok ? response.text() : '')
+          .then(html => {
+              container.innerHTML = html;
+          });
+  });
+
   // Dark mode
   // Credit: 404GamerNotFound
   const htmlElement = document.documentElement;
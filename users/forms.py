@@ -52,10 +52,18 @@ class UserRegisterForm(UserCreationForm):
 class LoginForm(forms.Form):
     """
     A form for logging in users. It requires an email and password.
+
+    The user authenticated while cleaning the form is kept, so the
+    password is only hashed once per login. Use `get_user` to retrieve it.
     """
     email = forms.EmailField(required=True)
     password = forms.CharField(widget=forms.PasswordInput, required=True)
 
+    def __init__(self, *args, request=None, **kwargs):
+        self.request = request
+        self.user_cache = None
+        super().__init__(*args, **kwargs)
+
     def clean(self):
         cleaned_data = super().clean()
         email = cleaned_data.get("email")
@@ -63,11 +71,21 @@ class LoginForm(forms.Form):
 
         if email and password:
             # Use the email as the username for authentication
-            user = authenticate(username=email, password=password)
-            if user is None:
+            self.user_cache = authenticate(
+                self.request,
+                username=email,
+                password=password
+            )
+            if self.user_cache is None:
                 raise forms.ValidationError("Invalid email or password")
         return cleaned_data
 
+    def get_user(self):
+        """
+        Return the user authenticated by the form, if it is valid.
+        """
+        return self.user_cache
+
 
 class UserUpdateForm(forms.ModelForm):
     """
@@ -0,0 +1,77 @@
+import time
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import base_user
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from flashcards.benchmark import format_summary, rolled_back, summarize
+
+
+class Command(BaseCommand):
+    """
+    Measures logins per second in a single process, which runs on a single
+    core, using the configured password hashers.
+
+    Each login posts the login form through the full middleware stack.
+    Everything runs in a transaction that is rolled back.
+    """
+    help = 'Benchmarks the login view with the configured password hashers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of logins to time.'
+        )
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        hasher = get_hasher()
+        self.stdout.write(
+            f'Hasher: {hasher.algorithm} '
+            f'({getattr(hasher, "iterations", "n/a")} iterations)'
+        )
+        hash_calls = 0
+        original_check_password = base_user.check_password
+
+        def counting_check_password(*args, **kwargs):
+            nonlocal hash_calls
+            hash_calls += 1
+            return original_check_password(*args, **kwargs)
+
+        samples = []
+        with rolled_back():
+            User.objects.create_user(
+                username='bench-login@example.com',
+                password='bench-password-123'
+            )
+            url = reverse('login')
+            host = settings.ALLOWED_HOSTS[0].lstrip('.')
+            with mock.patch.object(
+                base_user,
+                'check_password',
+                counting_check_password
+            ):
+                for _ in range(repeat):
+                    client = Client(SERVER_NAME=host)
+                    start = time.perf_counter()
+                    response = client.post(url, {
+                        'email': 'bench-login@example.com',
+                        'password': 'bench-password-123',
+                    })
+                    samples.append(time.perf_counter() - start)
+                    if response.status_code != 302:
+                        self.stderr.write('Login failed.')
+                        return
+
+        self.stdout.write(format_summary('login', summarize(samples)))
+        self.stdout.write(
+            f'Logins per second per core: {repeat / sum(samples):.1f}'
+        )
+        self.stdout.write(
+            f'Password hashes per login: {hash_calls / repeat:.2f}'
+        )
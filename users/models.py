@@ -4,18 +4,29 @@ from django.core.files.base import ContentFile
 from PIL import Image
 from io import BytesIO
 import os
+from flashcards.tracking import FieldTrackerMixin
 
 
-class Profile(models.Model):
+class Profile(FieldTrackerMixin, models.Model):
     """
     Extends the default Django User model to include a profile image.
 
     Attributes:
         user (User): The user associated with this profile.
         image (ImageField): The profile image for the user.
+        image_width (int): The width of the processed image in pixels.
+        image_height (int): The height of the processed image in pixels.
+        image_format (str): The format of the processed image.
     """
+    MAX_SIZE = (300, 300)
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     image = models.ImageField(default='default.jpg', upload_to='profile_pics')
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_format = models.CharField(max_length=10, blank=True)
+
+    tracked_fields = ('image',)
 
     def __str__(self):
         """
@@ -25,28 +36,40 @@ class Profile(models.Model):
 
     def save(self, *args, **kwargs):
         """
-        Override the save method to resize the uploaded profile image to a
-        maximum dimension of 300x300px before saving it and converting it to
-        webp format.
-        """
-        img = Image.open(self.image)
+        Override the save method to process a newly uploaded profile image
+        before saving it.
 
-        # Resize the image if it's bigger than 300px
-        if img.height > 300 or img.width > 300:
-            output_size = (300, 300)
-            img.thumbnail(output_size)
+        Saves that do not upload a new image, such as the ones following a
+        login or a change of name, never open the image.
+        """
+        if self.has_changed('image') and self.image \
+                and not self.image._committed:
+            self.process_image()
+        super().save(*args, **kwargs)
 
-            in_mem_file = BytesIO()
-            img.save(in_mem_file, format='webp')
-            in_mem_file.seek(0)
+    def process_image(self):
+        """
+        Resize the uploaded profile image to a maximum dimension of
+        300x300px, converting it to webp format, and record its dimensions
+        and format.
+        """
+        with Image.open(self.image) as img:
+            self.image_format = img.format or ''
+            # Resize the image if it's bigger than 300px
+            if img.height > 300 or img.width > 300:
+                img.thumbnail(self.MAX_SIZE)
 
-            filename = os.path.basename(self.image.name)
-            self.image.save(
-                filename,
-                ContentFile(in_mem_file.read()),
-                save=False
-            )
+                in_mem_file = BytesIO()
+                img.save(in_mem_file, format='webp')
+                in_mem_file.seek(0)
 
-            in_mem_file.close()
+                filename = os.path.basename(self.image.name)
+                self.image.save(
+                    filename,
+                    ContentFile(in_mem_file.read()),
+                    save=False
+                )
 
-        super().save(*args, **kwargs)
+                in_mem_file.close()
+                self.image_format = 'WEBP'
+            self.image_width, self.image_height = img.size
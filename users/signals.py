@@ -14,8 +14,15 @@ def create_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
+def save_profile(sender, instance, created, **kwargs):
     """
     Signal to automatically save the associated Profile when a User is saved.
+
+    The Profile is only saved if it was loaded along with the User and has
+    unsaved changes, so updates such as the last_login written on every
+    login neither query nor save it.
     """
-    instance.profile.save()
+    if created or not User.profile.related.is_cached(instance):
+        return
+    if instance.profile.changed_fields:
+        instance.profile.save()
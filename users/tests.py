@@ -1,10 +1,13 @@
 import os
+from unittest import mock
 from django.test import TestCase
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.contrib.auth.hashers import check_password
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from PIL import Image
+from flashcards.benchmark import count_storage_calls
 from .models import Profile
 from .forms import (
     UserRegisterForm,
@@ -73,6 +76,16 @@ class ModelsTest(TestCase):
         string = f'{self.user.username} Profile'
         self.assertEqual(str(self.profile), string)
 
+    def test_profile_save_without_image_change(self):
+        """
+        Tests that saving a profile whose image did not change does not
+        open the image.
+        """
+        profile = Profile.objects.get(user=self.user)
+        with mock.patch('users.models.Image.open') as image_open:
+            profile.save()
+        image_open.assert_not_called()
+
     def test_update_profile(self):
         """
         Tests the funcionality of updating user profile.
@@ -101,6 +114,12 @@ class ModelsTest(TestCase):
 
         self.assertEqual(self.user.email, 'updated@example.com')
 
+        self.assertEqual(profile.image_format, 'WEBP')
+        self.assertEqual(
+            (profile.image_width, profile.image_height),
+            (300, 300)
+        )
+
         # Verify that the profile image was converted and resized
         with Image.open(profile.image) as profile_img:
             self.assertEqual(
@@ -262,6 +281,21 @@ class AuthenticationTest(TestCase):
         self.assertRedirects(response, reverse('cards-home'))
         self.assertTrue('_auth_user_id' in self.client.session)
 
+    def test_login_hashes_password_once(self):
+        """
+        Tests that a login checks the password exactly once.
+        """
+        with mock.patch(
+            'django.contrib.auth.base_user.check_password',
+            wraps=check_password
+        ) as checks:
+            self.client.post(
+                reverse('login'),
+                {'email': 'test@example.com', 'password': 'testpass123'}
+            )
+        self.assertEqual(checks.call_count, 1)
+        self.assertTrue('_auth_user_id' in self.client.session)
+
     def test_login_failure(self):
         """
         Tests so the user cannot log in with the wrong credentials.
@@ -273,6 +307,24 @@ class AuthenticationTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue('_auth_user_id' not in self.client.session)
 
+    def test_login_does_not_read_avatar(self):
+        """
+        Tests that logging in and changing the user's name make no storage
+        reads and do not save the profile.
+        """
+        with count_storage_calls() as calls, \
+                mock.patch.object(Profile, 'save') as profile_save:
+            response = self.client.post(
+                reverse('login'),
+                {'email': 'test@example.com', 'password': 'testpass123'}
+            )
+            self.assertRedirects(response, reverse('cards-home'))
+            user = User.objects.get(pk=self.user.pk)
+            user.first_name = 'Renamed'
+            user.save()
+        self.assertEqual(calls['open'], 0)
+        profile_save.assert_not_called()
+
     def test_logout(self):
         """
         Tests so the user can log out.
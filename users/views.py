@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import authenticate, login
+from django.contrib.auth import login
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from .forms import (
@@ -38,15 +38,12 @@ def user_login(request):
     Renders a login form and processes the form submission.
     """
     if request.method == 'POST':
-        form = LoginForm(request.POST)
+        form = LoginForm(request.POST, request=request)
         if form.is_valid():
-            email = form.cleaned_data['email']
-            password = form.cleaned_data['password']
-            user = authenticate(request, username=email, password=password)
-            if user is not None:
-                login(request, user)
-                messages.success(request, 'You are now logged in.')
-                return redirect('cards-home')
+            # The form already authenticated the user
+            login(request, form.get_user())
+            messages.success(request, 'You are now logged in.')
+            return redirect('cards-home')
     else:
         form = LoginForm()
 